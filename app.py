@@ -6,6 +6,42 @@ from util.config_schema import Config
 
 # --- 全域變數 ---
 CONFIG: Config | None = None
+CONFIG_DIR = "config"
+
+
+def config_file_path(config_name: str | None) -> str:
+    """設定檔路徑: 未指定名稱時為 config/config.toml，否則為 config/config.<名稱>.toml"""
+    if config_name is None:
+        file_name = "config.toml"
+    else:
+        file_name = f"config.{config_name}.toml"
+    return os.path.join(CONFIG_DIR, file_name)
+
+
+def load_config(config_name: str | None) -> Config | None:
+    """讀取並驗證設定檔，不存在時印出錯誤並回傳 None"""
+    config_path = config_file_path(config_name)
+    if not os.path.exists(config_path):
+        click.echo(f"錯誤：設定檔 '{config_path}' 不存在！")
+        return None
+    with open(config_path, "r", encoding="utf-8") as f:
+        return Config(**toml.load(f))
+
+
+def recount_all_users(engine) -> int:
+    """重新計算所有使用者的配額計數器，回傳使用者數量"""
+    from sqlalchemy import select
+    from sqlalchemy.orm import sessionmaker
+    from share.model.model import User
+    from util.quota import recount_user_quota
+
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as session:
+        user_ids = session.execute(select(User.id)).scalars().all()
+        for user_id in user_ids:
+            recount_user_quota(session, user_id)
+        session.commit()
+    return len(user_ids)
 
 
 @click.group()
@@ -19,21 +55,10 @@ def run(config_name):
     """根據設定檔來執行 flask server"""
     global CONFIG
 
-    if config_name is None:
-        file_name = "config.toml"
-    else:
-        file_name = f"config.{config_name}.toml"
-    config_path = os.path.join("config", file_name)
-
-    if not os.path.exists(config_path):
-        click.echo(f"錯誤：設定檔 '{config_path}' 不存在！")
+    CONFIG = load_config(config_name)
+    if CONFIG is None:
         return
 
-    with open(config_path, "r", encoding="utf-8") as f:
-        config_data = toml.load(f)
-
-    CONFIG = Config(**config_data)
-
     # --- 主要修改處 ---
     # 1. 建立 Application 的實例 (instance)
     application = Application(config=CONFIG)
@@ -48,15 +73,9 @@ def configupdate(config_name):
     檢查設定檔是否存在。
     不存在則建立；若存在，則根據 schema 補全缺少的欄位。
     """
-    config_dir = "config"
-    os.makedirs(config_dir, exist_ok=True)
-
-    if config_name is None:
-        file_name = "config.toml"
-    else:
-        file_name = f"config.{config_name}.toml"
+    os.makedirs(CONFIG_DIR, exist_ok=True)
 
-    config_path = os.path.join(config_dir, file_name)
+    config_path = config_file_path(config_name)
 
     if not os.path.exists(config_path):
         default_config = Config()
@@ -79,7 +98,72 @@ def configupdate(config_name):
         click.echo(f"'{config_path}' 已更新完成。")
 
 
+@cli.command()
+@click.argument("config_name", required=False)
+def recountquota(config_name):
+    """依現有的檔案與上傳會話重新計算所有使用者的配額計數器"""
+    from sqlalchemy import create_engine
+
+    config = load_config(config_name)
+    if config is None:
+        return
+
+    engine = create_engine(config.DATABASES["default"].SQLALCHEMY_DATABASE_URI)
+    users = recount_all_users(engine)
+    click.echo(f"已重新計算 {users} 位使用者的配額計數器。")
+
+
+@cli.command()
+@click.argument("config_name", required=False)
+@click.option("--dry-run", is_flag=True, help="只列出需要執行的 DDL")
+def upgradedb(config_name, dry_run):
+    """
+    補上主資料庫缺少的資料表、欄位與索引 (可重複執行)，
+    接著重新計算所有使用者的配額計數器 (新增的計數器欄位初始為 0)。
+    升級後、啟動服務前執行。
+    """
+    from sqlalchemy import create_engine
+    from util.schema_upgrade import upgrade_schema
+
+    config = load_config(config_name)
+    if config is None:
+        return
+
+    engine = create_engine(config.DATABASES["default"].SQLALCHEMY_DATABASE_URI)
+    statements = upgrade_schema(engine, dry_run=dry_run)
+    for statement in statements:
+        click.echo(statement)
+    if dry_run:
+        click.echo(f"共 {len(statements)} 項變更 (未執行)。")
+        return
+
+    users = recount_all_users(engine)
+    click.echo(f"已執行 {len(statements)} 項結構變更，並重新計算 {users} 位使用者的配額計數器。")
+
+
+@cli.command()
+@click.argument("config_name", required=False)
+@click.option("--batch-size", default=500, show_default=True, help="每個交易處理的檔案數")
+@click.option("--limit", default=0, show_default=True, help="最多遷移的檔案數 (0 為全部)")
+def migratelayout(config_name, batch_size, limit):
+    """將 flat 目錄結構的既有檔案遷移到 sharded 結構 (可在服務運作中執行)"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from util.volumes import volume_manager
+
+    config = load_config(config_name)
+    if config is None:
+        return
 
+    volume_manager.configure(config.FILE)
+    engine = create_engine(config.DATABASES["default"].SQLALCHEMY_DATABASE_URI)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as session:
+        result = volume_manager.migrate_layout(session, batch_size=batch_size, limit=limit)
+    click.echo(
+        f"已遷移 {result['migrated']} 個檔案，略過 {result['skipped']} 個"
+        f" (共檢查 {result['scanned']} 筆紀錄)。"
+    )
 
 
 if __name__ == "__main__":
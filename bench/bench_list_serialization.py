@@ -0,0 +1,164 @@
+"""
+比較列表 API 的序列化路徑 (10k 筆資料)。
+
+舊路徑: Row -> FileInfo / UserInfoForAdmin -> 外層 Response 模型 -> model_dump() -> Flask JSON
+新路徑: Row._asdict() -> orjson (util.fast_json)
+檔案列表的資料與 ListFiles.run() 的回傳格式相同，兩條路徑輸出的內容一致 (執行時會先比對)。
+
+執行方式 (於專案根目錄):
+    python -m bench.bench_list_serialization [筆數]
+"""
+
+import json
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    select,
+    text,
+)
+
+from schema.request_userCtrl import (
+    FileInfo,
+    FileListResponse,
+    UserInfoForAdmin,
+    UserListResponse,
+)
+from util.fast_json import dumps
+
+
+def make_file_list(conn, n: int) -> dict:
+    """產生與 ListFiles.run() 回傳格式相同的檔案列表"""
+    now = datetime.now()
+    files = Table(
+        "files",
+        MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("filename", String),
+        Column("size_bytes", Integer),
+        Column("upload_time", DateTime),
+        Column("del_time", DateTime),
+        Column("is_permanent", Boolean),
+        Column("safe_filename", String),
+        Column("share_token", String),
+        Column("stored_size", Integer),
+        Column("compression", String),
+        Column("compression_cpu_ms", Integer),
+        Column("preview", String),
+    )
+    files.create(conn)
+    conn.execute(
+        files.insert(),
+        [
+            {
+                "id": i,
+                "filename": f"report_{i}.csv",
+                "size_bytes": i * 1024,
+                "upload_time": now,
+                "del_time": None if i % 3 == 0 else now + timedelta(days=7),
+                "is_permanent": i % 3 == 0,
+                "safe_filename": f"{i:032x}",
+                "share_token": None,
+                "stored_size": i * 256 if i % 2 else None,
+                "compression": "zstd" if i % 2 else None,
+                "compression_cpu_ms": 3 if i % 2 else None,
+                "preview": "thumbnail" if i % 4 == 0 else None,
+            }
+            for i in range(n)
+        ],
+    )
+
+    items = []
+    for row in conn.execute(select(files)):
+        item = row._asdict()
+        preview = item.pop("preview")
+        item["preview_url"] = (
+            f"http://example.com/api/files/preview/{item['id']}?v={item['safe_filename'][:16]}"
+            if preview
+            else None
+        )
+        items.append(item)
+    return {
+        "download_url_prefix": (
+            "http://example.com/api/files/download_with_token?token=" + "t" * 120 + "&filename="
+        ),
+        "files": items,
+        "stats": {"file_count": n, "permanent_file_count": (n + 2) // 3},
+        "limits": {"file_limit": "∞", "permanent_file_limit": 10},
+    }
+
+
+def make_user_rows(conn, n: int):
+    conn.execute(
+        text(
+            "CREATE TABLE users (account TEXT, name TEXT, role_name TEXT, file_limit TEXT,"
+            " permanent_file_limit TEXT, storage_bytes_limit TEXT, total_file INTEGER,"
+            " total_file_size INTEGER, p_total_file INTEGER, p_sub_file_size INTEGER)"
+        )
+    )
+    conn.execute(
+        text(
+            "INSERT INTO users VALUES (:account, :name, 'lv3User', '100', '∞',"
+            " '1073741824', :n, :n, 0, 0)"
+        ),
+        [{"account": f"user{i}", "name": f"User {i}", "n": i} for i in range(n)],
+    )
+    return conn.execute(text("SELECT * FROM users")).all()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    engine = create_engine("sqlite://")
+    app = Flask(__name__)
+
+    with engine.connect() as conn, app.app_context():
+        file_list = make_file_list(conn, n)
+        user_rows = make_user_rows(conn, n)
+
+        def files_pydantic():
+            files = [FileInfo(**item) for item in file_list["files"]]
+            body = FileListResponse(
+                download_url_prefix=file_list["download_url_prefix"],
+                files=files,
+                stats=file_list["stats"],
+                limits=file_list["limits"],
+            )
+            # exclude_unset: 不輸出列表 API 不提供的 download_url，與新路徑的內容一致
+            return app.json.dumps(body.model_dump(exclude_unset=True))
+
+        def files_fast():
+            return dumps(file_list)
+
+        def users_pydantic():
+            users = [UserInfoForAdmin(**row._asdict()) for row in user_rows]
+            return app.json.dumps(UserListResponse(users=users).model_dump())
+
+        def users_fast():
+            return dumps({"users": [row._asdict() for row in user_rows]})
+
+        assert json.loads(files_pydantic()) == json.loads(files_fast())
+        assert json.loads(users_pydantic()) == json.loads(users_fast())
+
+        print(f"rows = {n}")
+        for name, fn in [
+            ("files  pydantic+json", files_pydantic),
+            ("files  fast_json    ", files_fast),
+            ("users  pydantic+json", users_pydantic),
+            ("users  fast_json    ", users_fast),
+        ]:
+            best = min(timeit.repeat(fn, number=1, repeat=5))
+            print(f"{name}: {best * 1000:8.2f} ms  ({len(fn())} bytes)")
+
+
+if __name__ == "__main__":
+    main()
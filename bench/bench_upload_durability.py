@@ -0,0 +1,81 @@
+"""
+比較上傳的持久性模式 (DURABILITY.MODE) 對吞吐量的影響。
+
+以與 ChunkedUploadController 相同的路徑 (util.file_ops.write_chunk + finalize_file)
+模擬分塊上傳，對每種模式量測 MB/s，並列出當機時的資料安全程度。
+
+執行方式 (於專案根目錄):
+    python -m bench.bench_upload_durability [檔案大小MB] [分塊大小MB] [目錄]
+
+目錄預設為系統暫存目錄；若要反映實際情況，請指定與 FILE.path 相同的磁碟。
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from util import file_ops
+
+CRASH_SAFETY = {
+    file_ops.NONE: "當機可能遺失已回報完成的檔案或留下空洞",
+    file_ops.FINALIZE: "已回報完成的檔案必定完整；上傳中的資料可能全部遺失",
+    file_ops.EVERY_N_MB: "已回報完成的檔案必定完整；上傳中的資料最多遺失 N MB",
+}
+
+
+def simulate_upload(
+    directory: str, total: int, chunk: int, mode: str, every_mb: int
+) -> float:
+    temp_path = os.path.join(directory, "bench.tmp")
+    final_path = os.path.join(directory, "bench.final")
+    with open(temp_path, "wb"):
+        pass
+    data = os.urandom(chunk)
+
+    started = time.perf_counter()
+    offset = 0
+    while offset < total:
+        part = data[: min(chunk, total - offset)]
+        end = offset + len(part) - 1
+        file_ops.write_chunk(
+            temp_path,
+            offset,
+            part,
+            sync=file_ops.chunk_needs_sync(mode, offset, end, every_mb),
+        )
+        offset += len(part)
+    file_ops.finalize_file(temp_path, final_path, sync=mode != file_ops.NONE)
+    elapsed = time.perf_counter() - started
+
+    os.remove(final_path)
+    return elapsed
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    chunk_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    directory = sys.argv[3] if len(sys.argv) > 3 else tempfile.gettempdir()
+    total = size_mb * 1024 * 1024
+    chunk = chunk_mb * 1024 * 1024
+
+    print(f"檔案 {size_mb} MB，分塊 {chunk_mb} MB，目錄 {directory}")
+    print(f"{'mode':<22}{'seconds':>10}{'MB/s':>10}  crash safety")
+    cases = [
+        (file_ops.NONE, 0),
+        (file_ops.FINALIZE, 0),
+        (file_ops.EVERY_N_MB, 16),
+        (file_ops.EVERY_N_MB, 64),
+        (file_ops.EVERY_N_MB, 256),
+    ]
+    with tempfile.TemporaryDirectory(dir=directory) as work_dir:
+        for mode, every_mb in cases:
+            elapsed = simulate_upload(work_dir, total, chunk, mode, every_mb)
+            label = f"{mode} ({every_mb} MB)" if mode == file_ops.EVERY_N_MB else mode
+            print(
+                f"{label:<22}{elapsed:>10.3f}{size_mb / elapsed:>10.1f}  {CRASH_SAFETY[mode]}"
+            )
+
+
+if __name__ == "__main__":
+    main()
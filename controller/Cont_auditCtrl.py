@@ -0,0 +1,54 @@
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from share.model.log_model import AuditLog
+from schema.request_auditCtrl import AuditLogQuery
+
+
+class ListAuditLogs:
+    """查詢操作日誌的核心邏輯"""
+
+    def __init__(self, session: Session, query: AuditLogQuery):
+        self.session = session
+        self.query = query
+
+    def run(self):
+        conditions = []
+        if self.query.account:
+            conditions.append(AuditLog.account == self.query.account)
+        if self.query.action:
+            conditions.append(AuditLog.action == self.query.action)
+        if self.query.start_time:
+            conditions.append(AuditLog.createTime >= self.query.start_time)
+        if self.query.end_time:
+            conditions.append(AuditLog.createTime < self.query.end_time)
+
+        total = self.session.execute(
+            select(func.count(AuditLog.id)).where(*conditions)
+        ).scalar_one()
+
+        # 依 (account/action, createTime) 複合索引排序，避免全表排序
+        q = (
+            select(
+                AuditLog.id.label("id"),
+                AuditLog.createTime.label("time"),
+                AuditLog.action.label("action"),
+                AuditLog.account.label("account"),
+                AuditLog.target.label("target"),
+                AuditLog.success.label("success"),
+                AuditLog.ip.label("ip"),
+                AuditLog.detail.label("detail"),
+            )
+            .where(*conditions)
+            .order_by(AuditLog.createTime.desc(), AuditLog.id.desc())
+            .offset((self.query.page - 1) * self.query.page_size)
+            .limit(self.query.page_size)
+        )
+        logs = self.session.execute(q).all()
+
+        return {
+            "logs": [row._asdict() for row in logs],
+            "page": self.query.page,
+            "page_size": self.query.page_size,
+            "total": total,
+        }
@@ -5,9 +5,24 @@ from sqlalchemy.orm import Session
 from flask import abort
 from werkzeug.datastructures import FileStorage
 
-from share.model.model import User, File, Role
+from share.model.model import User, File, Role, Task, UploadSession
 from util.global_variable import global_variable
-from sqlalchemy import label, select, func
+from util.audit import audit
+from util.download_token import download_url_prefix
+from util.signed_url import file_meta_cache
+from util.share_cache import new_share_token, share_cache
+from util.file_cache import hot_file_cache
+from util import quota
+from util import file_ops
+from util.storage_backend import InvalidPart, StorageBackend, UploadTarget, storage
+from util.trash import trash
+from util.task_queue import task_queue
+from util.post_upload import POST_UPLOAD
+from util.previews import previews
+from util import delta_sync
+from util.volumes import volume_manager
+from share.define.model_enum import AuditAction, TaskStatus, UploadStatus
+from sqlalchemy import label, select, func, update
 from flask_jwt_extended import get_jwt_identity, create_access_token, decode_token
 
 
@@ -17,11 +32,10 @@ class ChunkedUploadController:
     def __init__(self, session: Session, user_account: str):
         self.session = session
         self.user_account = user_account
-        self.CHUNK_SIZE = 1024 * 1024 * 5  # 5MB per chunk
-        self.UPLOAD_TEMP_DIR = os.path.join(
-            global_variable.config.APP.UPLOAD_TEMP_DIR, user_account
+        self.CHUNK_SIZE = 1024 * 1024 * 5  # 5MB per chunk (同時也是 S3 multipart 的最小 part 大小)
+        self.SESSION_TTL = timedelta(
+            minutes=global_variable.config.APP.UPLOAD_SESSION_TTL_MINUTES
         )
-        os.makedirs(self.UPLOAD_TEMP_DIR, exist_ok=True)
 
     def _get_user(self):
         user = (
@@ -33,29 +47,63 @@ class ChunkedUploadController:
             abort(404, "User not found.")
         return user
 
+    def _get_upload_session(self, upload_id: str, user: User) -> UploadSession:
+        upload = (
+            self.session.query(UploadSession)
+            .filter(
+                UploadSession.upload_id == upload_id,
+                UploadSession.owner_id == user.id,
+                UploadSession.status == UploadStatus.active.value,
+            )
+            .one_or_none()
+        )
+        if not upload:
+            abort(404, "Upload session not found or expired.")
+        return upload
+
+    @staticmethod
+    def _target(upload: UploadSession) -> tuple[StorageBackend, UploadTarget]:
+        """上傳會話所在的儲存後端 (依 temp_path 判斷，不受之後切換設定影響)"""
+        return (
+            storage.for_location(upload.temp_path),
+            UploadTarget(upload.temp_path, upload.backend_upload_id),
+        )
+
     def init_upload(self, filename: str, file_size: int, file_type: str):
         user = self._get_user()
-        # 檢查配額 (這裡簡化，實際應更詳細)
-        # ... (配額檢查邏輯，可以參考 UploadFile.save 中的邏輯)
+        if file_size < 0:
+            abort(400, "Invalid file size.")
+
+        # 以條件式 UPDATE 預留檔案數與位元組配額，超過配額時直接 403
+        quota.reserve_upload(self.session, user.id, file_size)
 
         upload_id = str(uuid.uuid4())
-        temp_file_path = os.path.join(self.UPLOAD_TEMP_DIR, upload_id + ".tmp")
-
-        # 建立一個臨時檔案來儲存上傳進度
-        with open(temp_file_path, "wb") as f:
-            pass  # 建立空檔案
-
-        # 在資料庫中記錄上傳會話 (需要新的 UploadSession Model)
-        # 這裡先用一個簡化的方式，實際應用中應有專門的資料庫表
-        # global_variable.upload_sessions[upload_id] = {
-        #     "user_id": user.id,
-        #     "filename": filename,
-        #     "file_size": file_size,
-        #     "file_type": file_type,
-        #     "temp_file_path": temp_file_path,
-        #     "received_bytes": 0,
-        #     "start_time": datetime.now()
-        # }
+        # 在儲存後端建立上傳 (本機為暫存檔，S3 為 multipart upload)
+        backend = storage.default
+        target = backend.begin_upload(self.user_account, upload_id, file_size)
+
+        # 預留與上傳會話在同一個交易中寫入
+        now = datetime.now()
+        self.session.add(
+            UploadSession(
+                upload_id=upload_id,
+                filename=filename,
+                file_size=file_size,
+                file_type=file_type,
+                temp_path=target.temp_location,
+                backend_upload_id=target.backend_upload_id,
+                received_bytes=0,
+                status=UploadStatus.active.value,
+                last_activity=now,
+                expires_at=now + self.SESSION_TTL,
+                owner_id=user.id,
+            )
+        )
+        try:
+            self.session.commit()
+        except Exception:
+            backend.abort_upload(target)
+            raise
 
         return {
             "upload_id": upload_id,
@@ -65,8 +113,7 @@ class ChunkedUploadController:
 
     def upload_chunk(self, upload_id: str, chunk_data: bytes, content_range: str):
         user = self._get_user()
-        # 驗證 upload_id 和使用者 (需要從資料庫或 global_variable 獲取上傳會話資訊)
-        # ...
+        upload = self._get_upload_session(upload_id, user)
 
         # 解析 Content-Range: bytes 0-1048575/15000000
         try:
@@ -78,63 +125,127 @@ class ChunkedUploadController:
         except (IndexError, ValueError):
             abort(400, "Invalid Content-Range header.")
 
-        temp_file_path = os.path.join(self.UPLOAD_TEMP_DIR, upload_id + ".tmp")
-        if not os.path.exists(temp_file_path):
+        # 不可超出 init 時宣告 (並預留配額) 的大小
+        if (
+            total_size != upload.file_size
+            or start_byte < 0
+            or end_byte < start_byte
+            or end_byte >= upload.file_size
+            or len(chunk_data) != end_byte - start_byte + 1
+        ):
+            abort(400, "Content-Range does not match the upload session.")
+
+        # 寫入檔案塊 (every_n_mb 模式下跨過 N MB 邊界時 fdatasync)
+        durability = global_variable.config.DURABILITY
+        backend, target = self._target(upload)
+        try:
+            backend.put_part(
+                target,
+                start_byte,
+                chunk_data,
+                part_size=self.CHUNK_SIZE,
+                total_size=upload.file_size,
+                sync=file_ops.chunk_needs_sync(
+                    durability.MODE, start_byte, end_byte, durability.SYNC_EVERY_MB
+                ),
+            )
+        except InvalidPart as e:
+            abort(400, str(e))
+        except FileNotFoundError:
             abort(404, "Upload session not found or expired.")
 
-        # 寫入檔案塊
-        with open(temp_file_path, "r+b") as f:
-            f.seek(start_byte)
-            f.write(chunk_data)
-
-        # 更新進度 (需要從資料庫或 global_variable 獲取上傳會話資訊)
-        # ...
+        # 更新進度並延長會話的有效期限
+        now = datetime.now()
+        upload.received_bytes = max(upload.received_bytes, end_byte + 1)
+        upload.last_activity = now
+        upload.expires_at = now + self.SESSION_TTL
+        self.session.commit()
 
         return {"status": "success", "received_bytes": end_byte + 1}
 
     def complete_upload(self, upload_id: str):
         user = self._get_user()
-        # 驗證 upload_id 和使用者 (需要從資料庫或 global_variable 獲取上傳會話資訊)
-        # ...
+        upload = self._get_upload_session(upload_id, user)
 
-        temp_file_path = os.path.join(self.UPLOAD_TEMP_DIR, upload_id + ".tmp")
-        if not os.path.exists(temp_file_path):
+        backend, target = self._target(upload)
+        file_size = backend.uploaded_size(target)
+        if file_size is None:
             abort(404, "Upload session not found or expired.")
+        if file_size != upload.file_size:
+            abort(
+                400,
+                f"Upload incomplete. Received {file_size} of {upload.file_size} bytes.",
+            )
 
-        # 執行最終的檔案儲存和資料庫記錄
-        # 這裡需要從上傳會話中獲取原始檔名、檔案大小等資訊
-        # ...
-
-        # 假設我們已經從某處獲取了原始檔名和檔案大小
-        original_filename = "uploaded_file_name"  # 從上傳會話中獲取
-        file_size = os.path.getsize(temp_file_path)  # 從上傳會話中獲取或重新計算
+        # 以條件式 UPDATE 將會話由 active 轉為 completed，重複的 complete 請求只有一個會成功
+        result = self.session.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == upload.id,
+                UploadSession.status == UploadStatus.active.value,
+            )
+            .values(status=UploadStatus.completed.value)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            abort(409, "Upload session already completed or expired.")
+        quota.commit_reservation(self.session, user.id, upload.file_size, file_size)
 
-        # 處理檔案儲存 (參考 UploadFile.save 中的邏輯)
+        # 處理檔案儲存
+        original_filename = upload.filename
         _, extension = os.path.splitext(original_filename)
         safe_filename = uuid.uuid4().hex
         safe_filename_extension = f"{safe_filename}{extension}"
-        final_save_path = os.path.join(user.storage_path, safe_filename_extension)
 
-        os.rename(temp_file_path, final_save_path)  # 移動臨時檔案到最終位置
+        # 完成後端的上傳 (本機: 移動暫存檔到選定磁碟區的使用者目錄；S3: 完成 multipart upload)
+        final_location = backend.complete_upload(
+            target,
+            self.user_account,
+            safe_filename_extension,
+            sync=global_variable.config.DURABILITY.MODE != file_ops.NONE,
+        )
+
+        role = quota.get_effective_role(self.session, user.id)
+        lifetime_days = role.file_lifetime_days if role and role.file_lifetime_days > 0 else 7
 
-        # 建立檔案的資料庫紀錄 (參考 UploadFile.save 中的邏輯)
+        # 建立檔案的資料庫紀錄
         new_file_record = File(
             filename=original_filename,
             safe_filename=safe_filename,
-            storage_path=final_save_path,
+            storage_path=final_location,
             file_size=file_size,
             owner_id=user.id,
-            expiry_time=datetime.now() + timedelta(days=7),  # 預設 7 天
+            expiry_time=datetime.now() + timedelta(days=lifetime_days),
             is_permanent=False,
         )
         self.session.add(new_file_record)
-        self.session.commit()
-        self.session.refresh(new_file_record)
+        try:
+            # 上傳後處理 (計算雜湊等) 交給背景任務，與檔案紀錄在同一個交易中寫入
+            self.session.flush()
+            file_id = new_file_record.id
+            task = task_queue.enqueue(
+                self.session, POST_UPLOAD, file_id=file_id, owner_id=user.id
+            )
+            self.session.flush()
+            task_id = task.id
+            self.session.commit()
+        except Exception:
+            # 交易失敗時復原後端的檔案，會話與預留維持原狀
+            backend.undo_complete(final_location, target)
+            raise
+        task_queue.notify()
+        audit(
+            AuditAction.file_upload,
+            account=self.user_account,
+            target=safe_filename,
+            detail=f"{original_filename} ({file_size} bytes)",
+        )
 
         return {
-            "id": new_file_record.id,
-            "filename": new_file_record.filename,
-            "size_bytes": new_file_record.file_size,
+            "id": file_id,
+            "filename": original_filename,
+            "size_bytes": file_size,
+            "task_id": task_id,
             "message": "File uploaded successfully",
         }
 
@@ -166,7 +277,7 @@ class UpdateFileStatus:
 
         file_to_update = (
             self.session.query(File)
-            .filter(File.safe_filename == self.safe_filename)
+            .filter(File.safe_filename == self.safe_filename, File.deleted_at.is_(None))
             .one_or_none()
         )
         if not file_to_update:
@@ -177,27 +288,14 @@ class UpdateFileStatus:
             abort(403, "You do not have permission to modify this file.")
 
         # 3. 根據請求的狀態執行操作
+        if self.is_permanent == file_to_update.is_permanent:
+            # 狀態沒有改變，不需要調整配額
+            return file_to_update
+
         if self.is_permanent:
             # --- 切換為永久 ---
-            # a. 檢查配額
-            perm_limits = [
-                r.permanent_file_limit
-                for r in user.roles
-                if r.permanent_file_limit != -1
-            ]
-            permanent_file_limit = max(perm_limits) if perm_limits else -1
-
-            if permanent_file_limit != -1:
-                current_permanent_files = (
-                    self.session.query(File)
-                    .filter(File.owner_id == user.id, File.is_permanent == True)
-                    .count()
-                )
-                if current_permanent_files >= permanent_file_limit:
-                    abort(
-                        403,
-                        f"Permanent file quota exceeded. Your limit is {permanent_file_limit} files.",
-                    )
+            # a. 以條件式 UPDATE 檢查並佔用永久檔案配額
+            quota.reserve_permanent(self.session, user.id)
 
             # b. 更新狀態
             file_to_update.is_permanent = True
@@ -206,6 +304,7 @@ class UpdateFileStatus:
             # --- 切換為非永久 ---
             # 根據新的邏輯，只需更新 is_permanent 旗標。
             # expiry_time 維持上傳時計算出的原始值。
+            quota.release_permanent(self.session, user.id)
             file_to_update.is_permanent = False
 
         self.session.commit()
@@ -234,7 +333,7 @@ class DownloadFile:
 
         file_to_download = (
             self.session.query(File)
-            .filter(File.safe_filename == self.safe_filename)
+            .filter(File.safe_filename == self.safe_filename, File.deleted_at.is_(None))
             .one_or_none()
         )
 
@@ -246,11 +345,15 @@ class DownloadFile:
             abort(403, "You do not have permission to download this file.")
 
         # 3. 檢查實體檔案是否存在
-        if not os.path.exists(file_to_download.storage_path):
+        location = file_to_download.storage_path
+        if storage.for_location(location).stat(location) is None:
             abort(404, "File not found on server storage.")
 
         # 4. 回傳給 View 層需要的資訊
         return {
+            "file_id": file_to_download.id,
+            "owner_id": file_to_download.owner_id,
+            "safe_filename": file_to_download.safe_filename,
             "storage_path": file_to_download.storage_path,
             "filename": file_to_download.filename,
         }
@@ -276,7 +379,7 @@ class DeleteFile:
 
         file_to_delete = (
             self.session.query(File)
-            .filter(File.safe_filename == self.save_filename)
+            .filter(File.safe_filename == self.save_filename, File.deleted_at.is_(None))
             .one_or_none()
         )
         if not file_to_delete:
@@ -286,20 +389,80 @@ class DeleteFile:
         if file_to_delete.owner_id != user.id:
             abort(403, "You do not have permission to delete this file.")
 
-        # 3. 檢查實體檔案是否存在並刪除
-        if os.path.exists(file_to_delete.storage_path):
-            os.remove(file_to_delete.storage_path)
-        else:
-            # 如果檔案不存在於磁碟，但資料庫有紀錄，也視為成功，只刪除資料庫紀錄
-            print(
-                f"Warning: File {file_to_delete.storage_path} not found on disk but exists in DB. Deleting DB record."
-            )
+        # 3. 軟刪除: 移到垃圾桶 (rename) 並歸還配額，實際刪除由背景任務回收
+        location = file_to_delete.storage_path
+        moved = trash.soft_delete(self.session, file_to_delete)
+        try:
+            self.session.commit()
+        except Exception:
+            trash.revert(moved)
+            raise
+        file_meta_cache.pop(file_to_delete.id)
+        share_cache.invalidate(file_to_delete.share_token)
+        hot_file_cache.invalidate(location)
+        audit(
+            AuditAction.file_delete,
+            account=self.user_account,
+            target=self.save_filename,
+            detail=file_to_delete.filename,
+        )
 
-        # 4. 從資料庫刪除紀錄
-        self.session.delete(file_to_delete)
-        self.session.commit()
+        return {
+            "message": "File deleted successfully",
+            "undo_seconds": global_variable.config.TRASH.UNDO_SECONDS,
+        }
 
-        return {"message": "File deleted successfully"}
+
+class RestoreFile:
+    """在復原期限內復原被刪除的檔案"""
+
+    def __init__(self, session: Session, user_account: str, safe_filename: str):
+        self.session = session
+        self.user_account = user_account
+        self.safe_filename = safe_filename
+
+    def run(self):
+        user = (
+            self.session.query(User)
+            .filter(User.account == self.user_account)
+            .one_or_none()
+        )
+        if not user:
+            abort(404, "User not found.")
+
+        file_to_restore = (
+            self.session.query(File)
+            .filter(
+                File.safe_filename == self.safe_filename,
+                File.owner_id == user.id,
+                File.deleted_at.is_not(None),
+            )
+            .one_or_none()
+        )
+        if not file_to_restore:
+            abort(404, "File not found in trash.")
+        if not trash.can_restore(file_to_restore):
+            abort(410, "The undo window for this file has expired.")
+
+        try:
+            moved = trash.restore(self.session, file_to_restore)
+        except FileNotFoundError:
+            abort(404, "File data no longer exists.")
+        try:
+            self.session.commit()
+        except Exception:
+            trash.revert(moved)
+            raise
+        if file_to_restore.share_token:
+            # 清除刪除期間留下的負向快取
+            share_cache.add(file_to_restore.share_token)
+        audit(
+            AuditAction.file_restore,
+            account=self.user_account,
+            target=self.safe_filename,
+            detail=file_to_restore.filename,
+        )
+        return {"message": "File restored successfully"}
 
 
 class ListFiles:
@@ -322,18 +485,12 @@ class ListFiles:
     def run(self):
         from sqlalchemy import case, cast, String, func
 
-        download_token = create_access_token(
-            identity=self.user_account,
-            expires_delta=timedelta(minutes=5),
-        )
-        download_token_str = (
-            f"/api/files/download_with_token?token={download_token}&filename="
-        )
-
-        # 查詢 1: 獲取使用者及其權限限制
+        # 查詢 1: 獲取使用者、配額計數器及其權限限制
         user_and_limits = (
             self.session.query(
                 User.id.label("user_id"),
+                User.file_count,
+                User.permanent_file_count,
                 Role.file_limit,
                 Role.permanent_file_limit,
             )
@@ -346,41 +503,30 @@ class ListFiles:
 
         if not user_and_limits:
             return {
+                "download_url_prefix": None,
                 "files": [],
                 "stats": {"file_count": 0, "permanent_file_count": 0},
                 "limits": {"file_limit": 0, "permanent_file_limit": 0},
             }
 
-        # 查詢 2: 獲取檔案統計數據
-        file_stats = (
-            self.session.query(
-                func.count(File.id).label("file_count"),
-                func.sum(case((File.is_permanent == True, 1), else_=0)).label(
-                    "permanent_file_count"
-                ),
-            )
-            .filter(File.owner_id == user_and_limits.user_id)
-            .first()
-        )
-
-        # 查詢 3: 獲取檔案列表本身
+        # 查詢 2: 獲取檔案列表本身
+        # 欄位名稱直接對應 FileInfo，讓 View 層可以不經轉換直接輸出
 
         q = select(
             File.id.label("id"),
             File.filename.label("filename"),
-            File.file_size.label("file_seize"),
-            File.createTime.label("createTime"),
-            File.expiry_time.label("expiry_time"),
+            File.file_size.label("size_bytes"),
+            File.createTime.label("upload_time"),
+            File.expiry_time.label("del_time"),
             File.is_permanent.label("is_permanent"),
             File.safe_filename.label("safe_filename"),
             File.share_token.label("share_token"),
-            File.file_size.label("file_size"),
-            (
-                global_variable.config.APP.PUBLIC_DOMAIN
-                + download_token_str
-                + File.safe_filename
-            ).label("download_url"),
-        ).where(File.owner_id == user_and_limits.user_id)
+            File.stored_size.label("stored_size"),
+            File.compression.label("compression"),
+            File.compression_cpu_ms.label("compression_cpu_ms"),
+            File.content_sha256,
+            File.preview,
+        ).where(File.owner_id == user_and_limits.user_id, File.deleted_at.is_(None))
         sort_column_map = {
             "filename": File.filename,
             "size_bytes": File.file_size,
@@ -396,15 +542,22 @@ class ListFiles:
         if self.filename:
             q = q.where(File.filename.like(f"%{self.filename}%"))
 
-        files = self.session.execute(q).all()
+        files = []
+        for row in self.session.execute(q):
+            item = row._asdict()
+            # 同一個檔案的預覽網址固定不變，瀏覽時可以直接使用瀏覽器快取
+            item["preview_url"] = previews.url(
+                item["id"], item["safe_filename"], item.pop("content_sha256"), item.pop("preview")
+            )
+            files.append(item)
         # 組合所有結果並回傳
+        # 下載 token 每個使用者共用一個 (快取至接近過期)，每筆檔案只需附上 safe_filename
         return {
+            "download_url_prefix": download_url_prefix(self.user_account),
             "files": files,
             "stats": {
-                "file_count": file_stats.file_count if file_stats else 0,
-                "permanent_file_count": file_stats.permanent_file_count
-                if file_stats
-                else 0,
+                "file_count": user_and_limits.file_count,
+                "permanent_file_count": user_and_limits.permanent_file_count,
             },
             "limits": {
                 "file_limit": "∞"
@@ -436,7 +589,11 @@ class CreateShareLink:
 
         file_record = (
             self.session.query(File)
-            .filter(File.safe_filename == self.safe_filename, File.owner_id == user.id)
+            .filter(
+                File.safe_filename == self.safe_filename,
+                File.owner_id == user.id,
+                File.deleted_at.is_(None),
+            )
             .one_or_none()
         )
 
@@ -448,9 +605,15 @@ class CreateShareLink:
             return file_record
 
         # 產生新 token 並儲存
-        file_record.share_token = uuid.uuid4().hex
+        file_record.share_token = new_share_token()
         self.session.commit()
         self.session.refresh(file_record)
+        share_cache.add(file_record.share_token)
+        audit(
+            AuditAction.share_create,
+            account=self.user_account,
+            target=self.safe_filename,
+        )
 
         return file_record
 
@@ -474,7 +637,11 @@ class RemoveShareLink:
 
         file_record = (
             self.session.query(File)
-            .filter(File.safe_filename == self.safe_filename, File.owner_id == user.id)
+            .filter(
+                File.safe_filename == self.safe_filename,
+                File.owner_id == user.id,
+                File.deleted_at.is_(None),
+            )
             .one_or_none()
         )
 
@@ -486,7 +653,483 @@ class RemoveShareLink:
             return {"message": "Share link already removed."}
 
         # 移除 token 並儲存
+        old_share_token = file_record.share_token
         file_record.share_token = None
         self.session.commit()
+        share_cache.invalidate(old_share_token)
+        audit(
+            AuditAction.share_remove,
+            account=self.user_account,
+            target=self.safe_filename,
+        )
 
         return {"message": "Share link removed successfully."}
+
+
+class BulkFileAction:
+    """
+    批次檔案操作的共用邏輯:
+    以一次 IN 查詢取得所有檔案並檢查所有權，整批在同一個交易中完成，回傳每個檔案的結果。
+    """
+
+    def __init__(self, session: Session, user_account: str, safe_filenames: list[str]):
+        self.session = session
+        self.user_account = user_account
+        # 去除重複但保留順序
+        self.safe_filenames = list(dict.fromkeys(safe_filenames))
+        self.results = {name: {"safe_filename": name} for name in self.safe_filenames}
+
+    def _set(self, name: str, status: str, **extra):
+        self.results[name].update(status=status, **extra)
+
+    def _load(self) -> tuple[User, list[File]]:
+        """回傳 (使用者, 屬於該使用者的檔案)，其餘檔案的結果標記為 not_found / forbidden"""
+        user = (
+            self.session.query(User)
+            .filter(User.account == self.user_account)
+            .one_or_none()
+        )
+        if not user:
+            abort(404, "User not found.")
+
+        records = (
+            self.session.query(File)
+            .filter(File.safe_filename.in_(self.safe_filenames), File.deleted_at.is_(None))
+            .all()
+        )
+        by_name = {record.safe_filename: record for record in records}
+        owned = []
+        for name in self.safe_filenames:
+            record = by_name.get(name)
+            if record is None:
+                self._set(name, "not_found")
+            elif record.owner_id != user.id:
+                self._set(name, "forbidden")
+            else:
+                owned.append(record)
+        return user, owned
+
+    def _response(self) -> dict:
+        results = list(self.results.values())
+        succeeded = sum(1 for result in results if result["status"] in ("ok", "unchanged"))
+        return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+class BulkDeleteFiles(BulkFileAction):
+    """批次刪除 (軟刪除)，配額以一個 UPDATE 歸還"""
+
+    def run(self):
+        user, files = self._load()
+        moved_files = []
+        try:
+            for record in files:
+                moved_files.append(trash.soft_delete(self.session, record, release_quota=False))
+            if files:
+                quota.release_files(
+                    self.session,
+                    user.id,
+                    count=len(files),
+                    size=sum(record.file_size for record in files),
+                    permanent_count=sum(1 for record in files if record.is_permanent),
+                )
+            # commit 後讀取屬性會逐筆重新查詢，先記下需要的欄位
+            deleted = [
+                (r.id, r.safe_filename, r.filename, r.share_token, r.deleted_from)
+                for r in files
+            ]
+            self.session.commit()
+        except Exception:
+            for moved in moved_files:
+                trash.revert(moved)
+            raise
+
+        for file_id, safe_filename, filename, share_token, location in deleted:
+            file_meta_cache.pop(file_id)
+            share_cache.invalidate(share_token)
+            hot_file_cache.invalidate(location)
+            audit(
+                AuditAction.file_delete,
+                account=self.user_account,
+                target=safe_filename,
+                detail=filename,
+            )
+            self._set(safe_filename, "ok")
+        response = self._response()
+        response["undo_seconds"] = global_variable.config.TRASH.UNDO_SECONDS
+        return response
+
+
+class BulkUpdateFileStatus(BulkFileAction):
+    """
+    批次切換永久狀態。
+    設為永久時依剩餘的永久檔案配額盡量處理 (依請求中的順序)，超出的檔案回傳 quota_exceeded。
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        user_account: str,
+        safe_filenames: list[str],
+        is_permanent: bool,
+    ):
+        super().__init__(session, user_account, safe_filenames)
+        self.is_permanent = is_permanent
+
+    def run(self):
+        user, files = self._load()
+        targets = []
+        for record in files:
+            if record.is_permanent == self.is_permanent:
+                # 狀態沒有改變，不需要調整配額
+                self._set(record.safe_filename, "unchanged")
+            else:
+                targets.append(record)
+
+        if self.is_permanent:
+            granted = quota.reserve_permanent_up_to(self.session, user.id, len(targets))
+            for record in targets[granted:]:
+                self._set(record.safe_filename, "quota_exceeded")
+            targets = targets[:granted]
+
+        # 逐筆條件式 UPDATE (同一個交易)，略過被其他請求同時切換的檔案
+        changed = []
+        for record in targets:
+            result = self.session.execute(
+                update(File)
+                .where(File.id == record.id, File.is_permanent == (not self.is_permanent))
+                .values(is_permanent=self.is_permanent)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                changed.append(record)
+                self._set(record.safe_filename, "ok")
+            else:
+                self._set(record.safe_filename, "unchanged")
+
+        if self.is_permanent:
+            # 歸還預留但沒有用到的配額
+            if len(targets) > len(changed):
+                quota.release_permanent(self.session, user.id, len(targets) - len(changed))
+        elif changed:
+            quota.release_permanent(self.session, user.id, len(changed))
+        # commit 前記下狀態 (commit 後讀取屬性會逐筆重新查詢)
+        for record in files:
+            self.results[record.safe_filename]["is_permanent"] = (
+                self.is_permanent if record in changed else record.is_permanent
+            )
+        self.session.commit()
+        return self._response()
+
+
+class BulkCreateShareLinks(BulkFileAction):
+    """批次建立分享連結，已有連結的檔案直接回傳原本的 token"""
+
+    def run(self):
+        _, files = self._load()
+        created = []
+        for record in files:
+            if not record.share_token:
+                record.share_token = new_share_token()
+                created.append((record.safe_filename, record.share_token))
+            self._set(record.safe_filename, "ok", share_token=record.share_token)
+        if created:
+            self.session.commit()
+
+        for safe_filename, share_token in created:
+            share_cache.add(share_token)
+            audit(
+                AuditAction.share_create,
+                account=self.user_account,
+                target=safe_filename,
+            )
+        return self._response()
+
+
+class GetTaskStatus:
+    """查詢背景任務狀態的核心邏輯"""
+
+    def __init__(self, session: Session, user_account: str, task_id: int):
+        self.session = session
+        self.user_account = user_account
+        self.task_id = task_id
+
+    def run(self):
+        task = self.session.execute(
+            select(Task)
+            .join(User, Task.owner_id == User.id)
+            .where(Task.id == self.task_id, User.account == self.user_account)
+        ).scalar_one_or_none()
+        if not task:
+            abort(404, "Task not found or you do not have permission.")
+
+        return {
+            "id": task.id,
+            "kind": task.kind,
+            "status": task.status,
+            "attempts": task.attempts,
+            "file_id": task.file_id,
+            "result": task.result,
+            "error": task.error,
+            "created_at": task.createTime,
+            "started_at": task.started_at,
+            "finished_at": task.finished_at,
+        }
+
+
+class DeltaSyncBase:
+    """差異上傳的共用邏輯: 取得使用者與自己的檔案 (作為差異的基礎)"""
+
+    def __init__(self, session: Session, user_account: str, safe_filename: str):
+        self.session = session
+        self.user_account = user_account
+        self.safe_filename = safe_filename
+        self.config = global_variable.config.DELTA_SYNC
+
+    def _load(self) -> tuple[User, File]:
+        user = (
+            self.session.query(User)
+            .filter(User.account == self.user_account)
+            .one_or_none()
+        )
+        if not user:
+            abort(404, "User not found.")
+        base = (
+            self.session.query(File)
+            .filter(
+                File.safe_filename == self.safe_filename,
+                File.owner_id == user.id,
+                File.deleted_at.is_(None),
+            )
+            .one_or_none()
+        )
+        if not base:
+            abort(404, "File not found or you do not have permission.")
+        return user, base
+
+    def _check_block_size(self, block_size: int):
+        if block_size < 1 or block_size > self.config.MAX_BLOCK_SIZE:
+            abort(400, f"block_size must be between 1 and {self.config.MAX_BLOCK_SIZE}.")
+
+
+class GetFileSignature(DeltaSyncBase):
+    """
+    回傳檔案的區塊簽章，用戶端據此計算差異。
+    小檔案直接計算；大檔案的簽章由背景任務計算後存檔，尚未計算完成時回傳任務 ID (202)。
+    """
+
+    def run(self, block_size: int | None = None):
+        user, base = self._load()
+        if block_size is None:
+            block_size = delta_sync.block_size_for(base.file_size, self.config)
+        self._check_block_size(block_size)
+        header = {
+            "safe_filename": base.safe_filename,
+            "file_size": base.file_size,
+            "block_size": block_size,
+        }
+
+        if base.file_size <= self.config.INLINE_SIGNATURE_MAX_BYTES:
+            try:
+                blocks = delta_sync.signature(base.storage_path, base.file_size, block_size)
+            except FileNotFoundError:
+                abort(404, "File not found on server.")
+            return {**header, "blocks": blocks}
+
+        path = delta_sync.signature_store.lookup(base.safe_filename, block_size)
+        if path is not None:
+            return {**header, "path": path}
+
+        # 同一個檔案與區塊大小已在計算中時沿用該任務
+        tasks = self.session.execute(
+            select(Task).where(
+                Task.kind == delta_sync.SIGNATURE,
+                Task.file_id == base.id,
+                Task.status.in_([TaskStatus.pending.value, TaskStatus.running.value]),
+            )
+        ).scalars()
+        task_id = next(
+            (task.id for task in tasks if task.payload.get("block_size") == block_size), None
+        )
+        if task_id is None:
+            task = task_queue.enqueue(
+                self.session,
+                delta_sync.SIGNATURE,
+                payload={"block_size": block_size},
+                file_id=base.id,
+                owner_id=user.id,
+            )
+            self.session.flush()
+            task_id = task.id
+            self.session.commit()
+            task_queue.notify()
+        return {**header, "task_id": task_id}
+
+
+class DeltaUploadFile(DeltaSyncBase):
+    """
+    以差異指令建立新檔案: 與基礎檔案相同的區塊直接在伺服器上複製，只有新的資料經過網路。
+    replace 為 True 時新檔案取代基礎檔案 (沿用永久狀態、期限與分享連結)，
+    基礎檔案移到垃圾桶，在復原期限內可以作為上一個版本復原。
+    """
+
+    def run(
+        self,
+        stream,
+        file_size: int,
+        block_size: int,
+        filename: str | None = None,
+        replace: bool = False,
+    ):
+        user, base = self._load()
+        self._check_block_size(block_size)
+        if file_size < 0:
+            abort(400, "Invalid file size.")
+        if storage.default is not storage.local:
+            abort(501, "Delta uploads are only supported with local storage.")
+
+        # 與一般上傳相同，先預留配額 (commit 後才開始寫入)；
+        # 取代基礎檔案時檔案數不變，只預留增加的位元組數
+        if replace:
+            reserved_count, reserved_bytes = 0, max(file_size - base.file_size, 0)
+        else:
+            reserved_count, reserved_bytes = 1, file_size
+        quota.reserve_upload(self.session, user.id, reserved_bytes, count=reserved_count)
+        self.session.commit()
+
+        original_filename = filename or base.filename
+        _, extension = os.path.splitext(original_filename)
+        safe_filename = uuid.uuid4().hex
+        name = f"{safe_filename}{extension}"
+        volume = volume_manager.choose(name, file_size)
+        final_path = volume_manager.file_path(volume, self.user_account, name)
+        directory = os.path.dirname(final_path)
+        partial = file_ops.hidden_temp_path(directory, name)
+        sync = global_variable.config.DURABILITY.MODE != file_ops.NONE
+
+        try:
+            with open(partial, "wb") as f:
+                stats = delta_sync.apply_delta(
+                    stream, base.storage_path, base.file_size, block_size, f.fileno(), file_size
+                )
+                if sync:
+                    file_ops.datasync(f.fileno())
+            os.replace(partial, final_path)
+            if sync:
+                file_ops.fsync_directory(directory)
+        except Exception as e:
+            if os.path.exists(partial):
+                os.remove(partial)
+            self.session.rollback()
+            quota.release_reservation(
+                self.session, user.id, reserved_bytes, count=reserved_count
+            )
+            self.session.commit()
+            if isinstance(e, delta_sync.DeltaError):
+                abort(400, str(e))
+            if isinstance(e, FileNotFoundError):
+                abort(404, "File not found on server.")
+            raise
+
+        return self._create_record(
+            user,
+            base,
+            original_filename=original_filename,
+            safe_filename=safe_filename,
+            final_path=final_path,
+            file_size=file_size,
+            replace=replace,
+            stats=stats,
+            reserved=(reserved_count, reserved_bytes),
+        )
+
+    def _create_record(
+        self,
+        user: User,
+        base: File,
+        original_filename: str,
+        safe_filename: str,
+        final_path: str,
+        file_size: int,
+        replace: bool,
+        stats: dict,
+        reserved: tuple[int, int],
+    ):
+        moved = None
+        reserved_count, reserved_bytes = reserved
+        base_id, base_location, share_token = base.id, base.storage_path, base.share_token
+        try:
+            if replace:
+                is_permanent, expiry_time = base.is_permanent, base.expiry_time
+                # 分享連結改指向新檔案 (share_token 為 unique，先從基礎檔案移除)
+                base.share_token = None
+                # 先歸還基礎檔案的配額，再以新檔案的實際大小檢查
+                moved = trash.soft_delete(self.session, base)
+                self.session.flush()
+                if is_permanent:
+                    quota.reserve_permanent(self.session, user.id)
+            else:
+                role = quota.get_effective_role(self.session, user.id)
+                lifetime_days = (
+                    role.file_lifetime_days if role and role.file_lifetime_days > 0 else 7
+                )
+                is_permanent = False
+                expiry_time = datetime.now() + timedelta(days=lifetime_days)
+                share_token = None
+            quota.commit_reservation(
+                self.session, user.id, reserved_bytes, file_size, reserved_count=reserved_count
+            )
+
+            new_file_record = File(
+                filename=original_filename,
+                safe_filename=safe_filename,
+                storage_path=final_path,
+                file_size=file_size,
+                owner_id=user.id,
+                expiry_time=expiry_time,
+                is_permanent=is_permanent,
+                share_token=share_token,
+                based_on_id=base_id,
+            )
+            self.session.add(new_file_record)
+            self.session.flush()
+            file_id = new_file_record.id
+            task = task_queue.enqueue(
+                self.session, POST_UPLOAD, file_id=file_id, owner_id=user.id
+            )
+            self.session.flush()
+            task_id = task.id
+            self.session.commit()
+        except Exception:
+            # abort (配額不足) 也會經過這裡: 移回基礎檔案、刪除新檔案並歸還預留
+            self.session.rollback()
+            trash.revert(moved)
+            os.remove(final_path)
+            quota.release_reservation(
+                self.session, user.id, reserved_bytes, count=reserved_count
+            )
+            self.session.commit()
+            raise
+
+        task_queue.notify()
+        if replace:
+            file_meta_cache.pop(base_id)
+            hot_file_cache.invalidate(base_location)
+            share_cache.invalidate(share_token)
+        audit(
+            AuditAction.file_upload,
+            account=self.user_account,
+            target=safe_filename,
+            detail=(
+                f"{original_filename} ({file_size} bytes, delta from {self.safe_filename}: "
+                f"{stats['literal_bytes']} bytes uploaded)"
+            ),
+        )
+        return {
+            "id": file_id,
+            "filename": original_filename,
+            "safe_filename": safe_filename,
+            "size_bytes": file_size,
+            "task_id": task_id,
+            "replaced": self.safe_filename if replace else None,
+            **stats,
+        }
@@ -2,8 +2,10 @@ from operator import le
 from util.db import get_db_session
 from sqlalchemy.orm import Session, aliased
 from util.security import hash_password
-from sqlalchemy import label, select, func
-from share.define.model_enum import RoleName, permanent_file
+from sqlalchemy import label, select, func, case, cast, String
+from share.define.model_enum import RoleName, permanent_file, AuditAction
+from util.audit import audit
+from util.quota import get_effective_role
 
 from util.global_variable import global_variable
 
@@ -92,7 +94,9 @@ class LoginUser:
 
         # 驗證使用者是否存在，以及密碼是否正確
         if not user or not verify_password(self.body.password, user.password):
+            audit(AuditAction.login, account=self.body.account, success=False)
             abort(401, description="帳號或密碼錯誤")
+        audit(AuditAction.login, account=user.account)
 
         # 密碼驗證成功，產生 JWT
         access_token = create_access_token(identity=user.account)
@@ -156,62 +160,31 @@ class GetUserInfo:
         self.user_account = user_account
 
     def run(self):
-        from sqlalchemy import String, cast, func, select, case
-
-        # 查詢使用者、統計資料和權限
-        result = (
-            self.session.query(
-                User.account,
-                User.user_name,
-                func.count(File.id).label("file_count"),
-                func.sum(File.file_size).label("storage_usage"),
-                func.sum(case((File.is_permanent == True, 1), else_=0)).label(
-                    "permanent_file_count"
-                ),
-                Role.file_limit,
-                Role.permanent_file_limit,
-            )
-            .select_from(User)
-            .outerjoin(User.roles)  # 使用 outerjoin 以免使用者沒有角色
-            .outerjoin(File, File.owner_id == User.id)  # 使用 outerjoin 以免使用者沒有檔案
+        # 統計資料直接讀取 User 上維護的計數器，不需對 files 做 COUNT / SUM
+        user = (
+            self.session.query(User)
             .filter(User.account == self.user_account)
-            .group_by(User.id, Role.id)
-            .order_by(Role.level.asc())
-            .first()
+            .one_or_none()
         )
+        if not user:
+            abort(404, "User not found.")
+        role = get_effective_role(self.session, user.id)
 
-        if not result:
-            # 如果上面的查詢找不到結果(例如一個完全沒有角色的新使用者)，做一個備用查詢
-            user = (
-                self.session.query(User)
-                .filter(User.account == self.user_account)
-                .one_or_none()
-            )
-            if not user:
-                abort(404, "User not found.")
-            return {
-                "user_name": user.user_name,
-                "account": user.account,
-                "storage_usage": 0,
-                "file_count": 0,
-                "permanent_file_count": 0,
-                "file_limit": "N/A",
-                "permanent_file_limit": "N/A",
-            }
+        def limit_text(value):
+            if role is None:
+                return "N/A"  # 完全沒有角色的新使用者
+            return "∞" if value == -1 else value
 
         # 組合回傳的字典
         return {
-            "user_name": result.user_name,
-            "account": result.account,
-            "storage_usage": int(result.storage_usage)
-            if result.storage_usage is not None
-            else 0,
-            "file_count": result.file_count,
-            "permanent_file_count": result.permanent_file_count,
-            "file_limit": "∞" if result.file_limit == -1 else result.file_limit,
-            "permanent_file_limit": "∞"
-            if result.permanent_file_limit == -1
-            else result.permanent_file_limit,
+            "user_name": user.user_name,
+            "account": user.account,
+            "storage_usage": user.storage_bytes,
+            "file_count": user.file_count,
+            "permanent_file_count": user.permanent_file_count,
+            "file_limit": limit_text(role and role.file_limit),
+            "permanent_file_limit": limit_text(role and role.permanent_file_limit),
+            "storage_bytes_limit": limit_text(role and role.storage_bytes_limit),
         }
 
 
@@ -222,36 +195,53 @@ class ListAllUsers:
         self.session = session
 
     def run(self):
-        file_count = (
+        # 檔案數與總大小使用 User 上的計數器，只有永久檔案的大小需要彙總
+        p_file_count = (
             select(
                 User.id.label("sub_user_id"),
                 func.count(File.id).label("sub_file_count"),
                 func.sum(File.file_size).label("sub_file_size"),
             )
             .join(File, File.owner_id == User.id)
+            .where(
+                File.is_permanent == permanent_file.is_permanent.value,
+                File.deleted_at.is_(None),
+            )
             .group_by(User.id)
         )
-        sub_file_count = file_count.subquery()
-        p_file_count = file_count.where(
-            File.is_permanent == permanent_file.is_permanent.value
-        )
         sub_p_file_count = p_file_count.subquery()
 
+        def limit_text(column):
+            # 與 UserInfoForAdmin 的 format_limits_to_string 相同的格式，直接在 SQL 完成
+            return case(
+                (column == -1, "∞"),
+                (column.is_(None), "N/A"),
+                else_=cast(column, String),
+            )
+
         query = (
             select(
                 User.account.label("account"),
                 User.user_name.label("name"),
                 Role.role_name.label("role_name"),
-                Role.file_limit.label("file_limit"),  # 檔案上限
-                Role.permanent_file_limit.label("permanent_file_limit"),  # 永久檔案數量上限
-                sub_file_count.c.sub_file_count.label("total_file"),  # 擁有檔案數量
-                sub_file_count.c.sub_file_size.label("total_file_size"),  # 擁有檔案大小
-                sub_p_file_count.c.sub_file_count.label("p_total_file"),  # 擁有的永久檔案數量
-                sub_p_file_count.c.sub_file_size.label("p_sub_file_size"),  # 擁有的永久檔案大小
+                limit_text(Role.file_limit).label("file_limit"),  # 檔案上限
+                limit_text(Role.permanent_file_limit).label(
+                    "permanent_file_limit"
+                ),  # 永久檔案數量上限
+                limit_text(Role.storage_bytes_limit).label(
+                    "storage_bytes_limit"
+                ),  # 儲存空間上限 (bytes)
+                User.file_count.label("total_file"),  # 擁有檔案數量
+                User.storage_bytes.label("total_file_size"),  # 擁有檔案大小
+                func.coalesce(sub_p_file_count.c.sub_file_count, 0).label(
+                    "p_total_file"
+                ),  # 擁有的永久檔案數量
+                func.coalesce(sub_p_file_count.c.sub_file_size, 0).label(
+                    "p_sub_file_size"
+                ),  # 擁有的永久檔案大小
             )
             .select_from(User)
             .join(User.roles.of_type(Role))
-            .outerjoin(sub_file_count, sub_file_count.c.sub_user_id == User.id)
             .outerjoin(sub_p_file_count, sub_p_file_count.c.sub_user_id == User.id)
         )
 
@@ -313,5 +303,11 @@ class UpdateUserRole:
         user_to_update.roles.clear()
         user_to_update.roles.append(new_role)
         self.session.commit()
+        audit(
+            AuditAction.role_update,
+            account=self.operator_account,
+            target=self.account_to_update,
+            detail=f"role -> {self.new_role_name}",
+        )
 
         return user_to_update
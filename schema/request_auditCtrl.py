@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+
+
+class AuditLogQuery(BaseModel):
+    """操作日誌查詢參數模型"""
+
+    page: int = Field(1, ge=1, description="頁碼 (從 1 開始)")
+    page_size: int = Field(50, ge=1, le=500, description="每頁筆數")
+    account: Optional[str] = Field(None, description="依操作者帳號篩選")
+    action: Optional[str] = Field(None, description="依操作類型篩選 (例如 file:upload)")
+    start_time: Optional[datetime] = Field(None, description="起始時間 (含)")
+    end_time: Optional[datetime] = Field(None, description="結束時間 (不含)")
+
+
+class AuditLogInfo(BaseModel):
+    """單一操作日誌"""
+
+    id: int
+    time: datetime
+    action: str
+    account: Optional[str]
+    target: Optional[str]
+    success: bool
+    ip: Optional[str]
+    detail: Optional[str]
+
+
+class AuditLogListResponse(BaseModel):
+    """操作日誌列表的回應模型"""
+
+    logs: List[AuditLogInfo]
+    page: int
+    page_size: int
+    total: int
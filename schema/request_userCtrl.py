@@ -38,7 +38,17 @@ class FileInfo(BaseModel):
     is_permanent: bool
     safe_filename: str
     share_token: str | None
-    download_url: str | None
+    stored_size: int | None = Field(
+        None, description="實際佔用的儲存空間 (壓縮後)，尚未評估時為 null"
+    )
+    compression: str | None = Field(None, description="靜態壓縮格式 (zstd / none)")
+    compression_cpu_ms: int | None = Field(None, description="評估與壓縮花費的 CPU 時間 (毫秒)")
+    download_url: str | None = Field(
+        None, description="列表 API 不提供，請使用 download_url_prefix + safe_filename"
+    )
+    preview_url: str | None = Field(
+        None, description="預覽 (縮圖或文字檔開頭) 的網址，尚未產生或無法預覽時為 null"
+    )
 
 
 class UploadInitRequest(BaseModel):
@@ -65,6 +75,7 @@ class UploadCompleteResponse(BaseModel):
     id: int
     filename: str
     size_bytes: int
+    task_id: int | None = None  # 上傳後處理的背景任務，可由 /files/tasks/<task_id> 查詢狀態
     message: str = "File uploaded successfully"
 
 
@@ -98,6 +109,9 @@ class FileListLimits(BaseModel):
 class FileListResponse(BaseModel):
     """檔案列表的回應模型"""
 
+    download_url_prefix: str | None = Field(
+        None, description="下載網址前綴，接上檔案的 safe_filename 即為下載網址"
+    )
     files: list[FileInfo]
     stats: FileListStats
     limits: FileListLimits
@@ -113,6 +127,7 @@ class response_UserInfo(BaseModel):
     permanent_file_count: int
     file_limit: str | int
     permanent_file_limit: str | int
+    storage_bytes_limit: str | int
 
 
 class UserInfoForAdmin(BaseModel):
@@ -123,12 +138,15 @@ class UserInfoForAdmin(BaseModel):
     role_name: Optional[str] = None
     file_limit: str  # 明確指定為字串
     permanent_file_limit: str  # 明確指定為字串
+    storage_bytes_limit: str  # 明確指定為字串
     total_file: int
     total_file_size: int
     p_total_file: int
     p_sub_file_size: int
 
-    @field_validator("file_limit", "permanent_file_limit", mode="before")
+    @field_validator(
+        "file_limit", "permanent_file_limit", "storage_bytes_limit", mode="before"
+    )
     @classmethod
     def format_limits_to_string(cls, v):
         if v == -1:
@@ -72,3 +72,36 @@ class permission(DocEnum):
     file_permanent = "file:set_permanent", "設定檔案為永久"
     file_manage_all = "file:manage:all", "管理所有檔案"
     audit_read = "audit:read", "讀取操作日誌"
+    system_profile = "system:profile", "讀取效能分析資料"
+    system_metrics = "system:metrics", "讀取系統指標"
+
+
+class AuditAction(DocEnum):
+    """操作日誌的操作類型"""
+
+    login = "user:login", "登入"
+    role_update = "user:role_update", "修改使用者角色"
+    file_upload = "file:upload", "上傳檔案"
+    file_download = "file:download", "下載檔案"
+    file_delete = "file:delete", "刪除檔案"
+    file_restore = "file:restore", "復原檔案"
+    share_create = "share:create", "建立分享連結"
+    share_remove = "share:remove", "移除分享連結"
+    share_download = "share:download", "透過分享連結下載"
+
+
+class UploadStatus(DocEnum):
+    """上傳會話狀態"""
+
+    active = "active", "上傳中"
+    completed = "completed", "已完成"
+    expired = "expired", "已過期"
+
+
+class TaskStatus(DocEnum):
+    """背景任務狀態"""
+
+    pending = "pending", "等待執行"
+    running = "running", "執行中"
+    succeeded = "succeeded", "已完成"
+    failed = "failed", "失敗"
@@ -0,0 +1,36 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import String, Integer, Index
+from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase
+
+"""定義 log_db 使用的 model (與主資料庫分開的 metadata)"""
+
+
+class LogBase(DeclarativeBase):
+    """日誌資料庫基礎格式"""
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    createTime: Mapped[datetime] = mapped_column(insert_default=datetime.now)
+
+
+class AuditLog(LogBase):
+    __tablename__ = "audit_logs"
+
+    action: Mapped[str] = mapped_column(String(50), nullable=False, comment="操作類型")
+    account: Mapped[Optional[str]] = mapped_column(String(50), comment="操作者帳號")
+    target: Mapped[Optional[str]] = mapped_column(
+        String(255), comment="操作對象 (safe_filename / 帳號 ...)"
+    )
+    success: Mapped[bool] = mapped_column(default=True, comment="操作是否成功")
+    ip: Mapped[Optional[str]] = mapped_column(String(64), comment="來源 IP")
+    detail: Mapped[Optional[str]] = mapped_column(String(1000), comment="補充說明")
+
+    __table_args__ = (
+        Index("ix_audit_logs_createTime", "createTime"),
+        Index("ix_audit_logs_account_createTime", "account", "createTime"),
+        Index("ix_audit_logs_action_createTime", "action", "createTime"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<AuditLog(id={self.id}, action='{self.action}', account='{self.account}')>"
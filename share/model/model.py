@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Optional, List
 
-from sqlalchemy import String, Table, Column, ForeignKey, Integer, Boolean
+from sqlalchemy import String, Table, Column, ForeignKey, Integer, Boolean, Index, JSON
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase, relationship
 
 """定義 model 相關"""
@@ -58,6 +58,9 @@ class Role(Base):
     level: Mapped[int] = mapped_column(comment="角色等級，有0 ~ 4，0為最高權限")
     file_limit: Mapped[int] = mapped_column(comment="總檔案數量限制 (-1 為無限)")
     permanent_file_limit: Mapped[int] = mapped_column(comment="永久檔案數量限制 (-1 為無限)")
+    storage_bytes_limit: Mapped[int] = mapped_column(
+        default=-1, server_default="-1", comment="總儲存空間限制 (bytes，-1 為無限)"
+    )
     file_lifetime_days: Mapped[int] = mapped_column(comment="檔案生命週期(天)")
 
     permissions: Mapped[List[Permission]] = relationship(
@@ -84,6 +87,41 @@ class File(Base):
     share_token: Mapped[Optional[str]] = mapped_column(
         String(64), unique=True, index=True, comment="公開分享連結的 token"
     )
+    compression: Mapped[Optional[str]] = mapped_column(
+        String(16), comment="靜態壓縮格式 (zstd)；none 表示評估後不壓縮，NULL 表示尚未評估"
+    )
+    stored_size: Mapped[Optional[int]] = mapped_column(
+        comment="實際佔用的儲存空間 (bytes)，尚未評估時為 NULL"
+    )
+    compression_cpu_ms: Mapped[Optional[int]] = mapped_column(
+        comment="評估與壓縮花費的 CPU 時間 (毫秒)"
+    )
+    last_accessed_at: Mapped[Optional[datetime]] = mapped_column(
+        comment="最後一次下載的時間 (批次寫入，可能延遲約一分鐘)"
+    )
+    access_count: Mapped[int] = mapped_column(
+        default=0,
+        server_default="0",
+        comment="最近一段期間 (TIERING.PROMOTE_WINDOW_DAYS) 內的下載次數",
+    )
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(
+        index=True, comment="軟刪除的時間，NULL 表示未刪除"
+    )
+    deleted_from: Mapped[Optional[str]] = mapped_column(
+        String(512), comment="軟刪除前的位置 (復原時移回)"
+    )
+    content_sha256: Mapped[Optional[str]] = mapped_column(
+        String(64), comment="檔案內容的 SHA-256 (上傳後由背景任務計算)"
+    )
+    based_on_id: Mapped[Optional[int]] = mapped_column(
+        comment="以差異上傳建立時的基礎檔案 (不設外鍵，基礎檔案回收後仍保留)"
+    )
+    preview: Mapped[Optional[str]] = mapped_column(
+        String(40), comment="預覽的種類 (例如 thumb256.jpg)，與 content_sha256 組成快取的鍵"
+    )
+    moving_until: Mapped[Optional[datetime]] = mapped_column(
+        comment="重新平衡搬移中的租約期限 (多個行程同時重新平衡時只有一個會搬移)"
+    )
 
     owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     owner: Mapped["User"] = relationship(back_populates="files")
@@ -92,6 +130,79 @@ class File(Base):
         return f"<File(id={self.id}, filename='{self.filename}')>"
 
 
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+
+    upload_id: Mapped[str] = mapped_column(
+        String(64), unique=True, index=True, nullable=False, comment="上傳會話 ID"
+    )
+    filename: Mapped[str] = mapped_column(String(255), nullable=False, comment="原始檔名")
+    file_size: Mapped[int] = mapped_column(comment="宣告的檔案大小 (bytes)，亦為預留的配額")
+    file_type: Mapped[Optional[str]] = mapped_column(String(255), comment="檔案類型 (MIME type)")
+    temp_path: Mapped[str] = mapped_column(
+        String(512), nullable=False, comment="上傳中資料的位置 (本機路徑或 s3://bucket/key)"
+    )
+    backend_upload_id: Mapped[Optional[str]] = mapped_column(
+        String(1024), comment="儲存後端的上傳 ID (例如 S3 multipart UploadId)"
+    )
+    received_bytes: Mapped[int] = mapped_column(default=0, comment="已接收的位元組數")
+    status: Mapped[str] = mapped_column(
+        String(20), default="active", index=True, comment="active / completed / expired"
+    )
+    last_activity: Mapped[datetime] = mapped_column(
+        insert_default=datetime.now, comment="最後一次 init / chunk 的時間"
+    )
+    expires_at: Mapped[datetime] = mapped_column(
+        comment="會話過期時間 (last_activity + TTL)，過期後由排程任務清除"
+    )
+
+    owner_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+
+    __table_args__ = (
+        Index("ix_upload_sessions_status_expires_at", "status", "expires_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<UploadSession(upload_id='{self.upload_id}', status='{self.status}')>"
+
+
+class Task(Base):
+    """背景任務佇列 (上傳後處理等)，以條件式 UPDATE 領取，多個行程可以同時執行"""
+
+    __tablename__ = "tasks"
+
+    kind: Mapped[str] = mapped_column(String(50), nullable=False, comment="任務類型")
+    status: Mapped[str] = mapped_column(
+        String(20), default="pending", comment="pending / running / succeeded / failed"
+    )
+    payload: Mapped[Optional[dict]] = mapped_column(JSON, comment="任務參數")
+    result: Mapped[Optional[dict]] = mapped_column(JSON, comment="任務結果")
+    error: Mapped[Optional[str]] = mapped_column(String(1000), comment="最後一次失敗的原因")
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0", comment="已執行次數")
+    run_after: Mapped[datetime] = mapped_column(
+        insert_default=datetime.now, comment="最早可執行的時間 (失敗重試時延後)"
+    )
+    worker: Mapped[Optional[str]] = mapped_column(String(100), comment="領取任務的行程")
+    lease_expires_at: Mapped[Optional[datetime]] = mapped_column(
+        comment="領取的有效期限，過期仍未完成視為行程中斷，重新排入佇列"
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(comment="最後一次開始執行的時間")
+    finished_at: Mapped[Optional[datetime]] = mapped_column(comment="完成或放棄的時間")
+    file_id: Mapped[Optional[int]] = mapped_column(
+        index=True, comment="相關的檔案 (不設外鍵，檔案回收後任務紀錄仍保留)"
+    )
+
+    owner_id: Mapped[Optional[int]] = mapped_column(ForeignKey("users.id"))
+
+    __table_args__ = (
+        Index("ix_tasks_status_run_after", "status", "run_after"),
+        Index("ix_tasks_status_lease_expires_at", "status", "lease_expires_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<Task(id={self.id}, kind='{self.kind}', status='{self.status}')>"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -101,6 +212,23 @@ class User(Base):
     user_name: Mapped[str] = mapped_column(String(100), nullable=False)
     note: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
 
+    # 配額計數器 (由上傳/刪除流程維護，避免每次請求都 COUNT)
+    file_count: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="已完成上傳的檔案數量"
+    )
+    permanent_file_count: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="永久檔案數量"
+    )
+    storage_bytes: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="已完成上傳的檔案總位元組數"
+    )
+    reserved_file_count: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="上傳中 (已預留配額) 的檔案數量"
+    )
+    reserved_bytes: Mapped[int] = mapped_column(
+        default=0, server_default="0", comment="上傳中 (已預留配額) 的位元組數"
+    )
+
     roles: Mapped[List[Role]] = relationship(
         secondary=user_roles_table, backref="users", lazy="selectin"
     )
@@ -0,0 +1,76 @@
+"""測試共用的 fixture"""
+
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from share.model.model import Base, File, Role, User
+from util.global_variable import global_variable
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    """暫存目錄中的 SQLite 主資料庫 (可跨執行緒使用)，同時設定為 global_variable.database"""
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'main.db'}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(global_variable, "database", {"default": SessionLocal}, raising=False)
+    yield SessionLocal
+    engine.dispose()
+
+
+@pytest.fixture
+def session(session_factory):
+    with session_factory() as session:
+        yield session
+
+
+@pytest.fixture
+def make_file(session):
+    """新增一筆檔案紀錄 (測試不啟用 SQLite 的外鍵檢查，owner 可以不存在)"""
+
+    def make(storage_path: str, size: int, owner_id: int = 1, **values) -> File:
+        record = File(
+            filename="a.bin",
+            safe_filename=uuid.uuid4().hex,
+            storage_path=storage_path,
+            file_size=size,
+            owner_id=owner_id,
+            **values,
+        )
+        session.add(record)
+        session.commit()
+        return record
+
+    return make
+
+
+@pytest.fixture
+def make_user(session):
+    """新增一個使用者與其角色 (配額限制)，回傳 user id"""
+
+    def make(file_limit=-1, storage_bytes_limit=-1, permanent_file_limit=-1) -> int:
+        role = Role(
+            role_name=f"role-{uuid.uuid4().hex[:8]}",
+            level=3,
+            file_limit=file_limit,
+            permanent_file_limit=permanent_file_limit,
+            storage_bytes_limit=storage_bytes_limit,
+            file_lifetime_days=7,
+        )
+        user = User(
+            account=uuid.uuid4().hex[:16],
+            password="x",
+            storage_path="x",
+            user_name="tester",
+            roles=[role],
+        )
+        session.add(user)
+        session.commit()
+        return user.id
+
+    return make
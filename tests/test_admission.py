@@ -0,0 +1,154 @@
+"""傳輸請求的准入控制: 個人上限 429、全域佇列 503"""
+
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask, Response
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+from util import admission
+from util.admission import AdmissionController, admission_control
+from util.config_schema import Admission
+from util.global_variable import global_variable
+
+KIND = admission.DOWNLOAD
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    def configure(global_limit=0, user_limit=0, queue_size=10, timeout=2.0):
+        config = Admission(
+            ENABLED=True,
+            GLOBAL_LIMITS={KIND: global_limit},
+            PER_USER_LIMITS={KIND: user_limit},
+            QUEUE_SIZE=queue_size,
+            QUEUE_TIMEOUT_SECONDS=timeout,
+            RETRY_AFTER_SECONDS=7,
+        )
+        monkeypatch.setattr(global_variable, "config", SimpleNamespace(ADMISSION=config))
+
+    return configure
+
+
+def _start(controller, identities):
+    """在背景執行緒中取得名額 (會在佇列中等待)，回傳執行緒與結果 (釋放函式或例外)"""
+    results = {}
+
+    def acquire(index, identity):
+        try:
+            results[index] = controller.acquire(KIND, identity)
+        except Exception as e:
+            results[index] = e
+
+    threads = [
+        threading.Thread(target=acquire, args=(i, identity))
+        for i, identity in enumerate(identities)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_queued(controller, depth):
+    for _ in range(200):
+        if controller.stats()["queue_depth"].get(KIND, 0) == depth:
+            return
+        time.sleep(0.01)
+    raise AssertionError("requests were not queued")
+
+
+def test_per_user_limit_is_429(configure):
+    configure(user_limit=1)
+    controller = AdmissionController()
+    release = controller.acquire(KIND, "alice")
+    with pytest.raises(TooManyRequests) as excinfo:
+        controller.acquire(KIND, "alice")
+    assert excinfo.value.retry_after == 7
+    # 其他使用者不受影響，釋放後可以再取得
+    controller.acquire(KIND, "bob")()
+    release()
+    release()  # 重複釋放不影響計數
+    controller.acquire(KIND, "alice")()
+    assert controller.stats()["active"] == {KIND: 0}
+
+
+def test_full_queue_is_503(configure):
+    configure(global_limit=1, queue_size=1)
+    controller = AdmissionController()
+    release = controller.acquire(KIND, "alice")
+    threads, results = _start(controller, ["bob"])
+    _wait_queued(controller, 1)
+
+    with pytest.raises(ServiceUnavailable) as excinfo:
+        controller.acquire(KIND, "carol")
+    assert excinfo.value.retry_after == 7
+
+    release()
+    for thread in threads:
+        thread.join()
+    assert not isinstance(results[0], Exception)
+    results[0]()
+
+
+def test_queue_timeout_is_503(configure):
+    configure(global_limit=1, timeout=0.1)
+    controller = AdmissionController()
+    release = controller.acquire(KIND, "alice")
+    with pytest.raises(ServiceUnavailable):
+        controller.acquire(KIND, "bob")
+    release()
+    assert controller.stats()["rejected_503"] == 1
+    assert controller.stats()["queue_depth"] == {KIND: 0}
+
+
+def test_per_user_limit_is_rechecked_after_queueing(configure):
+    """同一使用者在佇列中等待的多個請求，取得全域名額後仍受個人上限限制"""
+    configure(global_limit=2, user_limit=1)
+    controller = AdmissionController()
+    holders = [controller.acquire(KIND, "bob"), controller.acquire(KIND, "carol")]
+    threads, results = _start(controller, ["alice"] * 3)
+    _wait_queued(controller, 3)
+
+    for release in holders:
+        release()
+    for thread in threads:
+        thread.join()
+
+    admitted = [r for r in results.values() if not isinstance(r, Exception)]
+    rejected = [r for r in results.values() if isinstance(r, TooManyRequests)]
+    assert (len(admitted), len(rejected)) == (1, 2)
+    admitted[0]()
+
+
+def test_decorator_holds_the_slot_until_the_stream_is_closed(configure):
+    configure(user_limit=1)
+    app = Flask(__name__)
+
+    @app.get("/download")
+    @admission_control(KIND)
+    def download():
+        return Response(iter([b"a", b"b"]), direct_passthrough=True)
+
+    @app.get("/fail")
+    @admission_control(KIND)
+    def fail():
+        raise RuntimeError("boom")
+
+    client = app.test_client()
+
+    def status(url):
+        response = client.get(url)
+        response.close()
+        return response.status_code
+
+    response = client.get("/download")
+    assert status("/download") == 429
+    assert response.get_data() == b"ab"
+    response.close()
+    assert status("/download") == 200
+
+    # 例外時也會釋放名額
+    assert status("/fail") == 500
+    assert status("/download") == 200
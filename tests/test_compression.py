@@ -0,0 +1,56 @@
+"""API 回應壓縮: 壓縮後的回應只會有一個 Vary 標頭"""
+
+import gzip
+
+import pytest
+from flask import Flask, Response
+
+from util.compression import CompressionMiddleware, add_vary
+from util.config_schema import Compression
+
+BODY = b'{"files": []}' * 200
+
+
+def _client(vary=None):
+    app = Flask(__name__)
+
+    @app.get("/list")
+    def list_files():
+        response = Response(BODY, mimetype="application/json")
+        if vary is not None:
+            response.headers["Vary"] = vary
+        return response
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app, Compression(ALGORITHMS=["gzip"]))
+    return app.test_client()
+
+
+@pytest.mark.parametrize(
+    "vary, expected",
+    [
+        (None, "Accept-Encoding"),
+        ("Cookie", "Cookie, Accept-Encoding"),
+        ("Cookie, accept-encoding", "Cookie, accept-encoding"),
+        ("*", "*"),
+    ],
+)
+def test_compressed_response_has_single_vary_header(vary, expected):
+    response = _client(vary).get("/list", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers.getlist("Vary") == [expected]
+    assert gzip.decompress(response.data) == BODY
+
+
+def test_uncompressed_response_keeps_vary_header():
+    response = _client("Cookie").get("/list", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.headers.getlist("Vary") == ["Cookie"]
+    assert response.data == BODY
+
+
+def test_add_vary_merges_into_first_vary_header():
+    headers = [("Content-Type", "application/json"), ("vary", "")]
+    assert add_vary(headers, "Accept-Encoding") == [
+        ("Content-Type", "application/json"),
+        ("vary", "Accept-Encoding"),
+    ]
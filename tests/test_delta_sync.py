@@ -0,0 +1,97 @@
+"""差異上傳的指令套用 (base 為一般、靜態壓縮與 pack 檔中的檔案)"""
+
+import hashlib
+import io
+import os
+import zlib
+
+import pytest
+
+pytest.importorskip("zstandard")
+
+from util import at_rest_compression, delta_sync  # noqa: E402
+from util.delta_sync import COPY, LITERAL, OP_COPY, OP_LITERAL, DeltaError  # noqa: E402
+from util.storage_backend import storage  # noqa: E402
+
+BLOCK = 1024
+# 最後一個區塊不足 block_size
+BASE = bytes(range(256)) * 14 + b"tail"
+
+
+def _copy(start: int, count: int) -> bytes:
+    return OP_COPY + COPY.pack(start, count)
+
+
+def _literal(data: bytes) -> bytes:
+    return OP_LITERAL + LITERAL.pack(len(data)) + data
+
+
+@pytest.fixture(params=["plain", "compressed", "packed"])
+def base_location(request, tmp_path, monkeypatch):
+    plain = tmp_path / "base.bin"
+    plain.write_bytes(BASE)
+    if request.param == "plain":
+        return str(plain)
+    if request.param == "compressed":
+        location = str(plain) + at_rest_compression.COMPRESSED_SUFFIX
+        # frame 大小不是區塊大小的倍數，複製會跨越 frame
+        at_rest_compression.compress_file(str(plain), location, level=3, frame_size=700)
+        return location
+    pack_dir = tmp_path / "packs"
+    pack_dir.mkdir()
+    (pack_dir / "test.pack").write_bytes(b"x" * 100 + BASE + b"y" * 50)
+    monkeypatch.setattr(storage.pack, "pack_dir", str(pack_dir))
+    return storage.pack.location("test.pack", 100, len(BASE))
+
+
+def _apply(tmp_path, base_location, delta: bytes, new_size: int):
+    out = tmp_path / "new.bin"
+    fd = os.open(out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
+        result = delta_sync.apply_delta(
+            io.BytesIO(delta), base_location, len(BASE), BLOCK, fd, new_size
+        )
+    finally:
+        os.close(fd)
+    return out.read_bytes(), result
+
+
+def test_apply_delta(tmp_path, base_location):
+    expected = BASE[BLOCK : 3 * BLOCK] + b"inserted" + BASE[:BLOCK] + BASE[3 * BLOCK :]
+    delta = _copy(1, 2) + _literal(b"inserted") + _copy(0, 1) + _copy(3, 1)
+
+    data, result = _apply(tmp_path, base_location, delta, len(expected))
+
+    assert data == expected
+    assert result == {"copied_bytes": len(BASE), "literal_bytes": len(b"inserted")}
+
+
+def test_copy_past_the_end_is_truncated_to_the_base(tmp_path, base_location):
+    data, _ = _apply(tmp_path, base_location, _copy(3, 5), len(BASE) - 3 * BLOCK)
+    assert data == BASE[3 * BLOCK :]
+
+
+@pytest.mark.parametrize(
+    "delta, new_size",
+    [
+        (_copy(4, 1), BLOCK),  # 超出 base 的區塊
+        (_copy(0, 0), BLOCK),  # 空的複製
+        (_copy(0, 2), BLOCK),  # 超過宣告的大小
+        (_copy(0, 1), BLOCK + 1),  # 少於宣告的大小
+        (OP_LITERAL + LITERAL.pack(10) + b"short", 10),  # 本文提前結束
+        (b"X", 0),  # 未知的指令
+    ],
+)
+def test_invalid_delta(tmp_path, base_location, delta, new_size):
+    with pytest.raises(DeltaError):
+        _apply(tmp_path, base_location, delta, new_size)
+
+
+def test_signature_matches_blocks(base_location):
+    """簽章以原始內容計算 (與 base 的儲存方式無關)"""
+    blocks = [BASE[i : i + BLOCK] for i in range(0, len(BASE), BLOCK)]
+    expected = [
+        [zlib.adler32(block), hashlib.blake2b(block, digest_size=16).hexdigest()]
+        for block in blocks
+    ]
+    assert delta_sync.signature(base_location, len(BASE), BLOCK) == expected
@@ -0,0 +1,78 @@
+"""下載回應的 Range 請求 (一般、靜態壓縮與 pack 檔中的檔案)"""
+
+import pytest
+from flask import Flask
+
+pytest.importorskip("zstandard")
+
+from util import at_rest_compression  # noqa: E402
+from util.file_response import send_stored_file  # noqa: E402
+from util.storage_backend import storage  # noqa: E402
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture(params=["plain", "compressed", "packed"])
+def location(request, tmp_path, monkeypatch):
+    plain = tmp_path / "file.bin"
+    plain.write_bytes(DATA)
+    if request.param == "plain":
+        return str(plain)
+    if request.param == "compressed":
+        location = str(plain) + at_rest_compression.COMPRESSED_SUFFIX
+        at_rest_compression.compress_file(str(plain), location, level=3, frame_size=1000)
+        return location
+    pack_dir = tmp_path / "packs"
+    pack_dir.mkdir()
+    (pack_dir / "test.pack").write_bytes(b"x" * 123 + DATA + b"y" * 45)
+    monkeypatch.setattr(storage.pack, "pack_dir", str(pack_dir))
+    return storage.pack.location("test.pack", 123, len(DATA))
+
+
+@pytest.fixture
+def client(location):
+    app = Flask(__name__)
+
+    @app.get("/file")
+    def download():
+        return send_stored_file(location, "file.bin")
+
+    @app.get("/signed")
+    def download_signed():
+        # 簽章網址限制的範圍優先於用戶端的 Range
+        return send_stored_file(location, "file.bin", byte_range=(100, 200))
+
+    return app.test_client()
+
+
+def test_full_download(client):
+    response = client.get("/file")
+    assert response.status_code == 200
+    assert response.data == DATA
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+
+@pytest.mark.parametrize(
+    "header, start, end",
+    [
+        ("bytes=995-1005", 995, 1006),  # 跨越壓縮的 frame 邊界
+        ("bytes=10000-", 10000, len(DATA)),
+        ("bytes=-7", len(DATA) - 7, len(DATA)),
+    ],
+)
+def test_range_request(client, header, start, end):
+    response = client.get("/file", headers={"Range": header})
+    assert response.status_code == 206
+    assert response.data == DATA[start:end]
+    assert response.headers["Content-Range"] == f"bytes {start}-{end - 1}/{len(DATA)}"
+    assert response.content_length == end - start
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/file", headers={"Range": f"bytes={len(DATA) + 10}-"})
+    assert response.status_code == 416
+
+
+def test_signed_range_ignores_client_range(client):
+    response = client.get("/signed", headers={"Range": "bytes=0-9"})
+    assert response.data == DATA[100:200]
@@ -0,0 +1,127 @@
+"""配額計數器的條件式 UPDATE 在並行請求下不會超過上限"""
+
+import threading
+
+import pytest
+from werkzeug.exceptions import Forbidden
+
+from share.model.model import User
+from util import quota
+
+PARALLEL = 20
+
+
+def _run_parallel(worker):
+    """同時啟動 PARALLEL 個執行緒，回傳每個執行緒的結果"""
+    barrier = threading.Barrier(PARALLEL)
+    results = [None] * PARALLEL
+
+    def run(index):
+        barrier.wait()
+        results[index] = worker(index)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(PARALLEL)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _counters(session, user_id):
+    session.expire_all()
+    user = session.get(User, user_id)
+    return (
+        user.file_count,
+        user.storage_bytes,
+        user.reserved_file_count,
+        user.reserved_bytes,
+    )
+
+
+def _upload(session_factory, user_id, size, fail=False):
+    """一次上傳的配額流程: 預留 -> 完成 (或放棄時歸還)"""
+    with session_factory() as session:
+        try:
+            quota.reserve_upload(session, user_id, size)
+            session.commit()
+        except Forbidden:
+            session.rollback()
+            return "rejected"
+        if fail:
+            quota.release_reservation(session, user_id, size)
+        else:
+            quota.commit_reservation(session, user_id, size, size)
+        session.commit()
+        return "released" if fail else "committed"
+
+
+def test_parallel_uploads_respect_file_limit(session, session_factory, make_user):
+    user_id = make_user(file_limit=5)
+
+    results = _run_parallel(lambda i: _upload(session_factory, user_id, 10))
+
+    assert results.count("committed") == 5
+    assert _counters(session, user_id) == (5, 50, 0, 0)
+
+
+def test_parallel_uploads_respect_byte_quota(session, session_factory, make_user):
+    user_id = make_user(storage_bytes_limit=1000)
+
+    results = _run_parallel(lambda i: _upload(session_factory, user_id, 300))
+
+    assert results.count("committed") == 3
+    assert _counters(session, user_id) == (3, 900, 0, 0)
+
+
+def test_parallel_reservations_never_exceed_limits(session, session_factory, make_user):
+    """預留期間 (尚未完成) 的上傳也計入上限"""
+    user_id = make_user(file_limit=7, storage_bytes_limit=10_000)
+
+    def reserve(_):
+        with session_factory() as s:
+            try:
+                quota.reserve_upload(s, user_id, 100)
+                s.commit()
+                return True
+            except Forbidden:
+                return False
+
+    assert _run_parallel(reserve).count(True) == 7
+    assert _counters(session, user_id) == (0, 0, 7, 700)
+
+
+def test_released_reservations_free_the_quota(session, session_factory, make_user):
+    user_id = make_user(file_limit=PARALLEL, storage_bytes_limit=PARALLEL * 100)
+
+    results = _run_parallel(lambda i: _upload(session_factory, user_id, 100, fail=i % 2 == 0))
+
+    assert results.count("committed") == PARALLEL // 2
+    assert results.count("released") == PARALLEL // 2
+    assert _counters(session, user_id) == (PARALLEL // 2, PARALLEL // 2 * 100, 0, 0)
+
+
+def test_commit_rechecks_actual_size(session, session_factory, make_user):
+    user_id = make_user(storage_bytes_limit=1000)
+    quota.reserve_upload(session, user_id, 500)
+    session.commit()
+
+    with pytest.raises(Forbidden):
+        quota.commit_reservation(session, user_id, 500, 1500)
+    session.rollback()
+    assert _counters(session, user_id) == (0, 0, 1, 500)
+
+
+def test_replacement_reserves_no_file_slot(session, make_user):
+    user_id = make_user(file_limit=1, storage_bytes_limit=1000)
+    quota.reserve_upload(session, user_id, 400)
+    quota.commit_reservation(session, user_id, 400, 400)
+    session.commit()
+
+    # 取代既有檔案 (差異上傳): 檔案數已達上限時仍可上傳，只預留增加的位元組數，
+    # 舊版本先歸還配額，再以新版本的實際大小轉為正式計數
+    quota.reserve_upload(session, user_id, 50, count=0)
+    quota.release_files(session, user_id, count=1, size=400)
+    quota.commit_reservation(session, user_id, 50, 450, reserved_count=0)
+    session.commit()
+    assert _counters(session, user_id) == (1, 450, 0, 0)
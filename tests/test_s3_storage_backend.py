@@ -0,0 +1,115 @@
+"""S3StorageBackend 以 moto 模擬的 S3 測試 (不需要實際的 S3 / MinIO)"""
+
+import pytest
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from util.config_schema import App, S3Storage  # noqa: E402
+from util.config_schema import Storage as StorageConfig  # noqa: E402
+from util.storage_backend import (  # noqa: E402
+    InvalidPart,
+    S3StorageBackend,
+    Storage,
+    StorageBackend,
+)
+
+BUCKET = "files"
+# S3 multipart 除了最後一個 part 以外至少 5 MiB
+PART_SIZE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield S3StorageBackend(S3Storage(BUCKET=BUCKET, PREFIX="uploads/"))
+
+
+def _upload(backend, data: bytes) -> str:
+    target = backend.begin_upload("alice", "upload-1", len(data))
+    for offset in range(0, len(data), PART_SIZE):
+        part = data[offset : offset + PART_SIZE]
+        backend.put_part(target, offset, part, PART_SIZE, len(data))
+    assert backend.uploaded_size(target) == len(data)
+    return backend.complete_upload(target, "alice", "final.bin")
+
+
+def test_multipart_upload_and_read_back(backend):
+    data = bytes(range(256)) * (PART_SIZE // 256) + b"tail"
+    location = _upload(backend, data)
+
+    assert location == f"s3://{BUCKET}/uploads/alice/upload-1"
+    assert backend.owns(location)
+    assert backend.stat(location).size == len(data)
+    assert b"".join(backend.open_range(location, 0, len(data))) == data
+    start, end = PART_SIZE - 10, PART_SIZE + 4
+    assert b"".join(backend.open_range(location, start, end)) == data[start:end]
+    assert b"".join(backend.open_range(location, 5, 5)) == b""
+
+
+def test_empty_upload(backend):
+    location = _upload(backend, b"")
+    assert backend.stat(location).size == 0
+
+
+def test_delete(backend):
+    location = _upload(backend, b"hello")
+    assert backend.delete(location) is True
+    assert backend.stat(location) is None
+    assert backend.delete(location) is False
+
+
+def test_part_size_check(backend):
+    total = PART_SIZE * 2
+    target = backend.begin_upload("alice", "upload-2", total)
+    with pytest.raises(InvalidPart):
+        backend.put_part(target, 1, b"x" * PART_SIZE, PART_SIZE, total)
+    with pytest.raises(InvalidPart):
+        backend.put_part(target, 0, b"x" * (PART_SIZE - 1), PART_SIZE, total)
+    # 最後一塊可以較短
+    backend.put_part(target, PART_SIZE, b"x" * 10, PART_SIZE, PART_SIZE + 10)
+
+
+def test_abort_upload(backend):
+    target = backend.begin_upload("alice", "upload-3", 10)
+    backend.put_part(target, 0, b"0123456789", PART_SIZE, 10)
+    assert backend.abort_upload(target) == 10
+    uploads = backend.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", [])
+    assert uploads == []
+
+
+def test_presigned_url(backend):
+    location = _upload(backend, b"hello")
+    url = backend.presigned_url(location, "報告.txt", 60)
+    assert url.startswith("https://") and "uploads/alice/upload-1" in url
+
+
+def test_incomplete_backend_cannot_be_constructed():
+    class ReadOnly(StorageBackend):
+        def owns(self, location):
+            return False
+
+    with pytest.raises(TypeError):
+        ReadOnly()
+
+
+def test_s3_files_stay_readable_after_switching_back_to_local(backend):
+    location = _upload(backend, b"hello")
+    storage = Storage()
+    storage.configure(
+        StorageConfig(BACKEND="local", S3=S3Storage(BUCKET=BUCKET, PREFIX="uploads/")), App()
+    )
+
+    assert storage.default is storage.local
+    assert b"".join(storage.for_location(location).open_range(location, 0, 5)) == b"hello"
+    assert storage.for_location(location).delete(location) is True
+
+
+def test_s3_locations_rejected_without_s3_settings():
+    storage = Storage()
+    storage.configure(StorageConfig(BACKEND="local"), App())
+    with pytest.raises(ValueError):
+        storage.for_location(f"s3://{BUCKET}/uploads/alice/upload-1")
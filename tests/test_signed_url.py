@@ -0,0 +1,101 @@
+"""HMAC 簽章下載網址的驗證與金鑰輪替"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from util import signed_url
+from util.config_schema import SignedURL
+from util.global_variable import global_variable
+from util.signed_url import InvalidSignedURL
+
+SAFE_FILENAME = "0123456789abcdef0123456789abcdef"
+
+
+@pytest.fixture
+def configure(monkeypatch):
+    def configure(keys=None, active="", jwt_secret="jwt-secret"):
+        config = SimpleNamespace(
+            SIGNED_URL=SignedURL(KEYS=keys or {}, ACTIVE_KEY=active),
+            JWT=SimpleNamespace(JWT_SECRET_KEY=jwt_secret),
+        )
+        monkeypatch.setattr(global_variable, "config", config)
+
+    configure()
+    return configure
+
+
+def _sign(**kwargs):
+    return signed_url.sign(file_id=7, owner_id=3, safe_filename=SAFE_FILENAME, **kwargs)
+
+
+def test_round_trip(configure):
+    grant = signed_url.verify(_sign(expires_in=60, range_start=10, range_end=20))
+    assert (grant.file_id, grant.owner_id) == (7, 3)
+    assert (grant.range_start, grant.range_end) == (10, 20)
+    assert grant.file_tag == signed_url.file_tag(SAFE_FILENAME)
+    assert grant.file_tag != signed_url.file_tag("another-file")
+
+
+def test_expired(configure):
+    with pytest.raises(InvalidSignedURL, match="expired"):
+        signed_url.verify(_sign(expires_in=-1))
+
+
+def test_tampered_payload_or_signature(configure):
+    kid, payload, signature = _sign().split(".")
+    other_payload = _sign(range_end=1).split(".")[1]
+    for token in (
+        f"{kid}.{other_payload}.{signature}",
+        f"{kid}.{payload}.{signature[:-2]}AA",
+    ):
+        with pytest.raises(InvalidSignedURL):
+            signed_url.verify(token)
+
+
+@pytest.mark.parametrize("token", ["", "a.b", "0.!!!.AAAA", "unknown.AAAA.AAAA", "0.AAAA.AAAA"])
+def test_malformed(configure, token):
+    with pytest.raises(InvalidSignedURL):
+        signed_url.verify(token)
+
+
+def test_key_rotation(configure):
+    configure(keys={"a": "first-key"}, active="a")
+    old_token = _sign()
+    assert old_token.startswith("a.")
+
+    # 新增 kid b 並設為 active: 新網址使用 b，舊網址仍可驗證
+    configure(keys={"a": "first-key", "b": "second-key"}, active="b")
+    new_token = _sign()
+    assert new_token.startswith("b.")
+    signed_url.verify(old_token)
+    signed_url.verify(new_token)
+
+    # 移除 a 之後舊網址失效
+    configure(keys={"b": "second-key"}, active="b")
+    signed_url.verify(new_token)
+    with pytest.raises(InvalidSignedURL):
+        signed_url.verify(old_token)
+
+
+def test_same_kid_with_a_new_key_invalidates_tokens(configure):
+    configure(keys={"a": "first-key"}, active="a")
+    token = _sign()
+    configure(keys={"a": "replaced"}, active="a")
+    with pytest.raises(InvalidSignedURL):
+        signed_url.verify(token)
+
+
+def test_default_key_is_derived_from_the_jwt_secret(configure):
+    token = _sign()
+    assert token.startswith("0.")
+    configure(jwt_secret="rotated-jwt-secret")
+    with pytest.raises(InvalidSignedURL):
+        signed_url.verify(token)
+
+
+def test_path_signature(configure):
+    signature = signed_url.sign_path(f"{SAFE_FILENAME}/key.jpg")
+    assert signed_url.verify_path(f"{SAFE_FILENAME}/key.jpg", signature)
+    assert not signed_url.verify_path("another-file/key.jpg", signature)
+    assert not signed_url.verify_path(f"{SAFE_FILENAME}/key.jpg", "garbage")
@@ -0,0 +1,158 @@
+"""資料庫任務佇列的領取、重試、lease 延長與過期回收"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from share.model.model import Task
+from util.config_schema import TaskQueue as TaskQueueConfig
+from util.task_queue import FAILED, PENDING, RUNNING, SUCCEEDED, TaskQueue
+
+
+@pytest.fixture
+def queue(session_factory):
+    queue = TaskQueue()
+    queue.configure(
+        TaskQueueConfig(
+            WORKERS=1, POLL_INTERVAL_SECONDS=0.05, LEASE_SECONDS=60, RETRY_DELAY_SECONDS=0
+        )
+    )
+    yield queue
+    queue.stop()
+
+
+def _enqueue(queue, session, kind="test") -> int:
+    task = queue.enqueue(session, kind, payload={"n": 1})
+    session.commit()
+    return task.id
+
+
+def _task(session, task_id) -> Task:
+    session.expire_all()
+    return session.get(Task, task_id)
+
+
+def test_claim_and_execute(queue, session):
+    @queue.handler("test")
+    def handle(session, task):
+        return {"doubled": task.payload["n"] * 2}
+
+    task_id = _enqueue(queue, session)
+    claimed = queue.claim(session, 5)
+    assert claimed == [(task_id, 1)]
+    # 已是 running，不會被重複領取
+    assert queue.claim(session, 5) == []
+
+    queue._running += 1
+    queue._execute(task_id, 1)
+    task = _task(session, task_id)
+    assert task.status == SUCCEEDED
+    assert task.result == {"doubled": 2}
+    assert task.lease_expires_at is None
+
+
+def test_failed_task_is_retried_then_marked_failed(queue, session):
+    @queue.handler("test")
+    def handle(session, task):
+        raise RuntimeError("boom")
+
+    task_id = _enqueue(queue, session)
+    for attempt in range(1, queue.config.MAX_ATTEMPTS + 1):
+        assert queue.claim(session, 1) == [(task_id, attempt)]
+        queue._running += 1
+        queue._execute(task_id, attempt)
+    task = _task(session, task_id)
+    assert task.status == FAILED
+    assert task.error == "boom"
+    assert queue.claim(session, 1) == []
+
+
+def test_stale_claim_cannot_finish_the_new_claim(queue, session):
+    """同一個行程在 lease 過期後重新領取時，舊的執行不會覆寫新的執行"""
+    task_id = _enqueue(queue, session)
+    [(_, first)] = queue.claim(session, 1)
+    _task(session, task_id).lease_expires_at = datetime.now() - timedelta(seconds=1)
+    session.commit()
+    assert queue.recover(session) == 1
+    [(_, second)] = queue.claim(session, 1)
+    assert second == first + 1
+
+    queue._finish(session, task_id, first, {"stale": True})
+    queue._fail(session, task_id, first, "stale")
+    task = _task(session, task_id)
+    assert (task.status, task.result, task.error) == (RUNNING, None, None)
+
+    queue._finish(session, task_id, second, {"fresh": True})
+    assert _task(session, task_id).result == {"fresh": True}
+
+
+def test_recover_requeues_expired_and_fails_exhausted(queue, session):
+    retry_id = _enqueue(queue, session)
+    exhausted_id = _enqueue(queue, session)
+    live_id = _enqueue(queue, session)
+    queue.claim(session, 3)
+    session.expire_all()
+    expired = datetime.now() - timedelta(seconds=1)
+    session.get(Task, retry_id).lease_expires_at = expired
+    exhausted = session.get(Task, exhausted_id)
+    exhausted.lease_expires_at = expired
+    exhausted.attempts = queue.config.MAX_ATTEMPTS
+    session.commit()
+
+    assert queue.recover(session) == 2
+    assert _task(session, retry_id).status == PENDING
+    assert _task(session, exhausted_id).status == FAILED
+    assert _task(session, live_id).status == RUNNING
+
+
+def test_renew_leases_extends_only_owned_claims(queue, session):
+    task_id = _enqueue(queue, session)
+    [(_, attempts)] = queue.claim(session, 1)
+    soon = datetime.now() + timedelta(seconds=1)
+    _task(session, task_id).lease_expires_at = soon
+    session.commit()
+
+    queue._held[task_id] = attempts
+    queue._renew_leases()
+    assert _task(session, task_id).lease_expires_at > soon + timedelta(seconds=30)
+
+    # 已被重新領取 (attempts 不同) 的任務不延長
+    queue._held[task_id] = attempts - 1
+    queue._renewed_at = 0.0
+    renewed = _task(session, task_id).lease_expires_at
+    queue._renew_leases()
+    assert _task(session, task_id).lease_expires_at == renewed
+
+
+def test_long_task_is_not_recovered_while_running(session_factory, session):
+    """執行時間超過 LEASE_SECONDS 的任務由輪詢執行緒延長 lease，不會被重新排入佇列"""
+    queue = TaskQueue()
+    queue.configure(TaskQueueConfig(WORKERS=1, POLL_INTERVAL_SECONDS=0.05, LEASE_SECONDS=1))
+    runs = []
+    done = threading.Event()
+
+    @queue.handler("slow")
+    def handle(session, task):
+        runs.append(task.attempts)
+        time.sleep(2.5)
+        done.set()
+        return {}
+
+    task_id = _enqueue(queue, session, "slow")
+    queue.start()
+    try:
+        while not done.is_set():
+            with session_factory() as other:
+                queue.recover(other)
+            time.sleep(0.2)
+        for _ in range(50):
+            if _task(session, task_id).status == SUCCEEDED:
+                break
+            time.sleep(0.05)
+    finally:
+        queue.stop()
+
+    assert runs == [1]
+    assert _task(session, task_id).status == SUCCEEDED
@@ -0,0 +1,143 @@
+"""軟刪除、復原與背景回收"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.exceptions import Conflict, Forbidden
+
+from share.model.model import File, User
+from util.config_schema import Trash as TrashConfig
+from util.trash import REAP_MARGIN_SECONDS, TRASH_DIR, Trash
+
+DATA = b"0123456789" * 100
+
+
+@pytest.fixture
+def trash():
+    trash = Trash()
+    trash.configure(
+        TrashConfig(UNDO_SECONDS=600, UNLINK_BYTES_PER_SECOND=0, TRUNCATE_STEP_BYTES=256)
+    )
+    return trash
+
+
+@pytest.fixture
+def owner(session, make_user):
+    """已有一個檔案計入配額的使用者"""
+    user_id = make_user(file_limit=1, storage_bytes_limit=len(DATA))
+    user = session.get(User, user_id)
+    user.file_count, user.storage_bytes = 1, len(DATA)
+    session.commit()
+    return user_id
+
+
+@pytest.fixture
+def stored(tmp_path, make_file, owner):
+    path = tmp_path / "alice" / "abcdef.bin"
+    path.parent.mkdir()
+    path.write_bytes(DATA)
+    return make_file(str(path), len(DATA), owner_id=owner)
+
+
+def _counters(session, user_id):
+    session.expire_all()
+    user = session.get(User, user_id)
+    return user.file_count, user.storage_bytes
+
+
+def test_soft_delete_moves_to_trash_and_releases_quota(trash, session, stored, owner):
+    original = stored.storage_path
+    moved = trash.soft_delete(session, stored)
+    session.commit()
+
+    assert moved == (original, stored.storage_path)
+    assert not os.path.exists(original)
+    assert os.path.dirname(stored.storage_path).endswith(TRASH_DIR)
+    assert stored.deleted_from == original
+    assert _counters(session, owner) == (0, 0)
+
+
+def test_revert_moves_the_file_back(trash, session, stored):
+    original = stored.storage_path
+    moved = trash.soft_delete(session, stored)
+    session.rollback()
+    trash.revert(moved)
+    assert open(original, "rb").read() == DATA
+
+
+def test_restore_within_undo_window(trash, session, stored, owner):
+    original = stored.storage_path
+    trash.soft_delete(session, stored)
+    session.commit()
+
+    assert trash.can_restore(stored)
+    trash.restore(session, stored)
+    session.commit()
+
+    session.expire_all()
+    record = session.get(File, stored.id)
+    assert (record.storage_path, record.deleted_at, record.deleted_from) == (original, None, None)
+    assert open(original, "rb").read() == DATA
+    assert _counters(session, owner) == (1, len(DATA))
+
+    # 已復原的檔案不能再復原一次
+    with pytest.raises(Conflict):
+        trash.restore(session, record)
+
+
+def test_restore_is_refused_when_quota_is_full(trash, session, stored, owner):
+    trash.soft_delete(session, stored)
+    session.commit()
+    # 刪除後使用者又上傳了一個檔案，配額已滿
+    session.get(User, owner).file_count = 1
+    session.commit()
+
+    with pytest.raises(Forbidden):
+        trash.restore(session, stored)
+    session.rollback()
+    session.expire_all()
+    assert session.get(File, stored.id).deleted_at is not None
+
+
+def test_restore_window_expires(trash, session, stored):
+    trash.soft_delete(session, stored)
+    stored.deleted_at = datetime.now() - timedelta(seconds=601)
+    session.commit()
+    assert not trash.can_restore(stored)
+
+
+def test_reap_removes_expired_files_only(trash, session, tmp_path, make_file, stored):
+    recent_path = tmp_path / "recent.bin"
+    recent_path.write_bytes(DATA)
+    recent = make_file(str(recent_path), len(DATA))
+    for record in (stored, recent):
+        trash.soft_delete(session, record, release_quota=False)
+    session.commit()
+    trash_path, recent_trash_path = stored.storage_path, recent.storage_path
+    stored_id, recent_id = stored.id, recent.id
+    stored.deleted_at = datetime.now() - timedelta(seconds=600 + REAP_MARGIN_SECONDS + 1)
+    session.commit()
+
+    assert trash.reap(session) == {"reaped": 1}
+    assert not os.path.exists(trash_path)
+    assert os.path.exists(recent_trash_path)
+    session.expire_all()
+    assert session.get(File, stored_id) is None
+    assert session.get(File, recent_id) is not None
+    assert trash.reap(session) == {"reaped": 0}
+
+
+def test_reap_skips_files_that_fail(trash, session, make_file, monkeypatch):
+    from util import file_ops
+
+    record = make_file("/nonexistent/dir/a.bin", 10, deleted_at=datetime(2000, 1, 1))
+
+    def fail(*args, **kwargs):
+        raise PermissionError("read-only")
+
+    monkeypatch.setattr(file_ops, "throttled_unlink", fail)
+    assert trash.reap(session) == {"reaped": 0}
+    assert record.id in trash._failed_ids
+    session.expire_all()
+    assert session.get(File, record.id) is not None
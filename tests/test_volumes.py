@@ -0,0 +1,121 @@
+"""VolumeManager 的重新平衡搬移與延後刪除"""
+
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from share.model.model import File
+from util import file_ops
+from util.config_schema import Rebalance
+from util.volumes import VolumeManager
+
+DATA = b"payload" * 100
+
+
+@pytest.fixture
+def volumes(tmp_path):
+    config = SimpleNamespace(
+        path=None,
+        volumes=[{"path": str(tmp_path / "v1")}, {"path": str(tmp_path / "v2")}],
+        placement="headroom",
+        layout="sharded",
+        min_free_bytes=0,
+        statvfs_cache_seconds=0,
+    )
+    managers = []
+    for _ in range(2):
+        manager = VolumeManager()
+        manager.configure(config)
+        managers.append(manager)
+    return managers, tmp_path / "v1", tmp_path / "v2"
+
+
+@pytest.fixture
+def stored(volumes, make_file):
+    _, source, _ = volumes
+    path = source / "alice" / "ab" / "cd" / "abcdef.txt"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(DATA)
+    return make_file(str(path), len(DATA))
+
+
+def _move(manager, session, record, target, config):
+    new_path = str(target / "alice" / "ab" / "cd" / "abcdef.txt")
+    return manager._move(session, record, new_path, None, config)
+
+
+def _storage_path(session, file_id):
+    session.expire_all()
+    return session.get(File, file_id).storage_path
+
+
+def test_move_keeps_extension_and_shard_prefix(volumes, session, stored):
+    (manager, _), _, target = volumes
+    assert _move(manager, session, stored, target, Rebalance())
+
+    moved = _storage_path(session, stored.id)
+    name = os.path.basename(moved)
+    assert moved.startswith(str(target / "alice" / "ab" / "cd"))
+    assert name.startswith("abcdef~") and name.endswith(".txt")
+    assert open(moved, "rb").read() == DATA
+    assert manager._moved_name(name, "0000") == "abcdef~0000.txt"
+
+
+def test_concurrent_move_is_claimed_by_one_worker(volumes, session_factory, stored, monkeypatch):
+    """第一個行程複製時，第二個行程取不到租約，不會產生或刪除任何檔案"""
+    (first, second), _, target = volumes
+    copy = file_ops.throttled_copy
+    results = []
+
+    def racing_copy(src, dst, bucket=None):
+        with session_factory() as other:
+            results.append(_move(second, other, stored, target, Rebalance()))
+        copy(src, dst, bucket)
+
+    monkeypatch.setattr(file_ops, "throttled_copy", racing_copy)
+    with session_factory() as session:
+        assert _move(first, session, stored, target, Rebalance())
+        moved = _storage_path(session, stored.id)
+
+    assert results == [False]
+    assert open(moved, "rb").read() == DATA
+    assert os.listdir(os.path.dirname(moved)) == [os.path.basename(moved)]
+
+
+def test_stale_worker_does_not_remove_winning_copy(volumes, session_factory, stored, monkeypatch):
+    """租約過期後其他行程完成搬移，原本的行程放棄時只刪除自己的複本"""
+    (first, second), _, target = volumes
+    copy = file_ops.throttled_copy
+    expired = Rebalance(LEASE_SECONDS=-1)
+
+    def slow_copy(src, dst, bucket=None):
+        monkeypatch.setattr(file_ops, "throttled_copy", copy)
+        with session_factory() as other:
+            assert _move(second, other, stored, target, Rebalance())
+        copy(src, dst, bucket)
+
+    monkeypatch.setattr(file_ops, "throttled_copy", slow_copy)
+    with session_factory() as session:
+        assert not _move(first, session, stored, target, expired)
+        winner = _storage_path(session, stored.id)
+        assert session.get(File, stored.id).moving_until is None
+
+    assert open(winner, "rb").read() == DATA
+    assert os.listdir(os.path.dirname(winner)) == [os.path.basename(winner)]
+
+
+def test_pending_delete_survives_restart(volumes, tmp_path):
+    (first, second), source, _ = volumes
+    old = source / "old.bin"
+    old.parent.mkdir(parents=True, exist_ok=True)
+    old.write_bytes(DATA)
+
+    first.schedule_delete(str(old), grace_seconds=3600)
+    second.delete_due()
+    assert old.exists()
+    assert second.stats()["pending_deletes"] == 1
+
+    second.delete_due(force=True)
+    assert not old.exists()
+    assert first.stats()["pending_deletes"] == 0
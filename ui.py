@@ -228,6 +228,7 @@ def page_file_list():
     if response and response.status_code == 200:
         data = response.json()
         files = data.get("files", [])
+        download_url_prefix = data.get("download_url_prefix") or ""
         stats = data.get("stats", {})
         limits = data.get("limits", {})
 
@@ -292,6 +293,15 @@ def page_file_list():
                     share_token = f.get("share_token")
                     with col1:
                         st.write(f["filename"])
+                        # 預覽由瀏覽器直接向 API 取得 (可長期快取)，不需下載整個檔案
+                        preview_url = f.get("preview_url")
+                        if preview_url and ".jpg?" in preview_url:
+                            st.markdown(
+                                f'<img src="{preview_url}" style="max-height:64px;">',
+                                unsafe_allow_html=True,
+                            )
+                        elif preview_url:
+                            st.markdown(f"[預覽]({preview_url})")
                     with col2:
                         st.write(f["size_bytes"])
                     with col3:
@@ -308,7 +318,7 @@ def page_file_list():
                         )
                     with col5:
                         placeholder = st.empty()
-                        download_url = f["download_url"]
+                        download_url = download_url_prefix + f["safe_filename"]
                         placeholder.markdown(
                             f"""
                             <div style="text-align:center; padding-top:0px;">
@@ -0,0 +1,159 @@
+"""
+傳輸類請求的准入控制 (同時連線數限制與快速拒絕)。
+
+- 個人超過上限: 立即回傳 429 Too Many Requests
+- 全域超過上限: 進入有上限的等待佇列，等待逾時或佇列已滿時回傳 503 Service Unavailable
+兩者都帶有 Retry-After header，讓客戶端稍後重試，而不是讓所有請求一起逾時。
+"""
+
+import threading
+import time
+from functools import wraps
+
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from werkzeug.wsgi import ClosingIterator
+
+from util.global_variable import global_variable
+
+UPLOAD_INIT = "upload_init"
+UPLOAD_CHUNK = "upload_chunk"
+DOWNLOAD = "download"
+
+
+class AdmissionController:
+    """依傳輸種類 (kind) 分別計算全域與個人的同時請求數"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._active = {}  # kind -> 目前數量
+        self._active_by_user = {}  # (kind, identity) -> 目前數量
+        self._waiting = {}  # kind -> 佇列中的數量
+        self._stats = {"admitted": 0, "queued": 0, "rejected_429": 0, "rejected_503": 0}
+
+    @property
+    def config(self):
+        return global_variable.config.ADMISSION
+
+    def acquire(self, kind: str, identity: str):
+        """取得一個名額，回傳釋放用的函式；無法取得時拋出 429 / 503"""
+        config = self.config
+        global_limit = config.GLOBAL_LIMITS.get(kind, 0)
+        user_limit = config.PER_USER_LIMITS.get(kind, 0)
+        user_key = (kind, identity)
+
+        with self._cond:
+            self._check_user_limit(kind, user_key, user_limit)
+
+            if global_limit > 0 and self._active.get(kind, 0) >= global_limit:
+                if self._waiting.get(kind, 0) >= config.QUEUE_SIZE:
+                    self._reject_busy(kind)
+                self._waiting[kind] = self._waiting.get(kind, 0) + 1
+                self._stats["queued"] += 1
+                deadline = time.monotonic() + config.QUEUE_TIMEOUT_SECONDS
+                try:
+                    while self._active.get(kind, 0) >= global_limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject_busy(kind)
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting[kind] -= 1
+                # 同一使用者的多個請求可能同時在佇列中等待，取得全域名額後需再次檢查個人上限
+                self._check_user_limit(kind, user_key, user_limit)
+
+            self._active[kind] = self._active.get(kind, 0) + 1
+            self._active_by_user[user_key] = self._active_by_user.get(user_key, 0) + 1
+            self._stats["admitted"] += 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            with self._cond:
+                if released:
+                    return
+                released = True
+                self._active[kind] -= 1
+                count = self._active_by_user[user_key] - 1
+                if count:
+                    self._active_by_user[user_key] = count
+                else:
+                    del self._active_by_user[user_key]
+                # 不同 kind 共用同一個 Condition，需喚醒全部等待者各自檢查
+                self._cond.notify_all()
+
+        return release
+
+    def _check_user_limit(self, kind: str, user_key: tuple, user_limit: int):
+        if user_limit > 0 and self._active_by_user.get(user_key, 0) >= user_limit:
+            self._stats["rejected_429"] += 1
+            raise TooManyRequests(
+                f"Too many concurrent {kind} requests for this user.",
+                retry_after=self.config.RETRY_AFTER_SECONDS,
+            )
+
+    def _reject_busy(self, kind: str):
+        self._stats["rejected_503"] += 1
+        raise ServiceUnavailable(
+            f"Server is busy with {kind} requests.",
+            retry_after=self.config.RETRY_AFTER_SECONDS,
+        )
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                **self._stats,
+                "active": dict(self._active),
+                "queue_depth": dict(self._waiting),
+            }
+
+
+admission_controller = AdmissionController()
+
+
+def _current_identity() -> str:
+    """已登入時以帳號區分，公開 API 則以來源 IP 區分"""
+    try:
+        account = get_jwt_identity()
+    except RuntimeError:
+        account = None
+    return account if account else f"ip:{request.remote_addr}"
+
+
+def admission_control(kind: str):
+    """
+    一個裝飾器，限制該 API 的同時請求數。
+    回傳串流 Response (例如檔案下載) 時，名額會保留到回應傳送完畢才釋放。
+
+    用法 (放在 permission_required 之後，才能取得登入帳號):
+    @permission_required("file:upload")
+    @admission_control(UPLOAD_CHUNK)
+    def upload_chunk(...):
+        ...
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not admission_controller.config.ENABLED:
+                return fn(*args, **kwargs)
+
+            release = admission_controller.acquire(kind, _current_identity())
+            try:
+                rv = fn(*args, **kwargs)
+            except BaseException:
+                release()
+                raise
+            if isinstance(rv, Response) and rv.is_streamed:
+                # send_file 的回應為 direct_passthrough，WSGI server 只會關閉 rv.response，
+                # 因此把釋放函式掛在 rv.response 的 close 上
+                rv.response = ClosingIterator(rv.response, release)
+            else:
+                release()
+            return rv
+
+        return wrapper
+
+    return decorator
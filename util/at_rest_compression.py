@@ -0,0 +1,295 @@
+"""
+靜態檔案的透明壓縮 (需另外安裝 zstandard)。
+
+背景任務會先抽樣評估每個本機檔案的可壓縮程度，
+壓縮比達到 MIN_RATIO 的檔案改寫為 zstd seekable format:
+- 原始內容切成固定大小 (FRAME_SIZE) 的區塊，各自壓縮成獨立的 zstd frame
+- 檔案結尾附上 seek table (放在 skippable frame 中，一般的 zstd 解碼器會略過)
+因此:
+- 整個檔案仍是合法的 zstd 資料，Accept-Encoding 含 zstd 的用戶端可直接收到壓縮後的內容
+- Range 下載只需解壓縮涵蓋該範圍的 frame
+
+壓縮後的檔案以 COMPRESSED_SUFFIX 結尾 (上傳檔名的副檔名只會有一個 '.'，不會撞名)，
+每個檔案的壓縮後大小與花費的 CPU 時間記錄在 File.stored_size / File.compression_cpu_ms。
+"""
+
+import bisect
+import os
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import select, update
+
+from share.model.model import File
+from util import file_ops
+
+try:
+    import zstandard
+except ImportError:  # zstandard 為選用套件
+    zstandard = None
+
+COMPRESSED_SUFFIX = ".seekable.zst"
+ZSTD = "zstd"
+NOT_COMPRESSED = "none"
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC = 0x8F92EAB1
+FOOTER = struct.Struct("<IBI")  # Number_Of_Frames, Seek_Table_Descriptor, Seekable_Magic_Number
+ENTRY = struct.Struct("<II")  # Compressed_Size, Decompressed_Size
+
+
+def is_compressed(location: str) -> bool:
+    return location.endswith(COMPRESSED_SUFFIX)
+
+
+@dataclass(frozen=True)
+class SeekTable:
+    compressed_offsets: list[int]  # 每個 frame 在檔案中的起點，最後一個元素為 frame 資料的結尾
+    raw_offsets: list[int]  # 每個 frame 在原始內容中的起點，最後一個元素為原始大小
+
+    @property
+    def raw_size(self) -> int:
+        return self.raw_offsets[-1]
+
+
+_seek_tables: OrderedDict = OrderedDict()
+_seek_tables_lock = threading.Lock()
+SEEK_TABLE_CACHE_SIZE = 1024
+
+
+def read_seek_table(path: str) -> SeekTable:
+    """讀取 (並快取) 檔案結尾的 seek table"""
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _seek_tables_lock:
+        table = _seek_tables.get(key)
+        if table is not None:
+            _seek_tables.move_to_end(key)
+            return table
+
+    with open(path, "rb") as f:
+        f.seek(-FOOTER.size, os.SEEK_END)
+        count, descriptor, magic = FOOTER.unpack(f.read(FOOTER.size))
+        if magic != SEEKABLE_MAGIC or descriptor & 0x80:
+            raise ValueError(f"{path} is not a seekable zstd file.")
+        f.seek(-(FOOTER.size + count * ENTRY.size), os.SEEK_END)
+        entries = f.read(count * ENTRY.size)
+
+    compressed_offsets, raw_offsets = [0], [0]
+    for compressed_size, raw_size in ENTRY.iter_unpack(entries):
+        compressed_offsets.append(compressed_offsets[-1] + compressed_size)
+        raw_offsets.append(raw_offsets[-1] + raw_size)
+    table = SeekTable(compressed_offsets, raw_offsets)
+
+    with _seek_tables_lock:
+        _seek_tables[key] = table
+        while len(_seek_tables) > SEEK_TABLE_CACHE_SIZE:
+            _seek_tables.popitem(last=False)
+    return table
+
+
+def open_range(path: str, start: int, end: int):
+    """解壓縮並逐塊回傳原始內容的 [start, end)，只讀取涵蓋該範圍的 frame"""
+    table = read_seek_table(path)
+    end = min(end, table.raw_size)
+    if start >= end:
+        return
+    decompressor = zstandard.ZstdDecompressor()
+    index = bisect.bisect_right(table.raw_offsets, start) - 1
+    with open(path, "rb") as f:
+        f.seek(table.compressed_offsets[index])
+        while start < end:
+            frame_start = table.raw_offsets[index]
+            frame_size = table.raw_offsets[index + 1] - frame_start
+            frame = f.read(table.compressed_offsets[index + 1] - table.compressed_offsets[index])
+            data = decompressor.decompress(frame, max_output_size=frame_size)
+            chunk = data[start - frame_start : end - frame_start]
+            start += len(chunk)
+            index += 1
+            yield chunk
+
+
+def compress_file(src: str, dst: str, level: int, frame_size: int):
+    """將 src 壓縮為 seekable format 寫入 dst，完成後 fdatasync"""
+    compressor = zstandard.ZstdCompressor(level=level, write_content_size=True)
+    entries = []
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        while True:
+            data = fsrc.read(frame_size)
+            if not data:
+                break
+            frame = compressor.compress(data)
+            fdst.write(frame)
+            entries.append(ENTRY.pack(len(frame), len(data)))
+        seek_table = b"".join(entries) + FOOTER.pack(len(entries), 0, SEEKABLE_MAGIC)
+        fdst.write(struct.pack("<II", SKIPPABLE_MAGIC, len(seek_table)))
+        fdst.write(seek_table)
+        fdst.flush()
+        file_ops.datasync(fdst.fileno())
+
+
+def sample_ratio(path: str, size: int, sample_size: int, samples: int, level: int) -> float:
+    """由檔案中平均分布的幾個區段估計壓縮比 (原始大小 / 壓縮後大小)"""
+    compressor = zstandard.ZstdCompressor(level=level)
+    raw = compressed = 0
+    step = max((size - sample_size) // max(samples - 1, 1), 1)
+    with open(path, "rb") as f:
+        for i in range(samples):
+            f.seek(min(i * step, max(size - sample_size, 0)))
+            data = f.read(sample_size)
+            if not data:
+                break
+            raw += len(data)
+            compressed += len(compressor.compress(data))
+            if size <= sample_size:
+                break
+    return raw / compressed if compressed else 0.0
+
+
+class AtRestCompressor:
+    """背景壓縮本機的可壓縮檔案"""
+
+    def __init__(self):
+        self.config = None
+        self._failed_ids = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "compressed_files": 0,
+            "skipped_files": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+            "cpu_seconds": 0.0,
+        }
+
+    def configure(self, config):
+        self.config = config
+        if config.ENABLED and zstandard is None:
+            print("Warning: AT_REST_COMPRESSION requires the zstandard package, disabled.")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config and self.config.ENABLED and zstandard is not None)
+
+    @property
+    def serve_compressed(self) -> bool:
+        return bool(self.config and self.config.SERVE_COMPRESSED)
+
+    def run(self, session) -> dict:
+        """處理一批尚未評估的檔案，回傳本批的統計"""
+        from util.volumes import invalidate_file_caches, volume_manager
+
+        config = self.config
+        result = {"compressed": 0, "skipped": 0}
+        records = session.execute(
+            select(File.id, File.storage_path, File.file_size)
+            .where(
+                File.compression.is_(None),
+                File.deleted_at.is_(None),
+                File.file_size >= config.MIN_SIZE,
+                File.storage_path.notlike("%://%"),
+                File.id.notin_(self._failed_ids),
+            )
+            .order_by(File.id)
+            .limit(config.BATCH_SIZE)
+        ).all()
+
+        for record in records:
+            old_path = volume_manager.resolve(record.storage_path)
+            started = time.thread_time()
+            try:
+                ratio = sample_ratio(
+                    old_path, record.file_size, config.SAMPLE_SIZE, config.SAMPLE_COUNT, config.LEVEL
+                )
+            except OSError as e:
+                print(f"    - Warning: cannot sample {old_path}: {e}")
+                self._failed_ids.add(record.id)
+                continue
+
+            if ratio < config.MIN_RATIO:
+                cpu_ms = int((time.thread_time() - started) * 1000)
+                self._mark(session, record, NOT_COMPRESSED, record.file_size, cpu_ms)
+                result["skipped"] += 1
+                continue
+
+            new_path = old_path + COMPRESSED_SUFFIX
+            directory, name = os.path.split(new_path)
+            # 每個行程都會執行壓縮排程，暫存檔名需各自不同，避免同時寫入同一個暫存檔
+            partial = file_ops.hidden_temp_path(directory, f"{name}.{secrets.token_hex(4)}")
+            try:
+                compress_file(old_path, partial, config.LEVEL, config.FRAME_SIZE)
+                stored_size = os.path.getsize(partial)
+                os.replace(partial, new_path)
+                file_ops.fsync_directory(directory)
+            except OSError as e:
+                print(f"    - Warning: failed to compress {old_path}: {e}")
+                self._failed_ids.add(record.id)
+                if os.path.exists(partial):
+                    os.remove(partial)
+                continue
+            cpu_ms = int((time.thread_time() - started) * 1000)
+
+            # 條件式 UPDATE: 壓縮期間檔案被刪除或搬走時放棄
+            updated = session.execute(
+                update(File)
+                .where(File.id == record.id, File.storage_path == record.storage_path)
+                .values(
+                    storage_path=new_path,
+                    compression=ZSTD,
+                    stored_size=stored_size,
+                    compression_cpu_ms=cpu_ms,
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            if updated != 1:
+                # 其他行程已壓縮同一個檔案並提交時，new_path 就是目前使用中的檔案，不可刪除
+                current = session.execute(
+                    select(File.storage_path).where(File.id == record.id)
+                ).scalar()
+                if current != new_path:
+                    try:
+                        os.remove(new_path)
+                    except FileNotFoundError:
+                        pass
+                continue
+
+            invalidate_file_caches(session, record.id, record.storage_path)
+            volume_manager.schedule_delete(old_path, config.DELETE_GRACE_SECONDS)
+            result["compressed"] += 1
+            with self._lock:
+                self._stats["compressed_files"] += 1
+                self._stats["raw_bytes"] += record.file_size
+                self._stats["stored_bytes"] += stored_size
+                self._stats["cpu_seconds"] += cpu_ms / 1000
+            print(
+                f"    - Compressed file {record.id}: {record.file_size} -> {stored_size} bytes "
+                f"({cpu_ms} ms CPU)"
+            )
+        return result
+
+    def _mark(self, session, record, compression: str, stored_size: int, cpu_ms: int):
+        session.execute(
+            update(File)
+            .where(File.id == record.id, File.storage_path == record.storage_path)
+            .values(compression=compression, stored_size=stored_size, compression_cpu_ms=cpu_ms)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        with self._lock:
+            self._stats["skipped_files"] += 1
+            self._stats["cpu_seconds"] += cpu_ms / 1000
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["cpu_seconds"] = round(stats["cpu_seconds"], 3)
+        stats["saved_bytes"] = stats["raw_bytes"] - stats["stored_bytes"]
+        stats["enabled"] = self.enabled
+        return stats
+
+
+at_rest_compressor = AtRestCompressor()
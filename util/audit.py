@@ -0,0 +1,131 @@
+import threading
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import insert
+
+from share.define.model_enum import AuditAction
+from share.model.log_model import AuditLog
+from util.db import get_db_session
+
+
+class AuditWriter:
+    """
+    操作日誌的批次寫入器。
+
+    請求執行緒只把事件放進記憶體緩衝 (一次 list.append)，
+    由背景執行緒在筆數或時間門檻到達時，以一次 bulk insert 寫入 log_db，
+    避免每個請求都多一次資料庫 commit。
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self.enabled = False
+        self.db_name = "log_db"
+        self.flush_size = 200
+        self.flush_interval = 2.0
+        self.max_buffer = 50000
+        self.dropped = 0
+
+    def start(self, audit_config):
+        """依設定啟動背景寫入執行緒"""
+        self.enabled = audit_config.ENABLED
+        self.db_name = audit_config.DB_NAME
+        self.flush_size = max(1, audit_config.FLUSH_SIZE)
+        self.flush_interval = max(0.1, audit_config.FLUSH_INTERVAL_SECONDS)
+        self.max_buffer = max(self.flush_size, audit_config.MAX_BUFFER)
+        if not self.enabled or self._thread is not None:
+            return
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run, name="audit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止背景執行緒並寫入剩餘的紀錄"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    def record(
+        self,
+        action: AuditAction,
+        account: str | None = None,
+        target: str | None = None,
+        detail: str | None = None,
+        success: bool = True,
+    ):
+        """記錄一筆操作事件 (只寫入記憶體緩衝)"""
+        if not self.enabled:
+            return
+
+        entry = {
+            "createTime": datetime.now(),
+            "action": action.value,
+            "account": account,
+            "target": target,
+            "success": success,
+            "ip": request.remote_addr if has_request_context() else None,
+            "detail": detail[:1000] if detail else detail,
+        }
+        with self._lock:
+            self._buffer.append(entry)
+            size = len(self._buffer)
+            if size > self.max_buffer:
+                overflow = size - self.max_buffer
+                del self._buffer[:overflow]
+                self.dropped += overflow
+
+        if size >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """把目前緩衝中的紀錄一次寫入資料庫"""
+        with self._lock:
+            if not self._buffer:
+                return 0
+            batch, self._buffer = self._buffer, []
+
+        try:
+            with get_db_session(self.db_name) as db:
+                db.execute(insert(AuditLog), batch)
+                db.commit()
+        except Exception as e:
+            print(f"寫入操作日誌失敗 ({len(batch)} 筆): {e}")
+            # 放回緩衝等待下次重試，超過上限的部分在下次 record 時丟棄
+            with self._lock:
+                self._buffer[:0] = batch
+            return 0
+        return len(batch)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+audit_writer = AuditWriter()
+
+
+def audit(
+    action: AuditAction,
+    account: str | None = None,
+    target: str | None = None,
+    detail: str | None = None,
+    success: bool = True,
+):
+    """記錄一筆操作日誌的捷徑函式"""
+    audit_writer.record(
+        action, account=account, target=target, detail=detail, success=success
+    )
@@ -4,9 +4,13 @@ from typing import Set
 from flask import abort
 from flask_jwt_extended import get_jwt_identity, jwt_required
 
+from util.cache import LRUCache
 from util.db import get_db_session
 from share.model.model import User
 
+# 帳號 -> 最高權限角色的 level，給頻寬限制等高頻率查詢使用
+_user_level_cache = LRUCache(maxsize=10000, ttl=60)
+
 
 def get_user_permissions(user_account: str) -> Set[str]:
     """
@@ -30,6 +34,20 @@ def get_user_permissions(user_account: str) -> Set[str]:
         return permissions_set
 
 
+def get_user_level(user_account: str) -> int | None:
+    """取得使用者最高權限角色的 level (數字越小權限越高)，結果快取 60 秒"""
+    level = _user_level_cache.get(user_account)
+    if level is not None:
+        return level
+    with get_db_session() as db:
+        user = db.query(User).filter(User.account == user_account).first()
+        if not user or not user.roles:
+            return None
+        level = min(role.level for role in user.roles)
+    _user_level_cache.set(user_account, level)
+    return level
+
+
 def permission_required(*required_perms: str):
     """
     一個裝飾器，用來檢查當前使用者是否擁有所有必要的權限。
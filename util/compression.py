@@ -0,0 +1,180 @@
+"""
+API 回應壓縮 (WSGI middleware)。
+
+依 Accept-Encoding 協商 br / zstd / gzip，只壓縮 JSON 等文字型回應，
+且逐塊壓縮後立即輸出，不會把整個回應緩衝在記憶體中。
+以下情況不壓縮:
+- 檔案下載 (帶有 Content-Disposition)、Range 請求與 206 回應
+- 已經有 Content-Encoding 的回應
+- 已知大小且小於 MIN_SIZE 的回應
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli 為選用套件
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard 為選用套件
+    zstandard = None
+
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self, level: int):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+def available_encoders() -> dict:
+    """回傳目前環境可用的編碼 -> (encoder 類別, 設定檔中的等級欄位)"""
+    encoders = {"gzip": (_GzipEncoder, "GZIP_LEVEL")}
+    if brotli is not None:
+        encoders["br"] = (_BrotliEncoder, "BROTLI_LEVEL")
+    if zstandard is not None:
+        encoders["zstd"] = (_ZstdEncoder, "ZSTD_LEVEL")
+    return encoders
+
+
+def negotiate_encoding(accept_encoding: str, preference: list[str]) -> str | None:
+    """
+    依 Accept-Encoding 的 q 值選出編碼，q 值相同時以 preference 的順序為準。
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[name] = q
+
+    best, best_q = None, 0.0
+    for encoding in preference:
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def add_vary(headers: list, field: str) -> list:
+    """將 field 合併進既有的 Vary 標頭 (已包含或為 * 時不變)，沒有 Vary 時新增一個"""
+    for i, (key, value) in enumerate(headers):
+        if key.lower() != "vary":
+            continue
+        values = [v.strip().lower() for v in value.split(",")]
+        if field.lower() not in values and "*" not in values:
+            headers[i] = (key, f"{value}, {field}" if value.strip() else field)
+        return headers
+    headers.append(("Vary", field))
+    return headers
+
+
+class CompressionMiddleware:
+    """包裝 Flask 的 wsgi_app，對符合條件的回應做串流壓縮"""
+
+    def __init__(self, wsgi_app, compression_config):
+        self.wsgi_app = wsgi_app
+        self.config = compression_config
+        encoders = available_encoders()
+        self.encoders = {
+            name: (cls, getattr(compression_config, level_field))
+            for name, (cls, level_field) in encoders.items()
+        }
+        self.preference = [
+            name for name in compression_config.ALGORITHMS if name in self.encoders
+        ]
+        self.mimetypes = set(compression_config.MIMETYPES)
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "HEAD" or "HTTP_RANGE" in environ:
+            return self.wsgi_app(environ, start_response)
+        encoding = negotiate_encoding(
+            environ.get("HTTP_ACCEPT_ENCODING", ""), self.preference
+        )
+        if encoding is None:
+            return self.wsgi_app(environ, start_response)
+
+        state = {"compress": False}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            if self._should_compress(status, headers):
+                state["compress"] = True
+                headers = [
+                    (k, v) for k, v in headers if k.lower() != "content-length"
+                ]
+                headers.append(("Content-Encoding", encoding))
+                headers = add_vary(headers, "Accept-Encoding")
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.wsgi_app(environ, compressing_start_response)
+        if not state["compress"]:
+            return app_iter
+        encoder_cls, level = self.encoders[encoding]
+        return self._stream(app_iter, encoder_cls(level))
+
+    def _should_compress(self, status: str, headers: list) -> bool:
+        if not status.startswith("200"):
+            return False
+        content_type = ""
+        for key, value in headers:
+            key = key.lower()
+            if key in ("content-encoding", "content-range", "content-disposition"):
+                return False
+            if key == "content-type":
+                content_type = value.split(";", 1)[0].strip().lower()
+            elif key == "content-length":
+                try:
+                    if int(value) < self.config.MIN_SIZE:
+                        return False
+                except ValueError:
+                    return False
+        return content_type in self.mimetypes
+
+    @staticmethod
+    def _stream(app_iter, encoder):
+        try:
+            for chunk in app_iter:
+                data = encoder.compress(chunk)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
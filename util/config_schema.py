@@ -1,6 +1,6 @@
 """設定檔相關"""
 from pydantic import BaseModel, Field
-from typing import Optional, Dict  # Import Dict
+from typing import Optional, Dict, Literal  # Import Dict
 
 
 class OpenApiInfo(BaseModel):
@@ -43,10 +43,49 @@ class Database(BaseModel):
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///project.db"
 
 
+class Volume(BaseModel):
+    """一個儲存磁碟區"""
+
+    path: str = Field(..., description="磁碟區根目錄，使用者資料夾建立於其下")
+    weight: float = Field(1.0, gt=0, description="權重，越大分配到越多檔案")
+    draining: bool = Field(False, description="不再放置新檔案，重新平衡時優先搬出")
+
+
+class Rebalance(BaseModel):
+    """磁碟區間的背景重新平衡"""
+
+    ENABLED: bool = False
+    THRESHOLD: float = Field(
+        0.1, description="使用率 (依權重調整後) 最高與最低的差距超過此值才搬移"
+    )
+    MAX_BYTES_PER_RUN: int = Field(10 * 1024**3, description="每次最多搬移的位元組數")
+    MAX_BYTES_PER_SECOND: int = Field(50 * 1024**2, description="搬移時的 I/O 速度上限")
+    DELETE_GRACE_SECONDS: float = Field(
+        180, description="搬移後舊檔保留的時間，讓仍持有舊路徑的讀取 (或其他行程的快取) 完成"
+    )
+    LEASE_SECONDS: int = Field(
+        3600, description="搬移一個檔案的租約期限，超過仍未完成視為行程中斷，其他行程可重新搬移"
+    )
+
+
 class FileConfig(BaseModel):
     """File related settings"""
 
     path: str
+    volumes: list[Volume] = Field(
+        [], description="多個儲存磁碟區；未設定時只使用 path"
+    )
+    placement: Literal["headroom", "hash"] = Field(
+        "headroom",
+        description="headroom: 放在剩餘空間 (乘上權重) 最多的磁碟區；hash: 依檔案 ID 做加權一致性雜湊",
+    )
+    layout: Literal["flat", "sharded"] = Field(
+        "sharded",
+        description="新檔案的目錄結構；flat: <使用者>/<檔名>；sharded: <使用者>/ab/cd/<檔名>",
+    )
+    min_free_bytes: int = Field(1024**3, description="剩餘空間低於此值的磁碟區不放置新檔案")
+    statvfs_cache_seconds: float = Field(10, description="磁碟空間資訊的快取時間")
+    rebalance: Rebalance = Rebalance()
 
 
 class JWT(BaseModel):
@@ -54,12 +93,281 @@ class JWT(BaseModel):
 
     JWT_SECRET_KEY: str = "JWT_KEY"
     JWT_ACCESS_TOKEN_EXPIRES: int = 30
+    DOWNLOAD_TOKEN_EXPIRES: int = Field(60, description="檔案列表下載 token 的有效時間 (分鐘)")
+    DOWNLOAD_TOKEN_REFRESH_MARGIN: int = Field(
+        10, description="剩餘有效時間少於此值 (分鐘) 時重新簽發"
+    )
 
 
 class App(BaseModel):
     """應用程式層級的公開設定"""
 
     PUBLIC_DOMAIN: str = "http://127.0.0.1:8964"
+    UPLOAD_TEMP_DIR: str = Field("upload_temp", description="分塊上傳的暫存目錄")
+    UPLOAD_TEMP_IN_STORAGE: bool = Field(
+        False,
+        description="分塊直接寫入使用者儲存目錄中的隱藏暫存檔，完成時只需同一檔案系統內的 rename",
+    )
+    UPLOAD_SESSION_TTL_MINUTES: int = Field(
+        60, description="上傳會話超過此時間沒有更新即視為放棄，並歸還預留的配額"
+    )
+    UPLOAD_SWEEP_BATCH_SIZE: int = Field(
+        500, description="清除過期上傳會話時每批處理的數量 (每批一個交易)"
+    )
+
+
+class Audit(BaseModel):
+    """操作日誌相關"""
+
+    ENABLED: bool = True
+    DB_NAME: str = Field("log_db", description="寫入的資料庫名稱 (對應 DATABASES)")
+    FLUSH_SIZE: int = Field(200, description="緩衝筆數達到此值時立即批次寫入")
+    FLUSH_INTERVAL_SECONDS: float = Field(2.0, description="最長多久批次寫入一次")
+    MAX_BUFFER: int = Field(50000, description="緩衝上限，超過時丟棄最舊的紀錄")
+
+
+class Profiler(BaseModel):
+    """請求取樣效能分析相關"""
+
+    ENABLED: bool = Field(False, description="關閉時不註冊任何 hook，沒有額外負擔")
+    SAMPLE_RATE: float = Field(0.01, ge=0, le=1, description="隨機取樣的請求比例")
+    HEADER: str = Field(
+        "X-Profile", description="帶有此 header 的請求強制分析 (僅限有 system:profile 權限者)"
+    )
+    OUTPUT_DIR: str = Field("profiles", description="pstats 檔案存放目錄")
+    MAX_DUMPS_PER_ROUTE: int = Field(20, description="每個路由保留的最新分析檔數量")
+    EXCLUDE_ENDPOINTS: list[str] = Field(
+        [
+            "filectrl.upload_chunk",
+            "filectrl.download_file",
+            "filectrl.public_download_file",
+            "filectrl.download_with_token",
+        ],
+        description="不分析的 endpoint (檔案內容串流)",
+    )
+
+
+class Compression(BaseModel):
+    """API 回應壓縮相關 (br / zstd 需另外安裝 brotli / zstandard 套件)"""
+
+    ENABLED: bool = True
+    MIN_SIZE: int = Field(1024, description="小於此大小 (bytes) 的回應不壓縮")
+    ALGORITHMS: list[str] = Field(
+        ["br", "zstd", "gzip"], description="伺服器端偏好順序"
+    )
+    MIMETYPES: list[str] = Field(
+        ["application/json", "text/plain", "text/html", "text/css"],
+        description="會被壓縮的 Content-Type",
+    )
+    GZIP_LEVEL: int = 6
+    BROTLI_LEVEL: int = 4
+    ZSTD_LEVEL: int = 3
+
+
+class SignedURL(BaseModel):
+    """HMAC 簽章下載網址相關"""
+
+    KEYS: Dict[str, str] = Field(
+        {}, description="kid -> 金鑰；未設定時由 JWT_SECRET_KEY 衍生"
+    )
+    ACTIVE_KEY: str = Field("", description="簽發新網址使用的 kid")
+    EXPIRES_SECONDS: int = Field(3600, description="預設有效時間 (秒)")
+    MAX_EXPIRES_SECONDS: int = Field(7 * 24 * 3600, description="允許的最長有效時間 (秒)")
+
+
+class ShareCache(BaseModel):
+    """公開分享連結解析快取相關"""
+
+    MAXSIZE: int = 10000
+    TTL_SECONDS: float = Field(60, description="快取有效時間，也是多行程部署時的最長不一致時間")
+    NEGATIVE_MAXSIZE: int = 50000
+    NEGATIVE_TTL_SECONDS: float = Field(30, description="查無 token 的快取時間")
+
+
+class HotFileCache(BaseModel):
+    """公開分享熱門小檔案的記憶體快取 (每個行程各自一份)"""
+
+    ENABLED: bool = False
+    MAX_BYTES: int = Field(256 * 1024 * 1024, description="快取總大小上限 (bytes)")
+    MAX_FILE_SIZE: int = Field(4 * 1024 * 1024, description="單一檔案大小上限 (bytes)")
+
+
+class Bandwidth(BaseModel):
+    """上傳/下載頻寬限制 (bytes/s，0 表示不限制)"""
+
+    ENABLED: bool = False
+    GLOBAL_DOWNLOAD_BPS: int = 0
+    GLOBAL_UPLOAD_BPS: int = 0
+    USER_DOWNLOAD_BPS_BY_LEVEL: Dict[str, int] = Field(
+        {"0": 0, "1": 0, "2": 50 * 1024 * 1024, "3": 20 * 1024 * 1024},
+        description="依 Role.level 的個人下載限制",
+    )
+    USER_UPLOAD_BPS_BY_LEVEL: Dict[str, int] = Field(
+        {"0": 0, "1": 0, "2": 50 * 1024 * 1024, "3": 20 * 1024 * 1024},
+        description="依 Role.level 的個人上傳限制",
+    )
+    DEFAULT_USER_BPS: int = Field(10 * 1024 * 1024, description="未列出等級時的個人限制")
+    SHARE_DOWNLOAD_BPS: int = Field(
+        20 * 1024 * 1024, description="每個分享連結/簽章網址的下載限制"
+    )
+    BURST_SECONDS: float = Field(1.0, description="bucket 容量 = 速率 x 此秒數")
+
+
+class Admission(BaseModel):
+    """傳輸類請求的同時連線數限制 (0 表示不限制)"""
+
+    ENABLED: bool = True
+    GLOBAL_LIMITS: Dict[str, int] = Field(
+        {"upload_init": 32, "upload_chunk": 32, "download": 64},
+        description="全域同時請求數上限",
+    )
+    PER_USER_LIMITS: Dict[str, int] = Field(
+        {"upload_init": 4, "upload_chunk": 6, "download": 8},
+        description="每個使用者 (公開 API 為每個 IP) 的同時請求數上限",
+    )
+    QUEUE_SIZE: int = Field(64, description="全域額滿時可等待的請求數")
+    QUEUE_TIMEOUT_SECONDS: float = Field(2.0, description="最長等待時間")
+    RETRY_AFTER_SECONDS: int = Field(5, description="拒絕時的 Retry-After")
+
+
+class Durability(BaseModel):
+    """上傳檔案的寫入持久性 (fsync 策略)"""
+
+    MODE: Literal["none", "finalize", "every_n_mb"] = Field(
+        "finalize",
+        description="none: 不 fsync；finalize: 完成上傳時 fsync 檔案與目錄；"
+        "every_n_mb: 另外每寫入 N MB fsync 一次",
+    )
+    SYNC_EVERY_MB: int = Field(64, ge=1, description="every_n_mb 模式的同步間隔 (MB)")
+
+
+class AtRestCompression(BaseModel):
+    """可壓縮檔案的背景靜態壓縮 (zstd seekable format，需另外安裝 zstandard)"""
+
+    ENABLED: bool = False
+    LEVEL: int = 3
+    FRAME_SIZE: int = Field(
+        1024 * 1024, description="每個獨立壓縮 frame 的原始大小，Range 下載最少需解壓縮一個 frame"
+    )
+    MIN_SIZE: int = Field(64 * 1024, description="小於此大小的檔案不壓縮")
+    MIN_RATIO: float = Field(1.5, description="抽樣的壓縮比 (原始 / 壓縮後) 達到此值才壓縮")
+    SAMPLE_SIZE: int = Field(64 * 1024, description="每個抽樣區段的大小")
+    SAMPLE_COUNT: int = Field(4, ge=1, description="每個檔案抽樣的區段數")
+    BATCH_SIZE: int = Field(20, description="每次背景任務處理的檔案數")
+    SERVE_COMPRESSED: bool = Field(
+        True, description="Accept-Encoding 含 zstd 的完整下載直接回傳壓縮後的內容"
+    )
+    DELETE_GRACE_SECONDS: float = Field(180, description="壓縮後原始檔保留的時間")
+
+
+class Tiering(BaseModel):
+    """冷熱分層: 久未下載的永久檔案打包到 pack 檔 (通常放在較便宜的磁碟區)"""
+
+    ENABLED: bool = False
+    PACK_DIR: str = Field("packs", description="pack 檔存放目錄")
+    COLD_AFTER_DAYS: int = Field(90, description="永久檔案超過此天數沒有下載即視為冷資料")
+    MAX_FILE_SIZE: int = Field(
+        16 * 1024 * 1024, description="只打包不超過此大小的檔案 (大檔案不受 inode 數量影響)"
+    )
+    PACK_MAX_BYTES: int = Field(4 * 1024**3, description="單一 pack 檔的大小上限")
+    BATCH_SIZE: int = Field(1000, description="每次任務最多打包的檔案數 (一個交易)")
+    PROMOTE_ACCESS_COUNT: int = Field(
+        3, description="打包後在 PROMOTE_WINDOW_DAYS 內被下載達此次數即搬回熱層"
+    )
+    PROMOTE_WINDOW_DAYS: int = 7
+    DELETE_GRACE_SECONDS: float = Field(180, description="打包後原始檔保留的時間")
+
+
+class Trash(BaseModel):
+    """軟刪除與背景回收"""
+
+    UNDO_SECONDS: int = Field(600, description="刪除後可以復原的時間")
+    REAP_BATCH_SIZE: int = Field(200, description="每次回收的檔案數")
+    UNLINK_BYTES_PER_SECOND: int = Field(
+        512 * 1024 * 1024, description="回收時每秒最多釋放的位元組數 (0 表示不限制)"
+    )
+    TRUNCATE_STEP_BYTES: int = Field(
+        1024**3, description="大檔案每次 truncate 的大小，分散釋放空間的成本"
+    )
+
+
+class TaskQueue(BaseModel):
+    """背景任務佇列 (任務存在資料庫中，重新啟動後繼續執行)"""
+
+    ENABLED: bool = Field(
+        True, description="本行程是否執行任務 (可只在部分行程或獨立的 worker 行程啟用)"
+    )
+    WORKERS: int = Field(2, ge=1, description="每個行程同時執行的任務數")
+    POLL_INTERVAL_SECONDS: float = Field(1.0, description="沒有新任務通知時多久查詢一次")
+    LEASE_SECONDS: int = Field(
+        600, description="領取任務的有效期限，超過仍未完成視為行程中斷，重新排入佇列"
+    )
+    MAX_ATTEMPTS: int = Field(3, ge=1, description="失敗時最多執行的次數")
+    RETRY_DELAY_SECONDS: int = Field(30, description="失敗後重試的延遲 (乘上已執行次數)")
+    KEEP_FINISHED_DAYS: int = Field(7, description="完成或失敗的任務紀錄保留天數")
+
+
+class Preview(BaseModel):
+    """上傳後產生的預覽 (圖片縮圖需 Pillow，PDF 第一頁另需 pypdfium2)"""
+
+    ENABLED: bool = True
+    CACHE_DIR: str = Field(
+        "previews", description="預覽快取目錄 (以檔案內容的雜湊命名，內容相同的檔案共用)"
+    )
+    MAX_CACHE_BYTES: int = Field(
+        1024**3, description="預覽快取的大小上限，超過時刪除最久未使用的預覽"
+    )
+    THUMBNAIL_SIZE: int = Field(256, description="縮圖的最長邊 (像素)")
+    JPEG_QUALITY: int = 80
+    TEXT_HEAD_BYTES: int = Field(4096, description="文字檔預覽的長度 (位元組)")
+    MAX_SOURCE_BYTES: int = Field(
+        64 * 1024 * 1024, description="圖片與 PDF 超過此大小不產生預覽 (需要整個讀入解碼)"
+    )
+    CACHE_MAX_AGE_SECONDS: int = Field(
+        365 * 24 * 3600, description="預覽回應的 Cache-Control max-age (內容固定，可長期快取)"
+    )
+
+
+class DeltaSync(BaseModel):
+    """rsync 式的差異上傳"""
+
+    BLOCK_SIZE: int = Field(64 * 1024, ge=1024, description="簽章的預設區塊大小")
+    MAX_BLOCKS: int = Field(100000, description="簽章的區塊數上限，超過時加倍區塊大小")
+    MAX_BLOCK_SIZE: int = Field(64 * 1024 * 1024, description="允許的最大區塊大小")
+    INLINE_SIGNATURE_MAX_BYTES: int = Field(
+        16 * 1024 * 1024,
+        description="不超過此大小的檔案在請求中直接計算簽章，較大的檔案由背景任務計算",
+    )
+    SIGNATURE_DIR: str = Field("delta_signatures", description="背景計算的簽章存放目錄")
+    MAX_SIGNATURE_CACHE_BYTES: int = Field(
+        1024**3, description="簽章目錄的大小上限，超過時刪除最久未使用的簽章"
+    )
+
+
+class S3Storage(BaseModel):
+    """S3 相容儲存 (AWS S3 / MinIO)，需另外安裝 boto3"""
+
+    ENDPOINT_URL: Optional[str] = Field(None, description="MinIO 等自架服務的網址")
+    REGION: str = "us-east-1"
+    BUCKET: str = ""
+    ACCESS_KEY: Optional[str] = None
+    SECRET_KEY: Optional[str] = None
+    PREFIX: str = Field("", description="物件 key 的前綴")
+    ADDRESSING_STYLE: Literal["auto", "path", "virtual"] = "auto"
+
+
+class Storage(BaseModel):
+    """檔案儲存後端"""
+
+    BACKEND: Literal["local", "s3"] = Field(
+        "local",
+        description="新上傳檔案使用的後端 (S3.BUCKET 有設定時，既有的 s3:// 檔案一律可讀取)",
+    )
+    PRESIGNED_REDIRECT: bool = Field(
+        True, description="後端支援時，下載直接轉址到預簽章網址 (不經過本伺服器，也不受頻寬限制)"
+    )
+    PRESIGN_EXPIRES_SECONDS: int = 300
+    S3: S3Storage = S3Storage()
 
 
 class Config(BaseModel):
@@ -71,3 +379,19 @@ class Config(BaseModel):
     DATABASES: Dict[str, Database] = {}
     FILE: FileConfig
     JWT: JWT
+    AUDIT: Optional[Audit] = Audit()
+    PROFILER: Optional[Profiler] = Profiler()
+    COMPRESSION: Optional[Compression] = Compression()
+    SIGNED_URL: Optional[SignedURL] = SignedURL()
+    SHARE_CACHE: Optional[ShareCache] = ShareCache()
+    HOT_FILE_CACHE: Optional[HotFileCache] = HotFileCache()
+    BANDWIDTH: Optional[Bandwidth] = Bandwidth()
+    ADMISSION: Optional[Admission] = Admission()
+    DURABILITY: Optional[Durability] = Durability()
+    STORAGE: Optional[Storage] = Storage()
+    AT_REST_COMPRESSION: Optional[AtRestCompression] = AtRestCompression()
+    TIERING: Optional[Tiering] = Tiering()
+    TRASH: Optional[Trash] = Trash()
+    TASK_QUEUE: Optional[TaskQueue] = TaskQueue()
+    PREVIEW: Optional[Preview] = Preview()
+    DELTA_SYNC: Optional[DeltaSync] = DeltaSync()
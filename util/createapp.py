@@ -16,6 +16,23 @@ from jwt.exceptions import ExpiredSignatureError
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 from util.register_jobs import scheduler_jobs
+from util.audit import audit_writer
+from util.profiler import RequestProfiler
+from util.compression import CompressionMiddleware
+from util.download_token import is_download_token
+from util.share_cache import share_cache
+from util.file_cache import hot_file_cache
+from util.storage_backend import storage
+from util.volumes import volume_manager
+from util.at_rest_compression import at_rest_compressor
+from util.tiering import tiering
+from util.trash import trash
+from util.task_queue import task_queue
+from util.previews import previews
+from util.delta_sync import signature_store
+from util.schema_upgrade import upgrade_schema
+from util import post_upload  # noqa: F401 (註冊上傳後處理的任務類型)
+from share.model.log_model import LogBase
 
 
 class Application:
@@ -63,6 +80,7 @@ class Application:
                 print(f"成功設定資料庫連線: {db_name}")
             except Exception as e:
                 print(f"設定資料庫連線 {db_name} 失敗: {e}")
+        self._check_schema()
         # --- 結束 ---
 
         # --- 初始化 JWT ---
@@ -87,10 +105,88 @@ class Application:
                 401,
             )
 
+        @self.jwt.token_verification_loader
+        def reject_download_token(jwt_header, jwt_data):
+            """
+            下載專用的 token 只能用於 download_with_token，
+            所有以 jwt_required / permission_required 保護的 API 都拒絕。
+            """
+            return not is_download_token(jwt_data)
+
+        @self.jwt.token_verification_failed_loader
+        def handle_download_token_error(jwt_header, jwt_data):
+            return (
+                jsonify(
+                    {
+                        "message": "Download tokens cannot be used for this API.",
+                        "error_code": "TOKEN_SCOPE",
+                    }
+                ),
+                401,
+            )
+
+        share_cache.configure(self.config.SHARE_CACHE)
+        hot_file_cache.configure(self.config.HOT_FILE_CACHE)
+        volume_manager.configure(self.config.FILE)
+        storage.configure(self.config.STORAGE, self.config.APP, self.config.TIERING)
+        tiering.configure(self.config.TIERING)
+        trash.configure(self.config.TRASH)
+        at_rest_compressor.configure(self.config.AT_REST_COMPRESSION)
+        task_queue.configure(self.config.TASK_QUEUE)
+        previews.configure(self.config.PREVIEW)
+        signature_store.configure(self.config.DELTA_SYNC)
+
         # 呼叫內部方法來完成設定
         self._register_blueprints()
         self._register_default_route()
+        self._init_audit()
+        self._init_profiler()
+        self._init_compression()
         self._init_scheduler()
+        self._init_task_queue()
+
+    def _init_compression(self):
+        """以 WSGI middleware 壓縮 JSON 回應"""
+        if self.config.COMPRESSION.ENABLED:
+            self.app.wsgi_app = CompressionMiddleware(
+                self.app.wsgi_app, self.config.COMPRESSION
+            )
+
+    def _init_profiler(self):
+        """依設定掛上請求取樣分析 (停用時不註冊任何 hook)"""
+        self.profiler = RequestProfiler(self.config.PROFILER)
+        self.profiler.init_app(self.app)
+
+    def _check_schema(self):
+        """主資料庫缺少新版的資料表或欄位時提醒執行 upgradedb (否則查詢會失敗)"""
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            return
+        try:
+            pending = upgrade_schema(SessionLocal.kw["bind"], dry_run=True)
+        except Exception as e:
+            print(f"無法檢查主資料庫結構: {e}")
+            return
+        if pending:
+            print(
+                f"Warning: the main database is missing {len(pending)} tables/columns/indexes. "
+                "Run `python app.py upgradedb` before serving requests."
+            )
+
+    def _init_audit(self):
+        """建立操作日誌資料表並啟動批次寫入器"""
+        audit_config = self.config.AUDIT
+        if not audit_config.ENABLED:
+            return
+        SessionLocal = global_variable.database.get(audit_config.DB_NAME)
+        if not SessionLocal:
+            print(f"找不到操作日誌資料庫 '{audit_config.DB_NAME}'，停用操作日誌。")
+            return
+
+        # log_db 為獨立資料庫，沒有 migration，直接依 model 建立缺少的資料表
+        LogBase.metadata.create_all(SessionLocal.kw["bind"])
+        audit_writer.start(audit_config)
+        atexit.register(audit_writer.stop)
 
     def _init_scheduler(self):
         """初始化並啟動排程器"""
@@ -103,6 +199,11 @@ class Application:
         # 註冊應用程式關閉時執行的函式
         atexit.register(lambda: self.scheduler.shutdown())
 
+    def _init_task_queue(self):
+        """啟動背景任務的輪詢執行緒與執行緒池 (TASK_QUEUE.ENABLED 關閉時本行程只加入任務)"""
+        task_queue.start()
+        atexit.register(task_queue.stop)
+
     def _register_blueprints(self):
         """根據設定檔自動註冊藍圖"""
         for bp_path in self.config.OPENAPI.BLUEPRINTS:
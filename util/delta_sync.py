@@ -0,0 +1,285 @@
+"""
+rsync 式的差異上傳。
+
+1. 用戶端取得既有檔案 (base) 的區塊簽章: 每個 block_size 區塊的
+   Adler-32 (可滾動計算的弱檢查碼) 與 BLAKE2b-128 (強雜湊)。
+2. 用戶端在新版本上滾動計算 Adler-32，弱檢查碼相同時再比對強雜湊，
+   產生由「複製 base 的區塊」與「新的資料」組成的指令串，作為請求本文上傳:
+   - b"C" + COPY (起始區塊編號 u64、連續區塊數 u32，big-endian): 複製 base 的區塊
+     (最後一個區塊可能不足 block_size)
+   - b"L" + LITERAL (長度 u32) + 資料: 新的資料
+3. 伺服器依序組合新檔案。base 為本機檔案 (含 pack 檔中的區段) 時以 copy_file_range 在核心內複製，
+   同一個檔案系統上可直接共用 extent，不經過使用者空間；壓縮或 S3 中的 base 則串流讀取。
+
+大檔案 (超過 INLINE_SIGNATURE_MAX_BYTES) 的簽章需要讀取整個檔案，由背景任務計算，
+以每個區塊 20 bytes (SIGNATURE_ENTRY) 的格式存放在 SIGNATURE_DIR，API 再串流輸出；
+檔案內容不會改變，簽章不需要失效，超過 MAX_SIGNATURE_CACHE_BYTES 時刪除最久未使用的簽章。
+"""
+
+import hashlib
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+
+from share.model.model import File
+from util import at_rest_compression, file_ops
+from util.fast_json import dumps
+from util.storage_backend import storage
+from util.task_queue import task_queue
+from util.volumes import volume_manager
+
+OP_COPY = b"C"
+OP_LITERAL = b"L"
+COPY = struct.Struct(">QI")
+LITERAL = struct.Struct(">I")
+READ_SIZE = 1024 * 1024
+
+SIGNATURE = "delta:signature"
+# Adler-32 (u32) + BLAKE2b-128
+SIGNATURE_ENTRY = struct.Struct(">I16s")
+TOUCH_INTERVAL_SECONDS = 3600
+
+
+class DeltaError(ValueError):
+    """差異指令格式錯誤或與宣告的大小不符"""
+
+
+def block_size_for(file_size: int, config) -> int:
+    """預設區塊大小；區塊數超過 MAX_BLOCKS 時加倍，限制簽章的大小"""
+    block_size = config.BLOCK_SIZE
+    while (
+        math.ceil(file_size / block_size) > config.MAX_BLOCKS
+        and block_size < config.MAX_BLOCK_SIZE
+    ):
+        block_size *= 2
+    return block_size
+
+
+def _blocks(location: str, size: int, block_size: int):
+    pending = b""
+    for data in storage.for_location(location).open_range(location, 0, size):
+        if pending:
+            data = pending + data
+        full = len(data) - len(data) % block_size
+        for start in range(0, full, block_size):
+            yield data[start : start + block_size]
+        pending = data[full:]
+    if pending:
+        yield pending
+
+
+def _entries(location: str, size: int, block_size: int):
+    for block in _blocks(location, size, block_size):
+        yield zlib.adler32(block), hashlib.blake2b(block, digest_size=16).digest()
+
+
+def signature(location: str, size: int, block_size: int) -> list[list]:
+    """直接計算簽章 (只用於小檔案)，回傳 [[adler32, blake2b-128 hex], ...]"""
+    return [[weak, strong.hex()] for weak, strong in _entries(location, size, block_size)]
+
+
+class SignatureStore:
+    """背景計算的區塊簽章 (存放在 SIGNATURE_DIR，以 safe_filename 與區塊大小命名)"""
+
+    def __init__(self):
+        self.config = None
+        self._lock = threading.Lock()
+        self._stats = {"computed": 0, "hits": 0, "misses": 0, "evicted_files": 0}
+        self._cache_bytes = None
+
+    def configure(self, config):
+        # 相對路徑以目前目錄為準
+        self.config = config.model_copy(
+            update={"SIGNATURE_DIR": os.path.abspath(config.SIGNATURE_DIR)}
+        )
+
+    def _path(self, safe_filename: str, block_size: int) -> str:
+        return os.path.join(
+            self.config.SIGNATURE_DIR, safe_filename[:2], f"{safe_filename}-{block_size}.sig"
+        )
+
+    def lookup(self, safe_filename: str, block_size: int) -> str | None:
+        """回傳已計算的簽章檔路徑；命中時更新 mtime (最多每小時一次) 作為最近使用的時間"""
+        path = self._path(safe_filename, block_size)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        now = time.time()
+        if now - mtime > TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        with self._lock:
+            self._stats["hits"] += 1
+        return path
+
+    def compute(self, safe_filename: str, location: str, size: int, block_size: int):
+        """讀取整個檔案計算簽章，原子地寫入 (可以重新計算，不需要 fsync)"""
+        path = self._path(safe_filename, block_size)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        partial = file_ops.hidden_temp_path(directory, os.path.basename(path))
+        try:
+            with open(partial, "wb") as f:
+                for weak, strong in _entries(location, size, block_size):
+                    f.write(SIGNATURE_ENTRY.pack(weak, strong))
+            os.replace(partial, path)
+        except BaseException:
+            try:
+                os.remove(partial)
+            except FileNotFoundError:
+                pass
+            raise
+        with self._lock:
+            self._stats["computed"] += 1
+
+    @staticmethod
+    def stream_json(path: str, header: dict):
+        """把簽章檔串流輸出為與小檔案相同格式的 JSON (不把整個簽章讀入記憶體)"""
+        # header 序列化後去掉結尾的 "}"，接上 blocks 陣列
+        yield dumps(header)[:-1] + b',"blocks":['
+        separator = b""
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(SIGNATURE_ENTRY.size * 4096)
+                if not data:
+                    break
+                chunk = ",".join(
+                    f'[{weak},"{strong.hex()}"]'
+                    for weak, strong in SIGNATURE_ENTRY.iter_unpack(data)
+                )
+                yield separator + chunk.encode()
+                separator = b","
+        yield b"]}"
+
+    def evict(self) -> dict:
+        """簽章快取超過上限時，刪除最久未使用的簽章直到降到上限的 90%"""
+        config = self.config
+        entries, total = [], 0
+        if os.path.isdir(config.SIGNATURE_DIR):
+            for shard in os.scandir(config.SIGNATURE_DIR):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        evicted = 0
+        if total > config.MAX_SIGNATURE_CACHE_BYTES:
+            target = config.MAX_SIGNATURE_CACHE_BYTES * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+        with self._lock:
+            self._stats["evicted_files"] += evicted
+            self._cache_bytes = total
+        return {"evicted": evicted, "cache_bytes": total}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "cache_bytes": self._cache_bytes}
+
+
+signature_store = SignatureStore()
+
+
+@task_queue.handler(SIGNATURE)
+def compute_signature(session, task) -> dict:
+    record = session.get(File, task.file_id)
+    if record is None or record.deleted_at is not None:
+        return {"skipped": "file deleted"}
+    block_size = task.payload["block_size"]
+    if signature_store.lookup(record.safe_filename, block_size) is None:
+        signature_store.compute(
+            record.safe_filename, record.storage_path, record.file_size, block_size
+        )
+    return {"block_size": block_size}
+
+
+def _local_extent(location: str) -> tuple[str, int] | None:
+    """base 在本機未壓縮時回傳 (實際檔案路徑, 內容起點)，可用 copy_file_range 複製"""
+    backend = storage.for_location(location)
+    if backend is storage.pack:
+        path, offset, _ = storage.pack.parse(location)
+        return path, offset
+    if backend is storage.local and not at_rest_compression.is_compressed(location):
+        return volume_manager.resolve(location), 0
+    return None
+
+
+def _read_exact(stream, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise DeltaError("Unexpected end of delta stream.")
+        data += chunk
+    return data
+
+
+def apply_delta(
+    stream, base_location: str, base_size: int, block_size: int, dst_fd: int, new_size: int
+) -> dict:
+    """由請求本文讀取指令，在 dst_fd 組合出 new_size 位元組的新檔案，回傳複製與上傳的位元組數"""
+    written = copied = literal = 0
+    extent = _local_extent(base_location)
+    base_fd = os.open(extent[0], os.O_RDONLY) if extent else None
+    try:
+        while True:
+            op = stream.read(1)
+            if not op:
+                break
+            if op == OP_COPY:
+                start, count = COPY.unpack(_read_exact(stream, COPY.size))
+                offset = start * block_size
+                if count == 0 or offset >= base_size:
+                    raise DeltaError("Block reference out of range.")
+                length = min(count * block_size, base_size - offset)
+                if written + length > new_size:
+                    raise DeltaError("Delta is larger than the declared file size.")
+                if base_fd is not None:
+                    n = file_ops.copy_range(base_fd, extent[1] + offset, dst_fd, length)
+                    if n != length:
+                        raise DeltaError("Base file is shorter than expected.")
+                else:
+                    backend = storage.for_location(base_location)
+                    for data in backend.open_range(base_location, offset, offset + length):
+                        os.write(dst_fd, data)
+                written += length
+                copied += length
+            elif op == OP_LITERAL:
+                (length,) = LITERAL.unpack(_read_exact(stream, LITERAL.size))
+                if written + length > new_size:
+                    raise DeltaError("Delta is larger than the declared file size.")
+                remaining = length
+                while remaining > 0:
+                    data = _read_exact(stream, min(READ_SIZE, remaining))
+                    os.write(dst_fd, data)
+                    remaining -= len(data)
+                written += length
+                literal += length
+            else:
+                raise DeltaError(f"Unknown delta instruction {op!r}.")
+    finally:
+        if base_fd is not None:
+            os.close(base_fd)
+
+    if written != new_size:
+        raise DeltaError(f"Delta produced {written} bytes, expected {new_size}.")
+    return {"copied_bytes": copied, "literal_bytes": literal}
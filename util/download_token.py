@@ -0,0 +1,80 @@
+import threading
+import time
+from datetime import timedelta
+
+from flask_jwt_extended import create_access_token
+
+from util.global_variable import global_variable
+
+# 下載專用 token 的 scope: 只能用於 download_with_token，不能當作一般 API 的登入 token
+DOWNLOAD_SCOPE = "download"
+
+
+def issue_download_token(
+    account: str, expires_delta: timedelta, safe_filename: str | None = None
+) -> str:
+    """簽發下載專用的 JWT；指定 safe_filename 時只能下載該檔案"""
+    claims = {"scope": DOWNLOAD_SCOPE}
+    if safe_filename is not None:
+        claims["download_file"] = safe_filename
+    return create_access_token(
+        identity=account, expires_delta=expires_delta, additional_claims=claims
+    )
+
+
+def is_download_token(jwt_data: dict) -> bool:
+    return jwt_data.get("scope") == DOWNLOAD_SCOPE
+
+
+class DownloadTokenCache:
+    """
+    每個使用者的下載 token 快取。
+
+    列表 API 不再每次呼叫都簽發新的 JWT，而是重用同一個 token，
+    直到剩餘有效時間少於 DOWNLOAD_TOKEN_REFRESH_MARGIN 才重新簽發。
+    token 會出現在網址中 (代理伺服器紀錄、瀏覽器歷史、Referer)，
+    因此只簽發下載專用 (scope=download) 的 token，不能用來呼叫其他 API。
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self._tokens = {}  # account -> (token, expires_at)
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def get(self, account: str) -> str:
+        jwt_config = global_variable.config.JWT
+        now = time.time()
+        refresh_margin = jwt_config.DOWNLOAD_TOKEN_REFRESH_MARGIN * 60
+
+        entry = self._tokens.get(account)
+        if entry and entry[1] - now > refresh_margin:
+            return entry[0]
+
+        lifetime = jwt_config.DOWNLOAD_TOKEN_EXPIRES * 60
+        token = issue_download_token(account, timedelta(seconds=lifetime))
+        with self._lock:
+            if len(self._tokens) >= self.max_entries:
+                self._evict_expired(now)
+            self._tokens[account] = (token, now + lifetime)
+        return token
+
+    def _evict_expired(self, now: float):
+        expired = [k for k, (_, exp) in self._tokens.items() if exp <= now]
+        for key in expired:
+            del self._tokens[key]
+        # 全部都還有效時，清掉最早放入的一半，避免無限成長
+        if len(self._tokens) >= self.max_entries:
+            for key in list(self._tokens)[: self.max_entries // 2]:
+                del self._tokens[key]
+
+
+download_token_cache = DownloadTokenCache()
+
+
+def download_url_prefix(account: str) -> str:
+    """回傳此使用者的下載網址前綴，後面接上 safe_filename 即為完整下載網址"""
+    token = download_token_cache.get(account)
+    return (
+        f"{global_variable.config.APP.PUBLIC_DOMAIN}"
+        f"/api/files/download_with_token?token={token}&filename="
+    )
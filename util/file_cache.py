@@ -0,0 +1,168 @@
+"""
+熱門小檔案的記憶體快取 (公開分享下載用)。
+
+- 以 (storage_path, mtime, size) 為 key，檔案被改寫後自然不會命中舊資料。
+- 以位元組為預算的 LRU，超過預算時淘汰最久未使用的檔案。
+- 採 TinyLFU 准入策略: 以 Count-Min Sketch 估計存取頻率，
+  新檔案的頻率必須高於要被淘汰的檔案才會放入，
+  因此一次性的大量掃描不會把熱門檔案擠出快取。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CountMinSketch:
+    """估計存取頻率的 Count-Min Sketch (4-bit 飽和計數，定期減半以反映近期熱度)"""
+
+    DEPTH = 4
+    MAX_COUNT = 15
+    _HALVE = bytes(i >> 1 for i in range(256))
+
+    def __init__(self, width: int = 1 << 16):
+        self.width = width
+        self._rows = [bytearray(width) for _ in range(self.DEPTH)]
+        self._additions = 0
+        self._reset_at = width * 10
+
+    def _indexes(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        for i in range(self.DEPTH):
+            yield int.from_bytes(digest[i * 4 : i * 4 + 4], "little") % self.width
+
+    def increment(self, key):
+        for row, idx in zip(self._rows, self._indexes(key)):
+            if row[idx] < self.MAX_COUNT:
+                row[idx] += 1
+        self._additions += 1
+        if self._additions >= self._reset_at:
+            self._age()
+
+    def estimate(self, key) -> int:
+        return min(row[idx] for row, idx in zip(self._rows, self._indexes(key)))
+
+    def _age(self):
+        for row in self._rows:
+            row[:] = row.translate(self._HALVE)
+        self._additions //= 2
+
+
+class HotFileCache:
+    """以位元組為預算、TinyLFU 准入的小檔案快取"""
+
+    def __init__(self):
+        self.enabled = False
+        self.max_bytes = 0
+        self.max_file_size = 0
+        self._entries = OrderedDict()  # (path, mtime, size) -> bytes
+        self._keys_by_path = {}  # path -> {(path, mtime, size), ...}
+        self._current_bytes = 0
+        self._sketch = CountMinSketch()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "admissions": 0,
+            "rejections": 0,
+            "evictions": 0,
+        }
+
+    def configure(self, hot_file_cache_config):
+        self.enabled = hot_file_cache_config.ENABLED
+        self.max_bytes = hot_file_cache_config.MAX_BYTES
+        self.max_file_size = hot_file_cache_config.MAX_FILE_SIZE
+        self.clear()
+
+    def cacheable(self, size: int) -> bool:
+        return self.enabled and 0 < size <= self.max_file_size
+
+    def get_or_load(self, storage_path: str, size: int, mtime: float) -> bytes | None:
+        """
+        回傳快取中的檔案內容；未命中時依 TinyLFU 判斷是否讀入快取。
+        回傳 None 表示不使用快取 (由呼叫端直接串流檔案)。
+        """
+        key = (storage_path, mtime, size)
+        with self._lock:
+            self._sketch.increment(key)
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return data
+            self._stats["misses"] += 1
+            if not self._should_admit(key, size):
+                self._stats["rejections"] += 1
+                return None
+
+        try:
+            with open(storage_path, "rb") as f:
+                data = f.read(size + 1)
+        except OSError:
+            return None
+        if len(data) != size:
+            # 檔案在 stat 之後被改寫，不放入快取
+            return None
+
+        with self._lock:
+            if key not in self._entries and self._should_admit(key, size):
+                self._make_room(size)
+                self._entries[key] = data
+                self._keys_by_path.setdefault(storage_path, set()).add(key)
+                self._current_bytes += size
+                self._stats["admissions"] += 1
+        return data
+
+    def _should_admit(self, key, size: int) -> bool:
+        """空間足夠時直接放入；否則候選者的頻率必須高於所有將被淘汰的檔案"""
+        needed = self._current_bytes + size - self.max_bytes
+        if needed <= 0:
+            return True
+        candidate_freq = self._sketch.estimate(key)
+        for victim_key, victim in self._entries.items():
+            if self._sketch.estimate(victim_key) >= candidate_freq:
+                return False
+            needed -= len(victim)
+            if needed <= 0:
+                return True
+        return False
+
+    def _make_room(self, size: int):
+        while self._entries and self._current_bytes + size > self.max_bytes:
+            victim_key, victim = self._entries.popitem(last=False)
+            # 同一路徑可能還有其他版本的 key，只移除被淘汰的這一個
+            keys = self._keys_by_path.get(victim_key[0])
+            if keys is not None:
+                keys.discard(victim_key)
+                if not keys:
+                    del self._keys_by_path[victim_key[0]]
+            self._current_bytes -= len(victim)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, storage_path: str):
+        """檔案刪除或搬移時呼叫，移除該路徑所有版本 (mtime、size) 的快取"""
+        with self._lock:
+            for key in self._keys_by_path.pop(storage_path, ()):
+                data = self._entries.pop(key, None)
+                if data is not None:
+                    self._current_bytes -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+hot_file_cache = HotFileCache()
@@ -0,0 +1,253 @@
+"""
+上傳完成時把暫存檔移到最終位置。
+
+- 同一個檔案系統: os.replace，原子且不複製任何資料。
+- 跨檔案系統 (EXDEV): 在目標目錄建立隱藏的暫存檔，
+  以 copy_file_range (支援時可直接 reflink) 或 sendfile 在核心內複製，
+  完成後再 os.replace 到最終檔名，讀者不會看到寫到一半的檔案。
+  兩者都不支援時才退回一般的讀寫複製。
+
+持久性 (依 DURABILITY.MODE):
+- none: 不 fsync，效能最好，當機時已完成的檔案可能有空洞。
+- finalize: 完成上傳時 fdatasync 檔案內容並 fsync 目錄後才寫入資料庫紀錄，
+  回報完成的檔案在當機後一定完整存在。
+- every_n_mb: 另外在寫入跨過每 N MB 邊界時 fdatasync，
+  限制當機時未落盤的資料量 (每個上傳最多 N MB)。
+"""
+
+import errno
+import os
+import shutil
+
+COPY_BLOCK_SIZE = 64 * 1024 * 1024
+
+NONE = "none"
+FINALIZE = "finalize"
+EVERY_N_MB = "every_n_mb"
+
+
+def datasync(fd: int):
+    """只同步資料 (與讀取檔案所需的 metadata)，平台不支援 fdatasync 時改用 fsync"""
+    if hasattr(os, "fdatasync"):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+
+def fsync_directory(directory: str):
+    """同步目錄項目，讓 rename / 建立檔案在當機後仍然存在 (Windows 不支援，略過)"""
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def chunk_needs_sync(mode: str, start: int, end: int, every_mb: int) -> bool:
+    """every_n_mb 模式下，寫入範圍 [start, end] 跨過 N MB 邊界時需要同步"""
+    if mode != EVERY_N_MB:
+        return False
+    interval = every_mb * 1024 * 1024
+    return start // interval != (end + 1) // interval
+
+
+def write_chunk(path: str, offset: int, data: bytes, sync: bool = False):
+    """在 offset 寫入一個分塊，sync 為 True 時寫入後 fdatasync"""
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+        if sync:
+            f.flush()
+            datasync(f.fileno())
+
+
+def hidden_temp_path(directory: str, name: str) -> str:
+    """目標目錄中的隱藏暫存檔路徑 (以 . 開頭，不會與正式檔名衝突)"""
+    return os.path.join(directory, f".{name}.partial")
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(src_fd, dst_fd, min(COPY_BLOCK_SIZE, size - copied))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(src_fd: int, dst_fd: int, size: int) -> int:
+    copied = 0
+    while copied < size:
+        n = os.sendfile(dst_fd, src_fd, copied, min(COPY_BLOCK_SIZE, size - copied))
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def kernel_copy(src: str, dst: str, sync: bool = False) -> str:
+    """
+    在核心內把 src 複製到 dst (dst 會被建立或覆寫)，回傳實際使用的方法。
+    sync 為 True 時複製完成後 fdatasync 目標檔。
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        method = _kernel_copy(fsrc, fdst)
+        if sync:
+            fdst.flush()
+            datasync(fdst.fileno())
+        return method
+
+
+def _kernel_copy(fsrc, fdst) -> str:
+    size = os.fstat(fsrc.fileno()).st_size
+    for method, copier in (
+        ("copy_file_range", getattr(os, "copy_file_range", None) and _copy_file_range),
+        ("sendfile", getattr(os, "sendfile", None) and _sendfile),
+    ):
+        if not copier:
+            continue
+        try:
+            if copier(fsrc.fileno(), fdst.fileno(), size) == size:
+                return method
+        except OSError as e:
+            if e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+                errno.ENOTSUP,
+            ):
+                raise
+        # 該方法不支援或中途失敗: 清空目標檔後改用下一個方法
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+
+    shutil.copyfileobj(fsrc, fdst, COPY_BLOCK_SIZE)
+    return "copyfileobj"
+
+
+def _stream_copy(src_fd: int, dst_fd: int, block_size: int, bucket=None) -> int:
+    """
+    由兩個 fd 目前的位置開始複製到 src 結尾，回傳複製的位元組數。
+    支援時以 copy_file_range 在核心內複製；bucket 不為空時每個區塊先扣除額度 (限速)。
+    """
+    copied = 0
+    use_kernel = hasattr(os, "copy_file_range")
+    while True:
+        if bucket is not None:
+            bucket.consume(block_size)
+        if use_kernel:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, block_size)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                    raise
+                use_kernel = False
+                continue
+        else:
+            data = os.read(src_fd, block_size)
+            n = os.write(dst_fd, data) if data else 0
+        if n == 0:
+            return copied
+        copied += n
+
+
+def copy_range(src_fd: int, src_offset: int, dst_fd: int, length: int) -> int:
+    """
+    將 src 中 [src_offset, src_offset + length) 的內容寫到 dst_fd 目前的位置，回傳複製的位元組數。
+    支援時以 copy_file_range 在核心內複製 (同一個檔案系統可直接共用 extent)，否則 pread 後寫入。
+    """
+    copied = 0
+    use_kernel = hasattr(os, "copy_file_range")
+    while copied < length:
+        size = min(COPY_BLOCK_SIZE, length - copied)
+        if use_kernel:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, size, src_offset + copied)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL):
+                    raise
+                use_kernel = False
+                continue
+        else:
+            data = os.pread(src_fd, min(size, 8 * 1024 * 1024), src_offset + copied)
+            n = os.write(dst_fd, data) if data else 0
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def throttled_copy(src: str, dst: str, bucket=None, block_size: int = 8 * 1024 * 1024):
+    """限速複製 (背景搬移用)，完成後 fdatasync 目標檔"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        _stream_copy(fsrc.fileno(), fdst.fileno(), block_size, bucket)
+        datasync(fdst.fileno())
+
+
+def append_file(src: str, dst_fd: int) -> int:
+    """
+    將 src 的內容接在 dst_fd 目前的位置 (pack 檔的結尾)，回傳寫入的位元組數。
+    不會清空或覆寫 dst 既有的內容；dst_fd 不可以 O_APPEND 開啟 (copy_file_range 不支援)。
+    """
+    with open(src, "rb") as fsrc:
+        return _stream_copy(fsrc.fileno(), dst_fd, COPY_BLOCK_SIZE)
+
+
+def throttled_unlink(path: str, bucket=None, step: int = 1024**3) -> bool:
+    """
+    刪除檔案 (背景回收用)。大於 step 的檔案先由尾端分段 truncate 再 unlink，
+    把釋放 extent 的成本分散到多次較短的操作；bucket 不為空時每段先扣除額度 (限速)。
+    檔案不存在時回傳 False。
+    """
+    try:
+        size = os.path.getsize(path)
+        if size > step:
+            with open(path, "r+b") as f:
+                while size > 0:
+                    if bucket is not None:
+                        bucket.consume(min(step, size))
+                    size = max(size - step, 0)
+                    f.truncate(size)
+        elif bucket is not None and size:
+            bucket.consume(size)
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def finalize_file(src: str, dst: str, sync: bool = False) -> str:
+    """
+    將暫存檔 src 移到最終位置 dst，回傳使用的方法
+    ("rename" / "copy_file_range" / "sendfile" / "copyfileobj")。
+    sync 為 True 時，回傳前確保檔案內容與目錄項目都已落盤
+    (dst 是新的檔名，呼叫端在此之後才寫入資料庫紀錄，因此可以先換名再同步)。
+    """
+    directory, name = os.path.split(dst)
+    try:
+        os.replace(src, dst)
+        method = "rename"
+        if sync:
+            with open(dst, "rb") as f:
+                datasync(f.fileno())
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        partial = hidden_temp_path(directory, name)
+        try:
+            method = kernel_copy(src, partial, sync=sync)
+            os.replace(partial, dst)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        os.remove(src)
+
+    if sync:
+        fsync_directory(directory or ".")
+    return method
@@ -0,0 +1,141 @@
+"""組合檔案下載回應的共用邏輯"""
+
+import io
+import os
+from urllib.parse import quote
+
+from flask import Response, abort, redirect, request, send_file
+
+from util import at_rest_compression
+from util.at_rest_compression import at_rest_compressor
+from util.file_cache import hot_file_cache
+from util.rate_limit import throttle_iter
+from util.storage_backend import storage
+from util.tiering import access_tracker
+
+
+def content_disposition(filename: str) -> str:
+    try:
+        filename.encode("ascii")
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def send_stored_file(
+    storage_path: str,
+    filename: str,
+    byte_range: tuple[int, int] | None = None,
+    size: int | None = None,
+    mtime: float | None = None,
+    buckets: list | None = None,
+    file_id: int | None = None,
+) -> Response:
+    """
+    以附件形式回傳伺服器上的檔案。
+
+    byte_range 為 [start, end) 時只回傳該區段 (例如簽章網址限制的範圍)，
+    否則交給 send_file 處理 (支援 Range / 條件式請求)。
+    呼叫端已知 size 與 mtime 時 (例如分享連結快取)，小檔案可由 hot_file_cache 從記憶體回傳。
+    buckets 為頻寬限制的 token bucket，不為空時以限速的方式串流。
+    file_id 不為空時記錄一次下載 (冷熱分層使用)。
+    """
+    response = _build_response(storage_path, filename, byte_range, size, mtime)
+    if file_id is not None:
+        access_tracker.touch(file_id)
+    if buckets:
+        response.response = throttle_iter(response.response, buckets)
+    return response
+
+
+def _build_response(storage_path, filename, byte_range, size, mtime) -> Response:
+    backend = storage.for_location(storage_path)
+    local_path = backend.local_path(storage_path)
+    if local_path is None:
+        return _remote_response(backend, storage_path, filename, byte_range)
+    if at_rest_compression.is_compressed(storage_path):
+        return _compressed_response(backend, storage_path, local_path, filename, byte_range)
+
+    if byte_range is None and size is not None and hot_file_cache.cacheable(size):
+        data = hot_file_cache.get_or_load(local_path, size, mtime)
+        if data is not None:
+            return send_file(
+                io.BytesIO(data),
+                as_attachment=True,
+                download_name=filename,
+                last_modified=mtime,
+                etag=f"{int(mtime)}-{size}",
+            )
+
+    if byte_range is None:
+        return send_file(local_path, as_attachment=True, download_name=filename)
+
+    size = os.path.getsize(local_path)
+    return _range_response(backend, storage_path, filename, byte_range, size)
+
+
+def _compressed_response(backend, location, local_path, filename, byte_range) -> Response:
+    """
+    靜態壓縮的檔案: 用戶端接受 zstd 時直接回傳壓縮後的內容，
+    否則 (或 Range 請求) 只解壓縮需要的 frame。
+    """
+    if (
+        byte_range is None
+        and request.range is None
+        and at_rest_compressor.serve_compressed
+        and request.accept_encodings["zstd"]
+    ):
+        response = send_file(local_path, as_attachment=True, download_name=filename)
+        response.headers["Content-Encoding"] = "zstd"
+        response.vary.add("Accept-Encoding")
+        return response
+
+    response = _streamed_response(backend, location, filename, byte_range)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def _remote_response(backend, location, filename, byte_range) -> Response:
+    """非本機的後端 (S3、pack 檔): 優先轉址到預簽章網址，否則由本伺服器串流"""
+    if byte_range is None and storage.presigned_redirect:
+        url = backend.presigned_url(location, filename, storage.presign_expires)
+        if url:
+            return redirect(url, code=302)
+    return _streamed_response(backend, location, filename, byte_range)
+
+
+def _streamed_response(backend, location, filename, byte_range) -> Response:
+    """由本伺服器串流的檔案，與 send_file 一樣支援用戶端的 Range 請求 (續傳)"""
+    stat = backend.stat(location)
+    if stat is None:
+        abort(404, "File not found on server storage.")
+    if byte_range is None and request.range is not None:
+        requested = request.range.range_for_length(stat.size)
+        if requested is None:
+            abort(416, "Requested range is outside of the file.")
+        response = _range_response(backend, location, filename, requested, stat.size)
+        response.status_code = 206
+        response.headers["Content-Range"] = request.range.to_content_range_header(stat.size)
+    else:
+        response = _range_response(backend, location, filename, byte_range, stat.size)
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def _range_response(backend, location, filename, byte_range, size) -> Response:
+    """串流 [start, end) 區段，byte_range 為 None 時回傳整個檔案"""
+    if byte_range is None:
+        start, end = 0, size
+    else:
+        start, end = byte_range[0], min(byte_range[1], size)
+        if start >= end:
+            abort(416, "Requested range is outside of the file.")
+
+    response = Response(
+        backend.open_range(location, start, end),
+        mimetype="application/octet-stream",
+        direct_passthrough=True,
+    )
+    response.content_length = end - start
+    response.headers["Content-Disposition"] = content_disposition(filename)
+    return response
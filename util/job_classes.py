@@ -1,7 +1,18 @@
-import os
 from datetime import datetime
 from util.global_variable import global_variable
 from share.model.model import File
+from util.upload_sweeper import upload_sweeper
+from util.volumes import volume_manager
+from util.at_rest_compression import at_rest_compressor
+from util.tiering import access_tracker, tiering
+from util.trash import trash
+from util.task_queue import task_queue
+from util.previews import previews
+from util.delta_sync import signature_store
+from util.signed_url import file_meta_cache
+from util.share_cache import share_cache
+from util.file_cache import hot_file_cache
+from util.rate_limit import bandwidth_limiter
 
 class DeleteExpiredFilesJob:
     """
@@ -22,7 +33,11 @@ class DeleteExpiredFilesJob:
             # 查詢所有 is_permanent 為 False 且 expiry_time 已過期的檔案
             expired_files = (
                 session.query(File)
-                .filter(File.is_permanent == False, File.expiry_time < now)
+                .filter(
+                    File.is_permanent == False,
+                    File.expiry_time < now,
+                    File.deleted_at.is_(None),
+                )
                 .all()
             )
 
@@ -32,24 +47,27 @@ class DeleteExpiredFilesJob:
 
             print(f"Found {len(expired_files)} expired files to delete.")
 
+            moved_files = []
             for file_record in expired_files:
                 try:
                     print(f"  - Deleting file: {file_record.filename} (ID: {file_record.id}, Path: {file_record.storage_path})")
-                    # 1. 刪除實體檔案
-                    if os.path.exists(file_record.storage_path):
-                        os.remove(file_record.storage_path)
-                        print(f"    - Physical file deleted successfully.")
-                    else:
-                        print(f"    - Warning: Physical file not found at {file_record.storage_path}.")
-
-                    # 2. 從資料庫刪除紀錄
-                    session.delete(file_record)
-                    print(f"    - Database record marked for deletion.")
+                    # 1. 移到垃圾桶並歸還配額 (實體檔案由 ReapTrashJob 回收)
+                    location = file_record.storage_path
+                    moved_files.append(trash.soft_delete(session, file_record))
+                    file_meta_cache.pop(file_record.id)
+                    share_cache.invalidate(file_record.share_token)
+                    hot_file_cache.invalidate(location)
+                    print(f"    - File moved to trash.")
                 except Exception as e:
                     print(f"    - Error deleting file {file_record.id}: {e}")
-            
-            # 3. 提交所有變更
-            session.commit()
+
+            # 2. 提交所有變更 (失敗時把檔案移回原位置)
+            try:
+                session.commit()
+            except Exception:
+                for moved in moved_files:
+                    trash.revert(moved)
+                raise
             print("Database changes committed.")
 
         except Exception as e:
@@ -57,4 +75,246 @@ class DeleteExpiredFilesJob:
             session.rollback()
         finally:
             session.close()
-            print("Job finished.")
\ No newline at end of file
+            print("Job finished.")
+
+
+class RebuildShareTokenBloomJob:
+    """
+    定期以資料庫中的 share_token 重建 Bloom filter，
+    讓其他行程建立的分享連結、已移除的分享連結都能反映到本行程。
+    """
+
+    def run(self):
+        if not global_variable.database.get("default"):
+            print("Error: Database session factory 'default' not found.")
+            return
+        try:
+            count = share_cache.rebuild_bloom()
+            print(f"[{datetime.now()}] Share token bloom filter rebuilt ({count} tokens).")
+        except Exception as e:
+            print(f"An error occurred while rebuilding share token bloom filter: {e}")
+
+
+class PruneBandwidthBucketsJob:
+    """清除長時間未使用的頻寬限制 bucket，避免記憶體持續成長"""
+
+    def run(self):
+        bandwidth_limiter.prune()
+
+
+class SweepAbandonedUploadsJob:
+    """
+    清除過期的上傳會話與孤兒暫存檔，歸還預留的配額。
+    """
+
+    def run(self):
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            result = upload_sweeper.sweep(session)
+            if result["reclaimed_files"] or result["expired_sessions"]:
+                print(
+                    f"[{datetime.now()}] Swept abandoned uploads: "
+                    f"{result['expired_sessions']} sessions expired, "
+                    f"{result['orphan_files']} orphan files, "
+                    f"{result['reclaimed_bytes']} bytes reclaimed."
+                )
+        except Exception as e:
+            print(f"An error occurred while sweeping abandoned uploads: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class RebalanceVolumesJob:
+    """
+    在多個儲存磁碟區之間搬移檔案，讓 (依權重調整後的) 使用率保持接近，
+    並刪除搬移後保留期已過的舊檔。
+    """
+
+    def run(self):
+        config = global_variable.config.FILE.rebalance
+        if not config.ENABLED:
+            volume_manager.delete_due()
+            return
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            result = volume_manager.rebalance(session, config)
+            if result["moved_files"] or result["skipped"]:
+                print(
+                    f"[{datetime.now()}] Rebalanced volumes: "
+                    f"{result['moved_files']} files ({result['moved_bytes']} bytes) moved, "
+                    f"{result['skipped']} skipped."
+                )
+        except Exception as e:
+            print(f"An error occurred while rebalancing volumes: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class CompressFilesJob:
+    """
+    抽樣評估尚未處理的本機檔案，將可壓縮的檔案改寫為 zstd seekable format。
+    """
+
+    def run(self):
+        if not at_rest_compressor.enabled:
+            return
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            result = at_rest_compressor.run(session)
+            if result["compressed"] or result["skipped"]:
+                print(
+                    f"[{datetime.now()}] At-rest compression: {result['compressed']} files "
+                    f"compressed, {result['skipped']} not compressible."
+                )
+        except Exception as e:
+            print(f"An error occurred while compressing files: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class FlushFileAccessJob:
+    """
+    將記憶體中累計的下載紀錄批次寫入 File.last_accessed_at / access_count。
+    """
+
+    def run(self):
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            access_tracker.flush(session)
+        except Exception as e:
+            print(f"An error occurred while flushing file access records: {e}")
+        finally:
+            session.close()
+
+
+class TierFilesJob:
+    """
+    將久未下載的永久檔案打包到 pack 檔，並把打包後又常被下載的檔案搬回熱層。
+    """
+
+    def run(self):
+        if not tiering.enabled:
+            return
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            result = tiering.run(session)
+            if result["packed"] or result["promoted"]:
+                print(
+                    f"[{datetime.now()}] Tiering: {result['packed']} files packed, "
+                    f"{result['promoted']} files promoted."
+                )
+        except Exception as e:
+            print(f"An error occurred while tiering files: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class ReapTrashJob:
+    """
+    回收超過復原期限的軟刪除檔案 (限速刪除實體檔案後刪除資料庫紀錄)。
+    """
+
+    def run(self):
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            result = trash.reap(session)
+            if result["reaped"]:
+                print(f"[{datetime.now()}] Reclaimed {result['reaped']} deleted files.")
+        except Exception as e:
+            print(f"An error occurred while reclaiming deleted files: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class MaintainTaskQueueJob:
+    """
+    將執行中斷 (lease 過期) 的背景任務重新排入佇列，並刪除超過保留天數的已結束任務。
+    """
+
+    def run(self):
+        SessionLocal = global_variable.database.get("default")
+        if not SessionLocal:
+            print("Error: Database session factory 'default' not found.")
+            return
+
+        session = SessionLocal()
+        try:
+            recovered = task_queue.recover(session)
+            purged = task_queue.purge(session)
+            if recovered or purged:
+                print(
+                    f"[{datetime.now()}] Task queue: {recovered} interrupted tasks recovered, "
+                    f"{purged} finished tasks purged."
+                )
+        except Exception as e:
+            print(f"An error occurred while maintaining the task queue: {e}")
+            session.rollback()
+        finally:
+            session.close()
+
+
+class EvictDeltaSignaturesJob:
+    """差異上傳的簽章超過大小上限時，刪除最久未使用的簽章。"""
+
+    def run(self):
+        try:
+            result = signature_store.evict()
+            if result["evicted"]:
+                print(
+                    f"[{datetime.now()}] Evicted {result['evicted']} delta signatures "
+                    f"({result['cache_bytes']} bytes cached)."
+                )
+        except Exception as e:
+            print(f"An error occurred while evicting delta signatures: {e}")
+
+
+class EvictPreviewCacheJob:
+    """預覽快取超過大小上限時，刪除最久未使用的預覽。"""
+
+    def run(self):
+        if not previews.enabled:
+            return
+        try:
+            result = previews.evict()
+            if result["evicted"]:
+                print(
+                    f"[{datetime.now()}] Evicted {result['evicted']} previews "
+                    f"({result['cache_bytes']} bytes cached)."
+                )
+        except Exception as e:
+            print(f"An error occurred while evicting previews: {e}")
@@ -0,0 +1,49 @@
+"""
+上傳完成後的背景處理 (由 complete_upload 加入 task_queue，不延長完成上傳的請求時間)。
+
+計算檔案內容的 SHA-256，可以產生預覽的檔案接著排入產生預覽的任務 (預覽以內容雜湊為快取的鍵)。
+之後需要的處理 (掃描等) 在 post_upload 中依序加入。
+"""
+
+import hashlib
+
+from sqlalchemy import update
+
+from share.model.model import File
+from util.previews import PREVIEW, previews
+from util.storage_backend import storage
+from util.task_queue import task_queue
+
+POST_UPLOAD = "file:post_upload"
+
+
+def content_sha256(location: str, size: int) -> str:
+    """讀取整個檔案計算 SHA-256 (壓縮、打包或 S3 中的檔案都讀取原始內容)"""
+    digest = hashlib.sha256()
+    for data in storage.for_location(location).open_range(location, 0, size):
+        digest.update(data)
+    return digest.hexdigest()
+
+
+@task_queue.handler(POST_UPLOAD)
+def post_upload(session, task) -> dict:
+    record = session.get(File, task.file_id)
+    if record is None or record.deleted_at is not None:
+        return {"skipped": "file deleted"}
+
+    location = record.storage_path
+    sha256 = content_sha256(location, record.file_size)
+    # 條件式 UPDATE: 計算期間檔案被刪除時不寫入 (被搬移時內容不變，仍然寫入)
+    session.execute(
+        update(File)
+        .where(File.id == record.id, File.deleted_at.is_(None))
+        .values(content_sha256=sha256)
+        .execution_options(synchronize_session=False)
+    )
+    queue_preview = previews.enabled and previews.variant(record.filename) is not None
+    if queue_preview:
+        task_queue.enqueue(session, PREVIEW, file_id=record.id, owner_id=record.owner_id)
+    session.commit()
+    if queue_preview:
+        task_queue.notify()
+    return {"sha256": sha256}
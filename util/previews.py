@@ -0,0 +1,316 @@
+"""
+上傳後產生的預覽 (縮圖)。
+
+- 圖片: 縮小到 THUMBNAIL_SIZE 的 JPEG (需另外安裝 Pillow)
+- PDF: 第一頁的縮圖 (另需 pypdfium2)
+- 文字檔: 開頭 TEXT_HEAD_BYTES 位元組 (只讀取開頭，不讀整個檔案)
+
+預覽由背景任務產生 (上傳後處理計算出 SHA-256 之後)，
+以 <content_sha256>-<種類> 命名存放在 CACHE_DIR，內容相同的檔案共用同一個預覽。
+File.preview 記錄種類，列表 API 由此組出簽章網址；簽章涵蓋檔案 ID 與預覽的鍵，
+讀取時確認檔案仍然存在 (刪除後網址即失效)，同一個檔案的網址固定不變，回應可以長期快取。
+快取超過 MAX_CACHE_BYTES 時由排程任務刪除最久未使用的預覽，之後再被讀取時重新產生。
+"""
+
+import codecs
+import io
+import os
+import threading
+import time
+
+from sqlalchemy import select, update
+
+from share.define.model_enum import TaskStatus
+from share.model.model import File, Task
+from util import at_rest_compression, file_ops
+from util.global_variable import global_variable
+from util.signed_url import sign_path
+from util.storage_backend import storage
+from util.task_queue import task_queue
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 為選用套件
+    Image = None
+
+try:
+    import pypdfium2
+except ImportError:  # pypdfium2 為選用套件
+    pypdfium2 = None
+
+PREVIEW = "file:preview"
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"}
+PDF_EXTENSIONS = {".pdf"}
+TEXT_EXTENSIONS = {
+    ".txt", ".md", ".csv", ".tsv", ".log", ".json", ".xml", ".yaml", ".yml", ".toml",
+    ".ini", ".cfg", ".py", ".js", ".ts", ".html", ".css", ".sql", ".sh",
+}
+MEDIA_TYPES = {".jpg": "image/jpeg", ".txt": "text/plain"}
+TOUCH_INTERVAL_SECONDS = 3600
+
+
+class Previews:
+    """產生、快取與回收預覽"""
+
+    def __init__(self):
+        self.config = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "generated": 0,
+            "reused": 0,
+            "hits": 0,
+            "misses": 0,
+            "evicted_files": 0,
+            "evicted_bytes": 0,
+        }
+        self._cache_bytes = None
+
+    def configure(self, config):
+        # 相對路徑以目前目錄為準 (send_file 會以 app.root_path 解析相對路徑，兩者可能不同)
+        self.config = config.model_copy(
+            update={"CACHE_DIR": os.path.abspath(config.CACHE_DIR)}
+        )
+        if config.ENABLED and Image is None:
+            print("Warning: PREVIEW image thumbnails require the Pillow package.")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config and self.config.ENABLED)
+
+    def variant(self, filename: str) -> str | None:
+        """依副檔名決定預覽的種類，無法產生預覽時回傳 None"""
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in IMAGE_EXTENSIONS and Image is not None:
+            return f"thumb{self.config.THUMBNAIL_SIZE}.jpg"
+        if extension in PDF_EXTENSIONS and Image is not None and pypdfium2 is not None:
+            return f"page1-{self.config.THUMBNAIL_SIZE}.jpg"
+        if extension in TEXT_EXTENSIONS:
+            return f"head{self.config.TEXT_HEAD_BYTES}.txt"
+        return None
+
+    @staticmethod
+    def key(content_sha256: str, variant: str) -> str:
+        return f"{content_sha256}-{variant}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.config.CACHE_DIR, key[:2], key)
+
+    @staticmethod
+    def signed_path(safe_filename: str, key: str) -> str:
+        # 綁定 safe_filename 而非 file_id: SQLite 會重複使用已刪除紀錄的 rowid
+        return f"{safe_filename}/{key}"
+
+    def url(
+        self,
+        file_id: int,
+        safe_filename: str,
+        content_sha256: str | None,
+        variant: str | None,
+    ) -> str | None:
+        """預覽的簽章網址 (同一個檔案的網址固定不變)"""
+        if not content_sha256 or not variant:
+            return None
+        key = self.key(content_sha256, variant)
+        signature = sign_path(self.signed_path(safe_filename, key))
+        return (
+            f"{global_variable.config.APP.PUBLIC_DOMAIN}"
+            f"/api/files/previews/{key}?file_id={file_id}&sig={signature}"
+        )
+
+    def media_type(self, key: str) -> str:
+        return MEDIA_TYPES.get(os.path.splitext(key)[1], "application/octet-stream")
+
+    def lookup(self, key: str) -> str | None:
+        """回傳快取中的預覽路徑；命中時更新 mtime (最多每小時一次) 作為最近使用的時間"""
+        path = self._path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+        now = time.time()
+        if now - mtime > TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+        with self._lock:
+            self._stats["hits"] += 1
+        return path
+
+    def _store(self, key: str, data: bytes):
+        """原子地寫入快取 (可以重新產生，不需要 fsync)"""
+        directory = os.path.dirname(self._path(key))
+        os.makedirs(directory, exist_ok=True)
+        partial = file_ops.hidden_temp_path(directory, key)
+        with open(partial, "wb") as f:
+            f.write(data)
+        os.replace(partial, self._path(key))
+
+    def _source(self, location: str, size: int):
+        """圖片與 PDF 的來源: 本機未壓縮的檔案直接使用路徑，其餘讀入記憶體"""
+        backend = storage.for_location(location)
+        path = backend.local_path(location)
+        if path is not None and not at_rest_compression.is_compressed(location):
+            return path
+        return io.BytesIO(b"".join(backend.open_range(location, 0, size)))
+
+    def _thumbnail(self, image) -> bytes:
+        size = self.config.THUMBNAIL_SIZE
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=self.config.JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+    def _render_image(self, source) -> bytes:
+        with Image.open(source) as image:
+            # JPEG 可在解碼時直接縮小，不需要解出完整解析度
+            image.draft("RGB", (self.config.THUMBNAIL_SIZE, self.config.THUMBNAIL_SIZE))
+            return self._thumbnail(image)
+
+    def _render_pdf(self, source) -> bytes:
+        pdf = pypdfium2.PdfDocument(source)
+        try:
+            page = pdf[0]
+            scale = self.config.THUMBNAIL_SIZE / max(page.get_size())
+            return self._thumbnail(page.render(scale=scale).to_pil())
+        finally:
+            pdf.close()
+
+    def _render_text(self, location: str, size: int) -> bytes:
+        length = min(size, self.config.TEXT_HEAD_BYTES)
+        data = b"".join(storage.for_location(location).open_range(location, 0, length))
+        # 截斷在多位元組字元中間時捨棄不完整的部分
+        text = codecs.getincrementaldecoder("utf-8")("replace").decode(data, final=size <= length)
+        return text.encode("utf-8")
+
+    def render(self, location: str, size: int, variant: str) -> bytes | None:
+        """產生預覽內容；來源過大時回傳 None"""
+        if variant.endswith(".txt"):
+            return self._render_text(location, size)
+        if size > self.config.MAX_SOURCE_BYTES:
+            return None
+        source = self._source(location, size)
+        if variant.startswith("page1-"):
+            return self._render_pdf(source)
+        return self._render_image(source)
+
+    def generate(self, session, record: File) -> dict:
+        """產生 (或重用內容相同的) 預覽並寫入 File.preview"""
+        variant = self.variant(record.filename)
+        if variant is None or not record.content_sha256:
+            return {"preview": None}
+        key = self.key(record.content_sha256, variant)
+        if os.path.exists(self._path(key)):
+            stat = "reused"
+        else:
+            try:
+                data = self.render(record.storage_path, record.file_size, variant)
+            except Exception as e:
+                if isinstance(e, (FileNotFoundError, PermissionError)):
+                    raise
+                # 無法解碼的內容 (格式錯誤、解壓縮炸彈等) 重試也不會成功，直接略過
+                print(f"    - Warning: cannot render preview of file {record.id}: {e}")
+                return {"preview": None, "error": str(e)[:200]}
+            if data is None:
+                return {"preview": None}
+            self._store(key, data)
+            stat = "generated"
+
+        session.execute(
+            update(File)
+            .where(File.id == record.id, File.deleted_at.is_(None))
+            .values(preview=variant)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        with self._lock:
+            self._stats[stat] += 1
+        return {"preview": variant}
+
+    def regenerate(self, session, key: str) -> bool:
+        """快取中的預覽已被回收時，為任一個內容相同的檔案重新排入產生預覽的任務"""
+        content_sha256, _, variant = key.partition("-")
+        file_id = session.execute(
+            select(File.id)
+            .where(
+                File.content_sha256 == content_sha256,
+                File.preview == variant,
+                File.deleted_at.is_(None),
+            )
+            .limit(1)
+        ).scalar_one_or_none()
+        if file_id is None:
+            return False
+        queued = session.execute(
+            select(Task.id)
+            .where(
+                Task.kind == PREVIEW,
+                Task.file_id == file_id,
+                Task.status.in_([TaskStatus.pending.value, TaskStatus.running.value]),
+            )
+            .limit(1)
+        ).scalar_one_or_none()
+        if queued is None:
+            task_queue.enqueue(session, PREVIEW, file_id=file_id)
+            session.commit()
+            task_queue.notify()
+        return True
+
+    def evict(self) -> dict:
+        """快取超過上限時，刪除最久未使用的預覽直到降到上限的 90%"""
+        config = self.config
+        entries, total = [], 0
+        if os.path.isdir(config.CACHE_DIR):
+            for shard in os.scandir(config.CACHE_DIR):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        evicted_files = evicted_bytes = 0
+        if total > config.MAX_CACHE_BYTES:
+            target = config.MAX_CACHE_BYTES * 0.9
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted_files += 1
+                evicted_bytes += size
+        with self._lock:
+            self._stats["evicted_files"] += evicted_files
+            self._stats["evicted_bytes"] += evicted_bytes
+            self._cache_bytes = total
+        return {"evicted": evicted_files, "cache_bytes": total}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "cache_bytes": self._cache_bytes,
+            }
+
+
+previews = Previews()
+
+
+@task_queue.handler(PREVIEW)
+def generate_preview(session, task) -> dict:
+    record = session.get(File, task.file_id)
+    if record is None or record.deleted_at is not None:
+        return {"skipped": "file deleted"}
+    return previews.generate(session, record)
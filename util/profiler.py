@@ -0,0 +1,104 @@
+import cProfile
+import os
+import random
+import re
+import threading
+from datetime import datetime
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from util.auth import get_user_permissions
+
+PROFILE_PERMISSION = "system:profile"
+
+
+class RequestProfiler:
+    """
+    以 cProfile 取樣分析請求，並依路由保存 pstats 檔。
+
+    - 停用時完全不註冊 hook，對請求沒有任何負擔。
+    - 只在 before_request ~ after_request 之間分析，
+      回應本體 (send_file 的檔案串流) 在 after_request 之後才送出，不會被分析。
+    - 同一時間只分析一個請求，避免多個 profiler 互相干擾。
+    """
+
+    def __init__(self, profiler_config):
+        self.config = profiler_config
+        self.exclude = set(profiler_config.EXCLUDE_ENDPOINTS)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        if not self.config.ENABLED:
+            return
+        os.makedirs(self.config.OUTPUT_DIR, exist_ok=True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _is_forced(self) -> bool:
+        """帶有分析 header 且使用者有 system:profile 權限時強制分析"""
+        if self.config.HEADER not in request.headers:
+            return False
+        try:
+            verify_jwt_in_request(optional=True)
+            account = get_jwt_identity()
+        except Exception:
+            return False
+        return bool(account) and PROFILE_PERMISSION in get_user_permissions(account)
+
+    def _before_request(self):
+        if request.endpoint is None or request.endpoint in self.exclude:
+            return
+        forced = self._is_forced()
+        if not forced and random.random() >= self.config.SAMPLE_RATE:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+
+        g._profile_forced = forced
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+    def _stop(self):
+        profiler = g.pop("_profiler", None)
+        if profiler is None:
+            return None
+        profiler.disable()
+        self._lock.release()
+        return profiler
+
+    def _after_request(self, response):
+        profiler = self._stop()
+        if profiler is None:
+            return response
+        dump_name = self._save(profiler, request.endpoint)
+        if g.pop("_profile_forced", False) and dump_name:
+            response.headers["X-Profile-Dump"] = f"{request.endpoint}/{dump_name}"
+        return response
+
+    def _teardown_request(self, exc):
+        # 請求發生例外而沒有經過 after_request 時，仍需停止分析並釋放鎖
+        self._stop()
+
+    def _save(self, profiler, endpoint: str):
+        route_dir = os.path.join(self.config.OUTPUT_DIR, route_dirname(endpoint))
+        try:
+            os.makedirs(route_dir, exist_ok=True)
+            dump_name = datetime.now().strftime("%Y%m%d_%H%M%S_%f") + ".prof"
+            profiler.dump_stats(os.path.join(route_dir, dump_name))
+            self._prune(route_dir)
+            return dump_name
+        except OSError as e:
+            print(f"儲存效能分析檔失敗 ({endpoint}): {e}")
+            return None
+
+    def _prune(self, route_dir: str):
+        dumps = sorted(f for f in os.listdir(route_dir) if f.endswith(".prof"))
+        for name in dumps[: max(0, len(dumps) - self.config.MAX_DUMPS_PER_ROUTE)]:
+            os.remove(os.path.join(route_dir, name))
+
+
+def route_dirname(endpoint: str) -> str:
+    """將 endpoint 名稱轉為安全的目錄名稱"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", endpoint or "unknown")
@@ -0,0 +1,287 @@
+"""
+檔案配額的預留與計數。
+
+配額以 User 上的計數器維護，檢查與更新在同一個條件式 UPDATE 中完成:
+    UPDATE users SET reserved_file_count = reserved_file_count + 1,
+                     reserved_bytes = reserved_bytes + :size
+    WHERE id = :id AND file_count + reserved_file_count < :file_limit
+                   AND storage_bytes + reserved_bytes + :size <= :storage_bytes_limit
+影響筆數為 0 即代表超過配額，不會有「先 COUNT 再寫入」的競爭問題，
+也不需要在每次請求時對 files 做 COUNT / SUM。
+
+以下函式都不會 commit，由呼叫端與其他變更放在同一個交易中提交。
+"""
+
+from flask import abort
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from share.model.model import File, Role, User, user_roles_table
+
+
+def get_effective_role(session: Session, user_id: int) -> Role | None:
+    """取得使用者等級最高 (level 最小) 的角色，其限制即為使用者的有效配額"""
+    return session.execute(
+        select(Role)
+        .join(user_roles_table, user_roles_table.c.role_id == Role.id)
+        .where(user_roles_table.c.user_id == user_id)
+        .order_by(Role.level.asc())
+        .limit(1)
+    ).scalar_one_or_none()
+
+
+def reserve_upload(session: Session, user_id: int, file_size: int, count: int = 1) -> Role:
+    """
+    為一個新的上傳預留檔案數與位元組配額，超過配額時回傳 403。
+    取代既有檔案的新版本不增加檔案數 (count=0)，只預留增加的位元組數。
+    """
+    role = get_effective_role(session, user_id)
+    if role is None:
+        abort(403, "No role assigned, upload is not allowed.")
+    if role.storage_bytes_limit != -1 and file_size > role.storage_bytes_limit:
+        abort(
+            403,
+            f"Storage quota exceeded. Your limit is {role.storage_bytes_limit} bytes.",
+        )
+
+    stmt = update(User).where(User.id == user_id)
+    if role.file_limit != -1 and count > 0:
+        stmt = stmt.where(
+            User.file_count + User.reserved_file_count + count <= role.file_limit
+        )
+    if role.storage_bytes_limit != -1:
+        stmt = stmt.where(
+            User.storage_bytes + User.reserved_bytes + file_size
+            <= role.storage_bytes_limit
+        )
+    result = session.execute(
+        stmt.values(
+            reserved_file_count=User.reserved_file_count + count,
+            reserved_bytes=User.reserved_bytes + file_size,
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        _abort_quota_exceeded(session, user_id, role, file_size)
+    return role
+
+
+def _abort_quota_exceeded(session: Session, user_id: int, role: Role, file_size: int):
+    """條件式 UPDATE 失敗後，讀取計數器判斷是哪一種配額不足"""
+    user = session.get(User, user_id)
+    if (
+        role.file_limit != -1
+        and user.file_count + user.reserved_file_count >= role.file_limit
+    ):
+        abort(403, f"File quota exceeded. Your limit is {role.file_limit} files.")
+    abort(
+        403,
+        f"Storage quota exceeded. Your limit is {role.storage_bytes_limit} bytes.",
+    )
+
+
+def commit_reservation(
+    session: Session,
+    user_id: int,
+    reserved_size: int,
+    actual_size: int,
+    reserved_count: int = 1,
+):
+    """
+    上傳完成: 將預留轉為正式的檔案計數 (reserved_count 為預留時的檔案數)。
+    以實際寫入的位元組數再檢查一次儲存空間配額，超過時回傳 403 (預留維持不變)。
+    """
+    stmt = update(User).where(User.id == user_id)
+    role = get_effective_role(session, user_id)
+    if role is not None and role.storage_bytes_limit != -1:
+        stmt = stmt.where(
+            User.storage_bytes + User.reserved_bytes - reserved_size + actual_size
+            <= role.storage_bytes_limit
+        )
+    result = session.execute(
+        stmt.values(
+            reserved_file_count=User.reserved_file_count - reserved_count,
+            reserved_bytes=User.reserved_bytes - reserved_size,
+            file_count=User.file_count + 1,
+            storage_bytes=User.storage_bytes + actual_size,
+        ).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        abort(
+            403,
+            f"Storage quota exceeded. Your limit is {role.storage_bytes_limit} bytes.",
+        )
+
+
+def release_reservation(
+    session: Session, user_id: int, reserved_size: int, count: int = 1
+):
+    """上傳放棄或過期: 歸還預留的配額 (count 筆預留合計 reserved_size 位元組)"""
+    session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            reserved_file_count=User.reserved_file_count - count,
+            reserved_bytes=User.reserved_bytes - reserved_size,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def release_file(session: Session, file_record: File):
+    """檔案刪除後歸還配額"""
+    release_files(
+        session,
+        file_record.owner_id,
+        count=1,
+        size=file_record.file_size,
+        permanent_count=1 if file_record.is_permanent else 0,
+    )
+
+
+def release_files(
+    session: Session, user_id: int, count: int, size: int, permanent_count: int = 0
+):
+    """批次刪除後以一個 UPDATE 歸還配額"""
+    values = {
+        "file_count": User.file_count - count,
+        "storage_bytes": User.storage_bytes - size,
+    }
+    if permanent_count:
+        values["permanent_file_count"] = User.permanent_file_count - permanent_count
+    session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def restore_file(session: Session, file_record: File):
+    """復原軟刪除的檔案前重新計入配額，超過配額時回傳 403"""
+    role = get_effective_role(session, file_record.owner_id)
+    if role is None:
+        abort(403, "No role assigned.")
+
+    stmt = update(User).where(User.id == file_record.owner_id)
+    values = {
+        "file_count": User.file_count + 1,
+        "storage_bytes": User.storage_bytes + file_record.file_size,
+    }
+    if role.file_limit != -1:
+        stmt = stmt.where(User.file_count + User.reserved_file_count < role.file_limit)
+    if role.storage_bytes_limit != -1:
+        stmt = stmt.where(
+            User.storage_bytes + User.reserved_bytes + file_record.file_size
+            <= role.storage_bytes_limit
+        )
+    if file_record.is_permanent:
+        values["permanent_file_count"] = User.permanent_file_count + 1
+        if role.permanent_file_limit != -1:
+            stmt = stmt.where(User.permanent_file_count < role.permanent_file_limit)
+    result = session.execute(
+        stmt.values(**values).execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        abort(403, "Quota exceeded, the file cannot be restored.")
+
+
+def reserve_permanent(session: Session, user_id: int, count: int = 1):
+    """將檔案設為永久前預留永久檔案配額，超過配額時回傳 403"""
+    role = get_effective_role(session, user_id)
+    if role is None:
+        abort(403, "No role assigned.")
+
+    stmt = update(User).where(User.id == user_id)
+    if role.permanent_file_limit != -1:
+        stmt = stmt.where(
+            User.permanent_file_count + count <= role.permanent_file_limit
+        )
+    result = session.execute(
+        stmt.values(permanent_file_count=User.permanent_file_count + count)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        abort(
+            403,
+            f"Permanent file quota exceeded. Your limit is {role.permanent_file_limit} files.",
+        )
+
+
+def reserve_permanent_up_to(session: Session, user_id: int, count: int) -> int:
+    """
+    批次設為永久: 在剩餘的永久檔案配額內盡量預留，回傳實際預留的數量 (可能為 0)。
+    其他請求同時佔用配額時重新讀取剩餘數量再試。
+    """
+    role = get_effective_role(session, user_id)
+    if role is None or count <= 0:
+        return 0
+    if role.permanent_file_limit == -1:
+        reserve_permanent(session, user_id, count)
+        return count
+
+    for _ in range(3):
+        current = session.execute(
+            select(User.permanent_file_count).where(User.id == user_id)
+        ).scalar_one()
+        granted = min(count, role.permanent_file_limit - current)
+        if granted <= 0:
+            return 0
+        result = session.execute(
+            update(User)
+            .where(
+                User.id == user_id,
+                User.permanent_file_count + granted <= role.permanent_file_limit,
+            )
+            .values(permanent_file_count=User.permanent_file_count + granted)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            return granted
+    return 0
+
+
+def release_permanent(session: Session, user_id: int, count: int = 1):
+    """檔案取消永久後歸還永久檔案配額"""
+    session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(permanent_file_count=User.permanent_file_count - count)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def recount_user_quota(session: Session, user_id: int):
+    """由 files 與 upload_sessions 重新計算計數器 (資料修復 / 升級時使用)"""
+    from sqlalchemy import case, func
+
+    from share.model.model import UploadSession
+    from share.define.model_enum import UploadStatus
+
+    file_count, storage_bytes, permanent_count = session.execute(
+        select(
+            func.count(File.id),
+            func.coalesce(func.sum(File.file_size), 0),
+            func.coalesce(func.sum(case((File.is_permanent == True, 1), else_=0)), 0),
+        ).where(File.owner_id == user_id, File.deleted_at.is_(None))
+    ).one()
+    reserved_count, reserved_bytes = session.execute(
+        select(
+            func.count(UploadSession.id),
+            func.coalesce(func.sum(UploadSession.file_size), 0),
+        ).where(
+            UploadSession.owner_id == user_id,
+            UploadSession.status == UploadStatus.active.value,
+        )
+    ).one()
+    session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            file_count=file_count,
+            storage_bytes=storage_bytes,
+            permanent_file_count=permanent_count,
+            reserved_file_count=reserved_count,
+            reserved_bytes=reserved_bytes,
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,152 @@
+"""
+以 token bucket 限制上傳/下載頻寬。
+
+每個使用者、每個分享連結以及全域各有一個 bucket (依方向區分)，
+串流時每送出/讀入一個區塊就向所有相關的 bucket 扣除對應位元組，
+任一個 bucket 不足時該請求會短暫等待，其他請求不受影響。
+"""
+
+import threading
+import time
+
+from util.global_variable import global_variable
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class TokenBucket:
+    """
+    以「預支」方式實作的 token bucket: 先扣除，不足的部分換算成等待時間，
+    鎖只保護數值計算，等待 (sleep) 在鎖外進行。
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.last_used = self._updated
+
+    def consume(self, amount: int):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self.last_used = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+class BandwidthLimiter:
+    """依設定建立並管理各種 token bucket"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        return global_variable.config.BANDWIDTH
+
+    def _bucket(self, key: tuple, rate: int) -> TokenBucket | None:
+        if rate <= 0:
+            return None
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.rate != rate:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None or bucket.rate != rate:
+                    bucket = TokenBucket(rate, rate * self.config.BURST_SECONDS)
+                    self._buckets[key] = bucket
+        return bucket
+
+    def buckets_for(
+        self,
+        direction: str,
+        account: str | None = None,
+        level: int | None = None,
+        share_key: str | None = None,
+    ) -> list[TokenBucket]:
+        """
+        取得一個傳輸需要扣除的所有 bucket。
+        - account + level: 依 Role.level 決定的個人限制
+        - share_key: 分享連結 (或簽章網址) 的限制
+        - 全域限制一律套用
+        """
+        config = self.config
+        if not config.ENABLED:
+            return []
+
+        if direction == UPLOAD:
+            global_rate = config.GLOBAL_UPLOAD_BPS
+            level_rates = config.USER_UPLOAD_BPS_BY_LEVEL
+        else:
+            global_rate = config.GLOBAL_DOWNLOAD_BPS
+            level_rates = config.USER_DOWNLOAD_BPS_BY_LEVEL
+
+        buckets = [self._bucket(("global", direction), global_rate)]
+        if account is not None:
+            rate = level_rates.get(str(level), config.DEFAULT_USER_BPS)
+            buckets.append(self._bucket(("user", direction, account), rate))
+        if share_key is not None:
+            buckets.append(
+                self._bucket(("share", direction, share_key), config.SHARE_DOWNLOAD_BPS)
+            )
+        return [bucket for bucket in buckets if bucket is not None]
+
+    def prune(self, idle_seconds: float = 600):
+        """移除長時間沒有使用的 bucket"""
+        threshold = time.monotonic() - idle_seconds
+        with self._lock:
+            for key in [k for k, b in self._buckets.items() if b.last_used < threshold]:
+                del self._buckets[key]
+
+
+bandwidth_limiter = BandwidthLimiter()
+
+
+def throttle_iter(iterable, buckets: list[TokenBucket]):
+    """依 bucket 限制輸出速度的 iterator 包裝，結束時會關閉原本的 iterable"""
+    try:
+        for chunk in iterable:
+            size = len(chunk)
+            for bucket in buckets:
+                bucket.consume(size)
+            yield chunk
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+
+
+def read_throttled(stream, buckets: list[TokenBucket]) -> bytes:
+    """依 bucket 限制速度讀取整個請求本體"""
+    parts = []
+    while True:
+        data = stream.read(STREAM_BLOCK_SIZE)
+        if not data:
+            break
+        for bucket in buckets:
+            bucket.consume(len(data))
+        parts.append(data)
+    return b"".join(parts)
+
+
+class ThrottledReader:
+    """包裝請求本體，依 bucket 限制讀取速度 (不需要先讀入整個本體)"""
+
+    def __init__(self, stream, buckets: list[TokenBucket]):
+        self._stream = stream
+        self._buckets = buckets
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._stream.read(size)
+        for bucket in self._buckets:
+            bucket.consume(len(data))
+        return data
@@ -1,5 +1,19 @@
+from datetime import datetime
 from apscheduler.util import undefined
-from .job_classes import DeleteExpiredFilesJob
+from .job_classes import (
+    DeleteExpiredFilesJob,
+    RebuildShareTokenBloomJob,
+    PruneBandwidthBucketsJob,
+    SweepAbandonedUploadsJob,
+    RebalanceVolumesJob,
+    CompressFilesJob,
+    FlushFileAccessJob,
+    TierFilesJob,
+    ReapTrashJob,
+    MaintainTaskQueueJob,
+    EvictPreviewCacheJob,
+    EvictDeltaSignaturesJob,
+)
 
 scheduler_jobs = []
 
@@ -36,3 +50,121 @@ add_job(
     hours=12,
     id="job_delete_expired_files",
 )
+
+
+# 註冊「重建分享連結 Bloom filter」任務，啟動時立即執行一次，之後每分鐘執行
+add_job(
+    RebuildShareTokenBloomJob().run,
+    trigger="interval",
+    minutes=1,
+    next_run_time=datetime.now(),
+    id="job_rebuild_share_token_bloom",
+)
+
+
+# 註冊「清除閒置頻寬 bucket」任務，每 10 分鐘執行一次
+add_job(
+    PruneBandwidthBucketsJob().run,
+    trigger="interval",
+    minutes=10,
+    id="job_prune_bandwidth_buckets",
+)
+
+
+# 註冊「清除放棄的上傳」任務，每 5 分鐘執行一次
+add_job(
+    SweepAbandonedUploadsJob().run,
+    trigger="interval",
+    minutes=5,
+    max_instances=1,
+    coalesce=True,
+    id="job_sweep_abandoned_uploads",
+)
+
+
+# 註冊「磁碟區重新平衡」任務，每 30 分鐘執行一次 (FILE.rebalance.ENABLED 關閉時只清理舊檔)
+add_job(
+    RebalanceVolumesJob().run,
+    trigger="interval",
+    minutes=30,
+    max_instances=1,
+    coalesce=True,
+    id="job_rebalance_volumes",
+)
+
+
+# 註冊「靜態壓縮」任務，每 5 分鐘處理一批 (AT_REST_COMPRESSION.ENABLED 關閉時不做事)
+add_job(
+    CompressFilesJob().run,
+    trigger="interval",
+    minutes=5,
+    max_instances=1,
+    coalesce=True,
+    id="job_compress_files",
+)
+
+
+# 註冊「寫入下載紀錄」任務，每分鐘執行一次
+add_job(
+    FlushFileAccessJob().run,
+    trigger="interval",
+    minutes=1,
+    max_instances=1,
+    coalesce=True,
+    id="job_flush_file_access",
+)
+
+
+# 註冊「冷熱分層」任務，每小時執行一次 (TIERING.ENABLED 關閉時不做事)
+add_job(
+    TierFilesJob().run,
+    trigger="interval",
+    hours=1,
+    max_instances=1,
+    coalesce=True,
+    id="job_tier_files",
+)
+
+
+# 註冊「回收垃圾桶」任務，每分鐘執行一次
+add_job(
+    ReapTrashJob().run,
+    trigger="interval",
+    minutes=1,
+    max_instances=1,
+    coalesce=True,
+    id="job_reap_trash",
+)
+
+
+# 註冊「背景任務佇列維護」任務，每分鐘執行一次
+add_job(
+    MaintainTaskQueueJob().run,
+    trigger="interval",
+    minutes=1,
+    max_instances=1,
+    coalesce=True,
+    id="job_maintain_task_queue",
+)
+
+
+# 註冊「回收預覽快取」任務，每 10 分鐘執行一次
+add_job(
+    EvictPreviewCacheJob().run,
+    trigger="interval",
+    minutes=10,
+    max_instances=1,
+    coalesce=True,
+    id="job_evict_preview_cache",
+)
+
+
+# 註冊「回收差異上傳簽章」任務，每 10 分鐘執行一次
+add_job(
+    EvictDeltaSignaturesJob().run,
+    trigger="interval",
+    minutes=10,
+    max_instances=1,
+    coalesce=True,
+    id="job_evict_delta_signatures",
+)
@@ -0,0 +1,45 @@
+"""
+既有主資料庫的結構升級 (見 app.py upgradedb)。
+
+依 share.model.model 的定義補上缺少的資料表、欄位與索引，可以重複執行。
+新增的欄位都允許 NULL 或有 server_default，SQLite 也能以 ALTER TABLE ADD COLUMN 加入。
+只會新增，不會修改或刪除既有的欄位。
+"""
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from share.model.model import Base
+
+
+def upgrade_schema(engine, dry_run: bool = False) -> list[str]:
+    """補上缺少的資料表、欄位與索引，回傳執行的 DDL (dry_run 時只回傳、不執行)"""
+    executed = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                if not dry_run:
+                    table.create(conn)
+                executed.append(f"CREATE TABLE {table.name} (...)")
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=conn.dialect)
+                statement = f"ALTER TABLE {table.name} ADD COLUMN {ddl}"
+                if not dry_run:
+                    conn.exec_driver_sql(statement)
+                executed.append(statement)
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    if not dry_run:
+                        index.create(conn)
+                    executed.append(f"CREATE INDEX {index.name} ON {table.name}")
+    return executed
@@ -0,0 +1,213 @@
+"""
+公開分享連結 (share_token) 的解析快取。
+
+- 正向快取: share_token -> 檔案資訊，命中時不需查詢資料庫也不需檢查檔案是否存在。
+- 負向快取: 查不到的 token 也快取一段時間，避免重複查詢。
+- Bloom filter: 由所有有效 token 建立，不在其中的 token 直接拒絕
+  (例如機器人亂猜的 token)，完全不碰資料庫。
+
+快取只存在於目前行程，建立/移除分享、刪除檔案與過期任務會主動失效，
+Bloom filter 另由排程任務定期重建，讓其他行程建立的 token 也能被看見。
+其他行程在本行程上次重建後建立的 token 還不在 Bloom filter 中，
+因此 token 的開頭記錄建立時間，建立時間晚於重建時間的 token 不由 Bloom filter 拒絕，改查詢資料庫。
+"""
+
+import hashlib
+import math
+import secrets
+import threading
+import time
+from dataclasses import dataclass
+
+from share.model.model import File
+from util.cache import LRUCache
+from util.db import get_db_session
+from util.storage_backend import storage
+
+# 各主機時鐘的誤差容許範圍 (秒)
+CLOCK_SKEW_SECONDS = 60
+
+
+def new_share_token() -> str:
+    """32 個 hex 字元: 建立時間 (unix 秒, 8 字元) + 96 位元的亂數"""
+    return f"{int(time.time()) & 0xFFFFFFFF:08x}{secrets.token_hex(12)}"
+
+
+def _created_at(share_token: str) -> int | None:
+    try:
+        return int(share_token[:8], 16)
+    except ValueError:
+        return None
+
+
+class BloomFilter:
+    """固定大小的 Bloom filter (只支援加入，不支援移除)"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1024)
+        self.size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+@dataclass(frozen=True)
+class SharedFile:
+    """分享連結對應的檔案資訊"""
+
+    file_id: int
+    safe_filename: str
+    storage_path: str
+    filename: str
+    size: int
+    mtime: float
+
+
+class ShareTokenCache:
+    """share_token 的解析快取 (含負向快取與 Bloom filter)"""
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 60,
+        negative_maxsize: int = 50000,
+        negative_ttl: float = 30,
+    ):
+        self._positive = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._negative = LRUCache(maxsize=negative_maxsize, ttl=negative_ttl)
+        self._bloom = None  # 尚未建立前不做 Bloom 判斷
+        self._bloom_built_at = 0.0  # 重建時查詢資料庫的時間
+        self._bloom_lock = threading.Lock()
+        self._added_during_rebuild = None
+        self.bloom_rejects = 0
+        self.db_lookups = 0
+
+    def configure(self, share_cache_config):
+        """依設定檔調整快取大小與 TTL"""
+        self._positive = LRUCache(
+            maxsize=share_cache_config.MAXSIZE, ttl=share_cache_config.TTL_SECONDS
+        )
+        self._negative = LRUCache(
+            maxsize=share_cache_config.NEGATIVE_MAXSIZE,
+            ttl=share_cache_config.NEGATIVE_TTL_SECONDS,
+        )
+
+    def lookup(self, share_token: str) -> SharedFile | None:
+        shared = self._positive.get(share_token)
+        if shared is not None:
+            return shared
+        if self._negative.get(share_token):
+            return None
+        bloom = self._bloom
+        if (
+            bloom is not None
+            and share_token not in bloom
+            and not self._maybe_newer(share_token)
+        ):
+            self.bloom_rejects += 1
+            return None
+
+        self.db_lookups += 1
+        with get_db_session() as db:
+            record = (
+                db.query(File)
+                .filter(File.share_token == share_token, File.deleted_at.is_(None))
+                .one_or_none()
+            )
+            shared = self._load(record) if record else None
+
+        if shared is None:
+            self._negative.set(share_token, True)
+            return None
+        self._positive.set(share_token, shared)
+        return shared
+
+    def _maybe_newer(self, share_token: str) -> bool:
+        """
+        token 可能是在 Bloom filter 重建之後 (由其他行程) 建立的。
+        重建前建立但查詢後才 commit 的 token 也由 CLOCK_SKEW_SECONDS 涵蓋。
+        偽造建立時間的 token 只是改為查詢資料庫 (之後進入負向快取)。
+        """
+        created_at = _created_at(share_token)
+        return created_at is None or created_at >= self._bloom_built_at - CLOCK_SKEW_SECONDS
+
+    @staticmethod
+    def _load(record: File) -> SharedFile | None:
+        stat = storage.for_location(record.storage_path).stat(record.storage_path)
+        if stat is None:
+            return None
+        return SharedFile(
+            file_id=record.id,
+            safe_filename=record.safe_filename,
+            storage_path=record.storage_path,
+            filename=record.filename,
+            size=stat.size,
+            mtime=stat.mtime,
+        )
+
+    def add(self, share_token: str):
+        """新的分享連結建立後呼叫"""
+        self._negative.pop(share_token)
+        with self._bloom_lock:
+            if self._bloom is not None:
+                self._bloom.add(share_token)
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append(share_token)
+
+    def invalidate(self, share_token: str | None):
+        """分享連結移除或檔案刪除後呼叫"""
+        if share_token:
+            self._positive.pop(share_token)
+
+    def rebuild_bloom(self):
+        """以資料庫中所有有效的 share_token 重建 Bloom filter"""
+        with self._bloom_lock:
+            self._added_during_rebuild = []
+        built_at = time.time()
+        with get_db_session() as db:
+            tokens = [
+                token
+                for (token,) in db.query(File.share_token).filter(
+                    File.share_token.isnot(None)
+                )
+            ]
+        # 預留兩倍空間給重建前新增的 token
+        bloom = BloomFilter(capacity=len(tokens) * 2)
+        for token in tokens:
+            bloom.add(token)
+        with self._bloom_lock:
+            # 查詢期間新增的 token 可能不在查詢結果中，一併補上
+            for token in self._added_during_rebuild:
+                bloom.add(token)
+            self._added_during_rebuild = None
+            self._bloom = bloom
+            self._bloom_built_at = built_at
+        # 其他行程可能建立了新 token，清除負向快取避免誤判
+        self._negative.clear()
+        return len(tokens)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._positive.hits,
+            "misses": self._positive.misses,
+            "negative_hits": self._negative.hits,
+            "bloom_rejects": self.bloom_rejects,
+            "db_lookups": self.db_lookups,
+            "entries": len(self._positive),
+        }
+
+
+share_cache = ShareTokenCache()
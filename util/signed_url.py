@@ -0,0 +1,193 @@
+"""
+無狀態的 HMAC 簽章下載網址。
+
+token 格式: `<kid>.<payload>.<signature>` (皆為 base64url，無 padding)
+- payload: file_id、owner_id、到期時間 (unix 秒)、允許的位元組範圍 [start, end)
+  (end 為 0 表示整個檔案)、safe_filename 的雜湊。
+  SQLite 會重複使用已刪除紀錄的 rowid，下載時比對 safe_filename 的雜湊，
+  檔案刪除後同一個 file_id 的新檔案不會被舊網址下載。
+- signature: HMAC-SHA256(key[kid], "<kid>.<payload>") 的前 16 bytes。
+
+驗證只需一次 HMAC 與常數時間比較，不需解 JWT 也不需查資料庫。
+金鑰輪替: 在 SIGNED_URL.KEYS 新增一組 kid，將 ACTIVE_KEY 指向它，
+舊的 kid 保留到所有舊網址過期後再移除。
+"""
+
+import base64
+import hashlib
+import hmac
+import struct
+import time
+from dataclasses import dataclass
+
+from share.model.model import File
+from util.cache import LRUCache
+from util.db import get_db_session
+from util.global_variable import global_variable
+from util.storage_backend import storage
+
+_PAYLOAD = struct.Struct(">QQIQQ8s")
+_SIGNATURE_BYTES = 16
+_FILE_TAG_BYTES = 8
+
+
+class InvalidSignedURL(Exception):
+    """簽章網址格式錯誤、簽章不符或已過期"""
+
+
+@dataclass(frozen=True)
+class SignedGrant:
+    """驗證通過的簽章網址內容"""
+
+    file_id: int
+    owner_id: int
+    expires_at: int
+    range_start: int
+    range_end: int  # 0 表示不限制
+    file_tag: bytes  # safe_filename 的雜湊
+
+
+@dataclass(frozen=True)
+class FileMeta:
+    """下載所需的檔案資訊 (快取於記憶體)"""
+
+    file_id: int
+    owner_id: int
+    safe_filename: str
+    filename: str
+    storage_path: str
+
+
+# file_id -> FileMeta，熱門連結命中後不需再查 SQLite
+file_meta_cache = LRUCache(maxsize=4096)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signing_keys() -> dict[str, bytes]:
+    """取得所有可驗證的金鑰；未設定時由 JWT 金鑰衍生一組預設金鑰"""
+    config = global_variable.config
+    if config.SIGNED_URL.KEYS:
+        return {kid: key.encode() for kid, key in config.SIGNED_URL.KEYS.items()}
+    derived = hmac.new(
+        config.JWT.JWT_SECRET_KEY.encode(), b"signed-url", hashlib.sha256
+    ).digest()
+    return {"0": derived}
+
+
+def _active_kid(keys: dict[str, bytes]) -> str:
+    active = global_variable.config.SIGNED_URL.ACTIVE_KEY
+    if active and active in keys:
+        return active
+    return next(iter(keys))
+
+
+def file_tag(safe_filename: str) -> bytes:
+    """簽章 token 中用來確認是同一個檔案的 safe_filename 雜湊"""
+    return hashlib.blake2b(safe_filename.encode(), digest_size=_FILE_TAG_BYTES).digest()
+
+
+def _sign(key: bytes, message: bytes) -> bytes:
+    return hmac.new(key, message, hashlib.sha256).digest()[:_SIGNATURE_BYTES]
+
+
+def sign(
+    file_id: int,
+    owner_id: int,
+    safe_filename: str,
+    expires_in: int | None = None,
+    range_start: int = 0,
+    range_end: int = 0,
+) -> str:
+    """簽發一個簽章 token"""
+    if expires_in is None:
+        expires_in = global_variable.config.SIGNED_URL.EXPIRES_SECONDS
+    keys = _signing_keys()
+    kid = _active_kid(keys)
+    payload = _b64encode(
+        _PAYLOAD.pack(
+            file_id,
+            owner_id,
+            int(time.time()) + expires_in,
+            range_start,
+            range_end,
+            file_tag(safe_filename),
+        )
+    )
+    message = f"{kid}.{payload}"
+    return f"{message}.{_b64encode(_sign(keys[kid], message.encode()))}"
+
+
+def verify(token: str) -> SignedGrant:
+    """驗證簽章 token，失敗時拋出 InvalidSignedURL"""
+    try:
+        kid, payload, signature = token.split(".")
+        key = _signing_keys()[kid]
+        expected = _sign(key, f"{kid}.{payload}".encode())
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            raise InvalidSignedURL("Invalid signature.")
+        grant = SignedGrant(*_PAYLOAD.unpack(_b64decode(payload)))
+    except InvalidSignedURL:
+        raise
+    except (ValueError, KeyError, struct.error) as e:
+        raise InvalidSignedURL("Malformed signed URL.") from e
+
+    if grant.expires_at < time.time():
+        raise InvalidSignedURL("Signed URL has expired.")
+    return grant
+
+
+def sign_path(path: str) -> str:
+    """
+    為內容固定、不會過期的路徑 (例如以內容雜湊命名的預覽圖) 簽章，回傳 `<kid>.<signature>`。
+    同一個路徑的簽章固定不變，瀏覽器可以長期快取。
+    """
+    keys = _signing_keys()
+    kid = _active_kid(keys)
+    return f"{kid}.{_b64encode(_sign(keys[kid], f'path:{path}'.encode()))}"
+
+
+def verify_path(path: str, signature: str) -> bool:
+    try:
+        kid, mac = signature.split(".")
+        expected = _sign(_signing_keys()[kid], f"path:{path}".encode())
+        return hmac.compare_digest(expected, _b64decode(mac))
+    except (ValueError, KeyError):
+        return False
+
+
+def signed_download_url(token: str) -> str:
+    """組合簽章 token 的完整下載網址"""
+    return f"{global_variable.config.APP.PUBLIC_DOMAIN}/api/files/signed/{token}"
+
+
+def resolve_file(file_id: int) -> FileMeta | None:
+    """
+    取得檔案資訊，優先使用記憶體快取，未命中才查詢資料庫。
+    快取中的檔案若已不在磁碟上 (例如被其他行程刪除) 則視為失效。
+    """
+    meta = file_meta_cache.get(file_id)
+    if meta is not None:
+        if storage.for_location(meta.storage_path).stat(meta.storage_path) is not None:
+            return meta
+        file_meta_cache.pop(file_id)
+
+    with get_db_session() as db:
+        record = db.get(File, file_id)
+        if record is None or record.deleted_at is not None:
+            return None
+        meta = FileMeta(
+            file_id=record.id,
+            owner_id=record.owner_id,
+            safe_filename=record.safe_filename,
+            filename=record.filename,
+            storage_path=record.storage_path,
+        )
+    file_meta_cache.set(file_id, meta)
+    return meta
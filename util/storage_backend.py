@@ -0,0 +1,480 @@
+"""
+檔案儲存後端。
+
+上傳、下載、刪除與過期任務都透過 StorageBackend 存取檔案，
+File.storage_path / UploadSession.temp_path 記錄的是「位置」(location):
+- 本機檔案: 一般的檔案路徑 (與舊資料相容)
+- S3 相容儲存: s3://<bucket>/<key>
+- pack 檔中的冷資料: pack://<pack 檔名>/<offset>/<length> (見 util/tiering.py)
+
+新的上傳寫入 STORAGE.BACKEND 指定的後端；讀取與刪除依位置的格式決定後端，
+因此切換後端後，既有的檔案仍可正常下載與刪除:
+本機與 pack 後端一律註冊；STORAGE.S3.BUCKET 有設定時 S3 後端也一律註冊 (供讀取與刪除)，
+由 s3 切換回 local 時保留 S3 設定即可繼續讀取既有的 s3:// 檔案。
+S3 後端需要另外安裝 boto3。
+"""
+
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Iterator
+
+from util import at_rest_compression, file_ops
+from util.volumes import volume_manager
+
+try:
+    import boto3
+    from botocore.config import Config as BotoConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # boto3 為選用套件，只有使用 S3 後端時需要
+    boto3 = None
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+class InvalidPart(ValueError):
+    """分塊不符合後端的限制 (例如 S3 multipart 需要對齊 chunk_size)"""
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    size: int
+    mtime: float
+
+
+@dataclass(frozen=True)
+class UploadTarget:
+    """begin_upload 的結果，對應 UploadSession.temp_path / backend_upload_id"""
+
+    temp_location: str
+    backend_upload_id: str | None = None
+
+
+class ReadableStorageBackend(ABC):
+    """可讀取與刪除檔案的後端介面 (pack 檔等只能讀取的後端直接實作此介面)"""
+
+    name = ""
+
+    @abstractmethod
+    def owns(self, location: str) -> bool:
+        """位置是否屬於此後端"""
+
+    @abstractmethod
+    def stat(self, location: str) -> StoredObject | None:
+        """檔案的大小與修改時間，不存在時回傳 None"""
+
+    @abstractmethod
+    def open_range(self, location: str, start: int, end: int) -> Iterator[bytes]:
+        """逐塊讀取 [start, end) 的內容"""
+
+    @abstractmethod
+    def delete(self, location: str) -> bool:
+        """刪除檔案，檔案原本就不存在時回傳 False"""
+
+    def local_path(self, location: str) -> str | None:
+        """可直接以本機路徑讀取時回傳路徑 (可使用 send_file / 熱門檔案快取)"""
+        return None
+
+    def presigned_url(self, location: str, filename: str, expires: int) -> str | None:
+        """回傳可直接下載的預簽章網址，不支援時回傳 None"""
+        return None
+
+
+class StorageBackend(ReadableStorageBackend):
+    """可接收上傳的儲存後端介面 (未實作全部方法的子類別無法建立實例)"""
+
+    @abstractmethod
+    def begin_upload(self, account: str, upload_id: str, size: int) -> UploadTarget:
+        """開始一個上傳"""
+
+    @abstractmethod
+    def put_part(
+        self,
+        target: UploadTarget,
+        offset: int,
+        data: bytes,
+        part_size: int,
+        total_size: int,
+        sync: bool = False,
+    ):
+        """寫入 offset 開始的分塊，不符合後端限制時拋出 InvalidPart"""
+
+    @abstractmethod
+    def uploaded_size(self, target: UploadTarget) -> int | None:
+        """已上傳的位元組數，上傳不存在時回傳 None"""
+
+    @abstractmethod
+    def complete_upload(
+        self, target: UploadTarget, account: str, final_name: str, sync: bool = False
+    ) -> str:
+        """完成上傳並回傳檔案的位置"""
+
+    @abstractmethod
+    def undo_complete(self, location: str, target: UploadTarget):
+        """complete_upload 之後資料庫寫入失敗時復原"""
+
+    @abstractmethod
+    def abort_upload(self, target: UploadTarget) -> int | None:
+        """放棄上傳並清除已上傳的資料，回傳回收的位元組數 (不存在時回傳 None)"""
+
+
+class LocalStorageBackend(StorageBackend):
+    """本機檔案系統"""
+
+    name = "local"
+
+    def __init__(self):
+        self.upload_temp_dir = "upload_temp"
+        self.temp_in_storage = False
+
+    def configure(self, app_config):
+        self.upload_temp_dir = app_config.UPLOAD_TEMP_DIR
+        self.temp_in_storage = app_config.UPLOAD_TEMP_IN_STORAGE
+
+    def owns(self, location: str) -> bool:
+        return "://" not in location
+
+    def begin_upload(self, account, upload_id, size):
+        if self.temp_in_storage:
+            # 先選好磁碟區，暫存檔與最終檔案在同一個目錄 (同一個檔案系統)，完成時 rename 即可
+            volume = volume_manager.choose(upload_id, size)
+            temp_path = os.path.join(
+                volume_manager.user_dir(volume, account), f".{upload_id}.tmp"
+            )
+        else:
+            temp_dir = os.path.join(self.upload_temp_dir, account)
+            os.makedirs(temp_dir, exist_ok=True)
+            temp_path = os.path.join(temp_dir, upload_id + ".tmp")
+        # 建立一個臨時檔案來儲存上傳進度
+        with open(temp_path, "wb"):
+            pass
+        return UploadTarget(temp_path)
+
+    def put_part(self, target, offset, data, part_size, total_size, sync=False):
+        if not os.path.exists(target.temp_location):
+            raise FileNotFoundError(target.temp_location)
+        file_ops.write_chunk(target.temp_location, offset, data, sync=sync)
+
+    def uploaded_size(self, target):
+        try:
+            return os.path.getsize(target.temp_location)
+        except FileNotFoundError:
+            return None
+
+    def complete_upload(self, target, account, final_name, sync=False):
+        volume = None
+        if self.temp_in_storage:
+            volume = volume_manager.volume_of(target.temp_location)
+        if volume is None:
+            size = os.path.getsize(target.temp_location)
+            volume = volume_manager.choose(final_name, size)
+        final_path = volume_manager.file_path(volume, account, final_name)
+        # 同一檔案系統為 rename，跨檔案系統在核心內複製
+        file_ops.finalize_file(target.temp_location, final_path, sync=sync)
+        return final_path
+
+    def undo_complete(self, location, target):
+        file_ops.finalize_file(location, target.temp_location)
+
+    def abort_upload(self, target):
+        try:
+            size = os.stat(target.temp_location).st_size
+            os.remove(target.temp_location)
+        except FileNotFoundError:
+            return None
+        return size
+
+    def stat(self, location):
+        path = volume_manager.resolve(location)
+        try:
+            st = os.stat(path)
+            size = st.st_size
+            if at_rest_compression.is_compressed(location):
+                # 回傳原始內容的大小
+                size = at_rest_compression.read_seek_table(path).raw_size
+        except (OSError, ValueError):
+            return None
+        return StoredObject(size=size, mtime=st.st_mtime)
+
+    def open_range(self, location, start, end):
+        if at_rest_compression.is_compressed(location):
+            yield from at_rest_compression.open_range(volume_manager.resolve(location), start, end)
+            return
+        with open(volume_manager.resolve(location), "rb") as f:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def delete(self, location):
+        try:
+            os.remove(volume_manager.resolve(location))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def local_path(self, location):
+        return volume_manager.resolve(location)
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3 相容儲存 (AWS S3 / MinIO 等)。
+    - 分塊上傳對應 multipart upload: 第 N 個 chunk_size 區塊即為 part N+1，
+      因此除了最後一塊，每個分塊都必須從 chunk_size 的倍數開始且長度剛好為 chunk_size。
+    - 下載可直接轉址到預簽章網址，檔案內容不經過本伺服器。
+    """
+
+    name = "s3"
+    SCHEME = "s3://"
+
+    def __init__(self, s3_config):
+        if boto3 is None:
+            raise RuntimeError("The S3 storage backend requires the boto3 package.")
+        self.bucket = s3_config.BUCKET
+        self.prefix = s3_config.PREFIX
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=s3_config.ENDPOINT_URL,
+            region_name=s3_config.REGION,
+            aws_access_key_id=s3_config.ACCESS_KEY,
+            aws_secret_access_key=s3_config.SECRET_KEY,
+            config=BotoConfig(s3={"addressing_style": s3_config.ADDRESSING_STYLE}),
+        )
+
+    def owns(self, location: str) -> bool:
+        return location.startswith(self.SCHEME)
+
+    def _location(self, key: str) -> str:
+        return f"{self.SCHEME}{self.bucket}/{key}"
+
+    def _split(self, location: str) -> tuple[str, str]:
+        bucket, _, key = location[len(self.SCHEME) :].partition("/")
+        return bucket, key
+
+    def _list_parts(self, target: UploadTarget) -> list[dict]:
+        bucket, key = self._split(target.temp_location)
+        parts = []
+        paginator = self.client.get_paginator("list_parts")
+        for page in paginator.paginate(
+            Bucket=bucket, Key=key, UploadId=target.backend_upload_id
+        ):
+            parts.extend(page.get("Parts", []))
+        return parts
+
+    def begin_upload(self, account, upload_id, size):
+        key = f"{self.prefix}{account}/{upload_id}"
+        result = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        return UploadTarget(self._location(key), result["UploadId"])
+
+    def put_part(self, target, offset, data, part_size, total_size, sync=False):
+        is_last = offset + len(data) == total_size
+        if offset % part_size != 0 or (len(data) != part_size and not is_last):
+            raise InvalidPart(
+                f"Chunks must start at a multiple of {part_size} bytes and be "
+                f"exactly {part_size} bytes long (except the last one)."
+            )
+        bucket, key = self._split(target.temp_location)
+        try:
+            self.client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=target.backend_upload_id,
+                PartNumber=offset // part_size + 1,
+                Body=data,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchUpload":
+                raise FileNotFoundError(target.temp_location) from e
+            raise
+
+    def uploaded_size(self, target):
+        try:
+            return sum(part["Size"] for part in self._list_parts(target))
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchUpload":
+                return None
+            raise
+
+    def complete_upload(self, target, account, final_name, sync=False):
+        bucket, key = self._split(target.temp_location)
+        parts = self._list_parts(target)
+        if not parts:
+            # multipart upload 不允許 0 個 part，空檔案改用一般上傳
+            self.client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=target.backend_upload_id
+            )
+            self.client.put_object(Bucket=bucket, Key=key, Body=b"")
+        else:
+            self.client.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=target.backend_upload_id,
+                MultipartUpload={
+                    "Parts": [
+                        {"ETag": part["ETag"], "PartNumber": part["PartNumber"]}
+                        for part in sorted(parts, key=lambda p: p["PartNumber"])
+                    ]
+                },
+            )
+        return target.temp_location
+
+    def undo_complete(self, location, target):
+        # 已完成的 multipart upload 無法復原，刪除物件讓上傳會話由過期任務清除
+        self.delete(location)
+
+    def abort_upload(self, target):
+        bucket, key = self._split(target.temp_location)
+        try:
+            size = sum(part["Size"] for part in self._list_parts(target))
+            self.client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=target.backend_upload_id
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchUpload":
+                return None
+            raise
+        return size
+
+    def stat(self, location):
+        bucket, key = self._split(location)
+        try:
+            head = self.client.head_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StoredObject(
+            size=head["ContentLength"], mtime=head["LastModified"].timestamp()
+        )
+
+    def open_range(self, location, start, end):
+        if start >= end:
+            return
+        bucket, key = self._split(location)
+        body = self.client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}"
+        )["Body"]
+        try:
+            yield from body.iter_chunks(STREAM_BLOCK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, location):
+        if self.stat(location) is None:
+            return False
+        bucket, key = self._split(location)
+        self.client.delete_object(Bucket=bucket, Key=key)
+        return True
+
+    def presigned_url(self, location, filename, expires):
+        from util.file_response import content_disposition
+
+        bucket, key = self._split(location)
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket,
+                "Key": key,
+                "ResponseContentDisposition": content_disposition(filename),
+            },
+            ExpiresIn=expires,
+        )
+
+
+class PackStorageBackend(ReadableStorageBackend):
+    """
+    打包在 pack 檔中的冷資料，只能讀取。
+    位置本身即為索引 (pack 檔名、offset、長度)，讀取時直接 seek，不需要解開 pack 檔。
+    刪除只會讓該區段成為無效空間，不會改寫 pack 檔。
+    """
+
+    name = "pack"
+    SCHEME = "pack://"
+
+    def __init__(self, pack_dir: str = "packs"):
+        self.pack_dir = pack_dir
+
+    def owns(self, location: str) -> bool:
+        return location.startswith(self.SCHEME)
+
+    def location(self, pack_name: str, offset: int, length: int) -> str:
+        return f"{self.SCHEME}{pack_name}/{offset}/{length}"
+
+    def parse(self, location: str) -> tuple[str, int, int]:
+        """回傳 (pack 檔路徑, offset, length)"""
+        pack_name, offset, length = location[len(self.SCHEME) :].split("/")
+        return os.path.join(self.pack_dir, pack_name), int(offset), int(length)
+
+    def stat(self, location):
+        path, _, length = self.parse(location)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return StoredObject(size=length, mtime=st.st_mtime)
+
+    def open_range(self, location, start, end):
+        path, offset, length = self.parse(location)
+        end = min(end, length)
+        with open(path, "rb") as f:
+            f.seek(offset + start)
+            remaining = end - start
+            while remaining > 0:
+                data = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def delete(self, location):
+        return self.stat(location) is not None
+
+
+class Storage:
+    """依設定選擇新上傳使用的後端，並依位置格式找出既有檔案的後端"""
+
+    def __init__(self):
+        self.local = LocalStorageBackend()
+        self.pack = PackStorageBackend()
+        self._backends = [self.local, self.pack]
+        self._default = self.local
+        self.presigned_redirect = False
+        self.presign_expires = 300
+
+    def configure(self, storage_config, app_config, tiering_config=None):
+        self.local.configure(app_config)
+        if tiering_config is not None:
+            self.pack.pack_dir = tiering_config.PACK_DIR
+        self._backends = [self.local, self.pack]
+        self._default = self.local
+        self.presigned_redirect = storage_config.PRESIGNED_REDIRECT
+        self.presign_expires = storage_config.PRESIGN_EXPIRES_SECONDS
+        if storage_config.BACKEND == "s3":
+            s3 = S3StorageBackend(storage_config.S3)
+            self._backends.insert(0, s3)
+            self._default = s3
+        elif storage_config.S3.BUCKET:
+            # 新上傳改用本機時，既有的 s3:// 檔案仍由 S3 後端讀取與刪除
+            try:
+                self._backends.insert(0, S3StorageBackend(storage_config.S3))
+            except RuntimeError as e:
+                print(f"Warning: existing s3:// files cannot be read: {e}")
+
+    @property
+    def default(self) -> StorageBackend:
+        """新上傳使用的後端"""
+        return self._default
+
+    def for_location(self, location: str) -> ReadableStorageBackend:
+        for backend in self._backends:
+            if backend.owns(location):
+                return backend
+        raise ValueError(f"No storage backend configured for {location!r}")
+
+
+storage = Storage()
@@ -0,0 +1,323 @@
+"""
+存在資料庫中的背景任務佇列。
+
+- 加入: enqueue 只新增一筆 Task (不 commit)，與觸發它的資料變更在同一個交易中寫入，
+  不會有檔案紀錄存在但任務遺失的情況；commit 後呼叫 notify 讓本行程立即領取。
+- 領取: 每個行程有一個輪詢執行緒，只領取執行緒池還有空位的數量，
+  以條件式 UPDATE (status = pending) 把任務改為 running，多個行程同時領取時只有一個會成功。
+- 執行: 固定大小的執行緒池 (WORKERS)，完成或失敗時以條件式 UPDATE (仍由本行程持有) 寫入結果；
+  失敗的任務延後重試，超過 MAX_ATTEMPTS 次後標記為 failed。
+- 中斷: 領取時設定 lease_expires_at，執行期間由輪詢執行緒定期延長 (每 LEASE_SECONDS 的 1/3)，
+  行程中斷而超過期限仍是 running 的任務由排程任務重新排入佇列。
+  寫入結果時除了 worker 也比對領取當下的 attempts，同一行程重新領取同一個任務時，
+  舊的執行不會覆寫新的執行。
+"""
+
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+
+from share.define.model_enum import TaskStatus
+from share.model.model import Task
+from util.db import get_db_session
+
+PENDING = TaskStatus.pending.value
+RUNNING = TaskStatus.running.value
+SUCCEEDED = TaskStatus.succeeded.value
+FAILED = TaskStatus.failed.value
+
+
+class TaskQueue:
+    """背景任務的領取與執行"""
+
+    def __init__(self):
+        self.config = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers = {}
+        self._executor = None
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._running = 0
+        self._held = {}
+        self._renewed_at = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"claimed": 0, "succeeded": 0, "retried": 0, "failed": 0, "recovered": 0}
+
+    def configure(self, config):
+        self.config = config
+
+    def handler(self, kind: str):
+        """註冊任務類型的處理函式 handler(session, task) -> dict，回傳值記錄在 Task.result"""
+
+        def decorator(func):
+            self._handlers[kind] = func
+            return func
+
+        return decorator
+
+    def enqueue(
+        self,
+        session,
+        kind: str,
+        payload: dict | None = None,
+        file_id: int | None = None,
+        owner_id: int | None = None,
+    ) -> Task:
+        """新增任務 (不 commit)"""
+        task = Task(
+            kind=kind,
+            status=PENDING,
+            payload=payload,
+            file_id=file_id,
+            owner_id=owner_id,
+            run_after=datetime.now(),
+        )
+        session.add(task)
+        return task
+
+    def notify(self):
+        """通知本行程的輪詢執行緒有新任務"""
+        self._wakeup.set()
+
+    def start(self):
+        if not self.config.ENABLED or self._thread is not None:
+            return
+        # 重新啟動 (例如 fork 後) 時更新行程識別
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.WORKERS, thread_name_prefix="task-worker"
+        )
+        self._thread = threading.Thread(target=self._run, name="task-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止領取新任務並等待執行中的任務完成"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.config.POLL_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            self._renew_leases()
+            with self._lock:
+                free = self.config.WORKERS - self._running
+            if free <= 0 or self._stopping:
+                continue
+            try:
+                with get_db_session() as session:
+                    task_ids = self.claim(session, free)
+            except Exception as e:
+                print(f"An error occurred while claiming tasks: {e}")
+                continue
+            for task_id, attempts in task_ids:
+                with self._lock:
+                    self._running += 1
+                self._executor.submit(self._execute, task_id, attempts)
+
+    def claim(self, session, limit: int) -> list[tuple[int, int]]:
+        """
+        領取最多 limit 個可執行的任務，回傳 (任務 ID, attempts)。
+        attempts 是這次領取的識別，寫入結果與延長 lease 時都會比對。
+        """
+        now = datetime.now()
+        candidates = session.execute(
+            select(Task.id)
+            .where(Task.status == PENDING, Task.run_after <= now)
+            .order_by(Task.run_after, Task.id)
+            .limit(limit * 2)
+        ).scalars().all()
+
+        claimed = []
+        for task_id in candidates:
+            if len(claimed) >= limit:
+                break
+            # 條件式 UPDATE: 其他行程已領走時 rowcount 為 0
+            rowcount = session.execute(
+                update(Task)
+                .where(Task.id == task_id, Task.status == PENDING)
+                .values(
+                    status=RUNNING,
+                    worker=self.worker_id,
+                    attempts=Task.attempts + 1,
+                    started_at=now,
+                    lease_expires_at=now + timedelta(seconds=self.config.LEASE_SECONDS),
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if rowcount == 1:
+                attempts = session.execute(
+                    select(Task.attempts).where(Task.id == task_id)
+                ).scalar_one()
+                claimed.append((task_id, attempts))
+        session.commit()
+        with self._lock:
+            self._stats["claimed"] += len(claimed)
+        return claimed
+
+    def _execute(self, task_id: int, attempts: int):
+        with self._lock:
+            self._held[task_id] = attempts
+        try:
+            with get_db_session() as session:
+                task = session.get(Task, task_id)
+                if task is None or task.attempts != attempts or task.status != RUNNING:
+                    return
+                kind = task.kind
+                try:
+                    handler = self._handlers.get(kind)
+                    if handler is None:
+                        raise LookupError(f"No handler registered for task kind '{kind}'.")
+                    result = handler(session, task)
+                except Exception as e:
+                    session.rollback()
+                    print(f"    - Warning: task {task_id} ({kind}) failed: {e}")
+                    self._fail(session, task_id, attempts, str(e))
+                else:
+                    self._finish(session, task_id, attempts, result)
+        except Exception as e:
+            print(f"An error occurred while running task {task_id}: {e}")
+        finally:
+            with self._lock:
+                self._held.pop(task_id, None)
+                self._running -= 1
+            self._wakeup.set()
+
+    def _renew_leases(self):
+        """延長執行中任務的 lease，避免執行時間超過 LEASE_SECONDS 的任務被重新排入佇列"""
+        if time.monotonic() - self._renewed_at < self.config.LEASE_SECONDS / 3:
+            return
+        with self._lock:
+            held = list(self._held.items())
+        if not held:
+            return
+        expires_at = datetime.now() + timedelta(seconds=self.config.LEASE_SECONDS)
+        try:
+            with get_db_session() as session:
+                for task_id, attempts in held:
+                    rowcount = session.execute(
+                        self._owned(task_id, attempts).values(lease_expires_at=expires_at)
+                    ).rowcount
+                    if rowcount == 0:
+                        print(f"    - Warning: lost the lease of task {task_id}.")
+                session.commit()
+        except Exception as e:
+            print(f"An error occurred while renewing task leases: {e}")
+            return
+        self._renewed_at = time.monotonic()
+
+    def _owned(self, task_id: int, attempts: int):
+        """
+        仍由本行程的這次領取持有的任務
+        (lease 過期後被重新領取時，即使是同一個行程也不覆寫)
+        """
+        return (
+            update(Task)
+            .where(
+                Task.id == task_id,
+                Task.status == RUNNING,
+                Task.worker == self.worker_id,
+                Task.attempts == attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    def _finish(self, session, task_id: int, attempts: int, result: dict | None):
+        session.execute(
+            self._owned(task_id, attempts).values(
+                status=SUCCEEDED,
+                result=result,
+                error=None,
+                lease_expires_at=None,
+                finished_at=datetime.now(),
+            )
+        )
+        session.commit()
+        with self._lock:
+            self._stats["succeeded"] += 1
+
+    def _fail(self, session, task_id: int, attempts: int, error: str):
+        now = datetime.now()
+        if attempts >= self.config.MAX_ATTEMPTS:
+            values = dict(status=FAILED, finished_at=now)
+            stat = "failed"
+        else:
+            values = dict(
+                status=PENDING,
+                worker=None,
+                run_after=now + timedelta(seconds=self.config.RETRY_DELAY_SECONDS * attempts),
+            )
+            stat = "retried"
+        session.execute(
+            self._owned(task_id, attempts).values(
+                error=error[:1000], lease_expires_at=None, **values
+            )
+        )
+        session.commit()
+        with self._lock:
+            self._stats[stat] += 1
+
+    def recover(self, session) -> int:
+        """把 lease 已過期的 running 任務重新排入佇列 (已達重試上限的標記為 failed)"""
+        now = datetime.now()
+        expired = (
+            update(Task)
+            .where(Task.status == RUNNING, Task.lease_expires_at < now)
+            .execution_options(synchronize_session=False)
+        )
+        failed = session.execute(
+            expired.where(Task.attempts >= self.config.MAX_ATTEMPTS).values(
+                status=FAILED,
+                error="Worker lease expired.",
+                lease_expires_at=None,
+                finished_at=now,
+            )
+        ).rowcount
+        requeued = session.execute(
+            expired.where(Task.attempts < self.config.MAX_ATTEMPTS).values(
+                status=PENDING, worker=None, lease_expires_at=None, run_after=now
+            )
+        ).rowcount
+        session.commit()
+        with self._lock:
+            self._stats["recovered"] += requeued
+            self._stats["failed"] += failed
+        if requeued:
+            self._wakeup.set()
+        return requeued + failed
+
+    def purge(self, session) -> int:
+        """刪除超過保留天數的已結束任務"""
+        cutoff = datetime.now() - timedelta(days=self.config.KEEP_FINISHED_DAYS)
+        deleted = session.execute(
+            delete(Task)
+            .where(Task.status.in_([SUCCEEDED, FAILED]), Task.finished_at < cutoff)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": bool(self.config and self.config.ENABLED),
+                "workers": self.config.WORKERS if self.config else 0,
+                "running": self._running,
+            }
+
+
+task_queue = TaskQueue()
@@ -0,0 +1,312 @@
+"""
+冷熱分層。
+
+- 下載紀錄: 每次下載只在記憶體中累計 (access_tracker.touch)，
+  由排程任務每分鐘以一次 executemany 寫入 File.last_accessed_at / access_count。
+- 打包: 超過 COLD_AFTER_DAYS 沒有下載的永久小檔案，依序接在 PACK_DIR 中只追加的 pack 檔之後，
+  fdatasync 後以條件式 UPDATE 將 storage_path 改為 pack://<pack 檔名>/<offset>/<length>，
+  原始檔保留一段時間後刪除。每次任務寫入新的 pack 檔，多個行程不會同時寫入同一個檔案。
+- 讀取: PackStorageBackend 依位置中的 offset 直接串流，不需要解開 pack 檔。
+- 提升: 打包後在 PROMOTE_WINDOW_DAYS 內被下載 PROMOTE_ACCESS_COUNT 次的檔案搬回一般磁碟區。
+  pack 檔中原本的區段成為無效空間。
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, case, or_, select, update
+
+from share.model.model import File, User
+from util import file_ops
+from util.at_rest_compression import ZSTD
+from util.storage_backend import storage
+from util.volumes import invalidate_file_caches, volume_manager
+
+
+class AccessTracker:
+    """在記憶體中累計下載次數，批次寫入資料庫"""
+
+    def __init__(self):
+        self._pending: dict[int, list] = {}  # file_id -> [次數, 最後下載時間]
+        self._lock = threading.Lock()
+        self.window_days = 7
+
+    def touch(self, file_id: int):
+        now = datetime.now()
+        with self._lock:
+            entry = self._pending.get(file_id)
+            if entry is None:
+                self._pending[file_id] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+
+    def flush(self, session) -> int:
+        """寫入累計的下載紀錄，回傳更新的檔案數"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        files = File.__table__
+        cutoff = datetime.now() - timedelta(days=self.window_days)
+        # 上次下載已超出統計期間時重新計數
+        stmt = (
+            update(files)
+            .where(files.c.id == bindparam("b_id"))
+            .values(
+                last_accessed_at=bindparam("b_time"),
+                access_count=case(
+                    (
+                        or_(
+                            files.c.last_accessed_at.is_(None),
+                            files.c.last_accessed_at < cutoff,
+                        ),
+                        bindparam("b_count"),
+                    ),
+                    else_=files.c.access_count + bindparam("b_count"),
+                ),
+                updateTime=files.c.updateTime,
+            )
+        )
+        try:
+            session.connection().execute(
+                stmt,
+                [
+                    {"b_id": file_id, "b_count": count, "b_time": last}
+                    for file_id, (count, last) in pending.items()
+                ],
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            # 寫入失敗時放回，下次再試
+            with self._lock:
+                for file_id, (count, last) in pending.items():
+                    entry = self._pending.setdefault(file_id, [0, last])
+                    entry[0] += count
+            raise
+        return len(pending)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+class _PackWriter:
+    """寫入只追加的 pack 檔，超過大小上限時換新檔"""
+
+    def __init__(self, pack_dir: str, max_bytes: int):
+        self.pack_dir = pack_dir
+        self.max_bytes = max_bytes
+        self._file = None
+        self._name = None
+        self._size = 0
+        self.packs_written = 0
+
+    def _open(self):
+        self.close()
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self._name = f"pack-{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.pack"
+        self._file = open(os.path.join(self.pack_dir, self._name), "xb")
+        self._size = 0
+        self.packs_written += 1
+
+    def append(self, path: str, size: int) -> str:
+        """將檔案接在 pack 檔之後，回傳其位置"""
+        if self._file is None or (self._size and self._size + size > self.max_bytes):
+            self._open()
+        offset = self._size
+        fd = self._file.fileno()
+        try:
+            length = file_ops.append_file(path, fd)
+        except OSError:
+            # 複製到一半失敗: 截掉寫入的部分，下一個檔案仍從正確的 offset 開始
+            os.lseek(fd, offset, os.SEEK_SET)
+            os.ftruncate(fd, offset)
+            raise
+        self._size += length
+        return storage.pack.location(self._name, offset, length)
+
+    def close(self):
+        if self._file is None:
+            return
+        file_ops.datasync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        file_ops.fsync_directory(self.pack_dir)
+
+
+class Tiering:
+    """打包冷資料與提升熱資料"""
+
+    def __init__(self):
+        self.config = None
+        self._failed_ids = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "packed_files": 0,
+            "packed_bytes": 0,
+            "packs_written": 0,
+            "promoted_files": 0,
+            "promoted_bytes": 0,
+        }
+
+    def configure(self, config):
+        self.config = config
+        access_tracker.window_days = config.PROMOTE_WINDOW_DAYS
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config and self.config.ENABLED)
+
+    def run(self, session) -> dict:
+        result = self.promote(session)
+        result.update(self.pack(session))
+        return result
+
+    def pack(self, session) -> dict:
+        config = self.config
+        cutoff = datetime.now() - timedelta(days=config.COLD_AFTER_DAYS)
+        records = session.execute(
+            select(File.id, File.storage_path, File.file_size)
+            .where(
+                File.is_permanent.is_(True),
+                File.deleted_at.is_(None),
+                File.storage_path.notlike("%://%"),
+                or_(File.compression.is_(None), File.compression != ZSTD),
+                File.file_size <= config.MAX_FILE_SIZE,
+                File.id.notin_(self._failed_ids),
+                or_(
+                    File.last_accessed_at < cutoff,
+                    and_(File.last_accessed_at.is_(None), File.createTime < cutoff),
+                ),
+            )
+            .order_by(File.id)
+            .limit(config.BATCH_SIZE)
+        ).all()
+        if not records:
+            return {"packed": 0}
+
+        writer = _PackWriter(config.PACK_DIR, config.PACK_MAX_BYTES)
+        packed = []
+        try:
+            for record in records:
+                path = volume_manager.resolve(record.storage_path)
+                try:
+                    packed.append((record, path, writer.append(path, record.file_size)))
+                except OSError as e:
+                    print(f"    - Warning: failed to pack {path}: {e}")
+                    self._failed_ids.add(record.id)
+        finally:
+            # 資料落盤後才更新資料庫
+            writer.close()
+
+        # 一個交易更新整批；條件式 UPDATE 略過打包期間被刪除、搬移或改為非永久的檔案
+        updated = []
+        for record, path, location in packed:
+            rowcount = session.execute(
+                update(File)
+                .where(
+                    File.id == record.id,
+                    File.storage_path == record.storage_path,
+                    File.is_permanent.is_(True),
+                )
+                .values(storage_path=location, access_count=0)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if rowcount == 1:
+                updated.append((record, path))
+        session.commit()
+
+        for record, path in updated:
+            invalidate_file_caches(session, record.id, record.storage_path)
+            volume_manager.schedule_delete(path, config.DELETE_GRACE_SECONDS)
+        packed_bytes = sum(record.file_size for record, _ in updated)
+        with self._lock:
+            self._stats["packed_files"] += len(updated)
+            self._stats["packed_bytes"] += packed_bytes
+            self._stats["packs_written"] += writer.packs_written
+        return {"packed": len(updated)}
+
+    def promote(self, session) -> dict:
+        config = self.config
+        records = session.execute(
+            select(
+                File.id,
+                File.storage_path,
+                File.file_size,
+                File.filename,
+                File.safe_filename,
+                User.account,
+            )
+            .join(User, File.owner_id == User.id)
+            .where(
+                File.storage_path.like(f"{storage.pack.SCHEME}%"),
+                File.access_count >= config.PROMOTE_ACCESS_COUNT,
+                File.deleted_at.is_(None),
+                File.id.notin_(self._failed_ids),
+            )
+            .limit(config.BATCH_SIZE)
+        ).all()
+
+        promoted = 0
+        for record in records:
+            _, extension = os.path.splitext(record.filename)
+            name = f"{record.safe_filename}{extension}"
+            volume = volume_manager.choose(name, record.file_size)
+            new_path = volume_manager.file_path(volume, record.account, name)
+            directory = os.path.dirname(new_path)
+            partial = file_ops.hidden_temp_path(directory, name)
+            try:
+                with open(partial, "wb") as f:
+                    for data in storage.pack.open_range(record.storage_path, 0, record.file_size):
+                        f.write(data)
+                    f.flush()
+                    file_ops.datasync(f.fileno())
+                os.replace(partial, new_path)
+                file_ops.fsync_directory(directory)
+            except OSError as e:
+                print(f"    - Warning: failed to promote file {record.id}: {e}")
+                self._failed_ids.add(record.id)
+                if os.path.exists(partial):
+                    os.remove(partial)
+                continue
+
+            rowcount = session.execute(
+                update(File)
+                .where(File.id == record.id, File.storage_path == record.storage_path)
+                .values(storage_path=new_path)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            session.commit()
+            if rowcount != 1:
+                os.remove(new_path)
+                continue
+            invalidate_file_caches(session, record.id, record.storage_path)
+            promoted += 1
+            with self._lock:
+                self._stats["promoted_files"] += 1
+                self._stats["promoted_bytes"] += record.file_size
+        return {"promoted": promoted}
+
+    def stats(self) -> dict:
+        pack_bytes = 0
+        pack_dir = self.config.PACK_DIR if self.config else None
+        if pack_dir and os.path.isdir(pack_dir):
+            for entry in os.scandir(pack_dir):
+                if entry.name.endswith(".pack"):
+                    pack_bytes += entry.stat().st_size
+        with self._lock:
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "pack_dir_bytes": pack_bytes,
+                "pending_access_records": access_tracker.pending(),
+            }
+
+
+access_tracker = AccessTracker()
+tiering = Tiering()
@@ -0,0 +1,170 @@
+"""
+檔案的軟刪除與背景回收。
+
+- 刪除: 本機檔案以 rename 移到所在磁碟區的 .trash 目錄 (同一個檔案系統，O(1))，
+  標記 File.deleted_at 並立即歸還配額，請求不需要等待檔案系統釋放空間。
+  S3 / pack 中的檔案不移動，只標記。
+- 復原: UNDO_SECONDS 內可以 rename 回原本的位置 (需重新取得配額)。
+- 回收: 背景任務處理超過復原期限的紀錄，大檔案先分段 truncate 再 unlink，
+  並以 token bucket 限制每秒釋放的位元組數，避免大量 extent 釋放拖慢檔案系統；
+  完成後才刪除資料庫紀錄。回收的期限比復原期限多保留 REAP_MARGIN_SECONDS，
+  兩者不會處理到同一筆紀錄。
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import abort
+from sqlalchemy import delete, select, update
+
+from share.model.model import File
+from util import file_ops, quota
+from util.storage_backend import storage
+from util.volumes import volume_manager
+
+TRASH_DIR = ".trash"
+REAP_MARGIN_SECONDS = 60
+
+
+class Trash:
+    """軟刪除、復原與回收"""
+
+    def __init__(self):
+        self.config = None
+        self._failed_ids = set()
+        self._lock = threading.Lock()
+        self._stats = {"trashed_files": 0, "restored_files": 0, "reaped_files": 0, "reaped_bytes": 0}
+
+    def configure(self, config):
+        self.config = config
+
+    def _trash_path(self, record: File, path: str) -> str:
+        volume = volume_manager.volume_of(path)
+        root = volume.path if volume is not None else os.path.dirname(path)
+        directory = os.path.join(root, TRASH_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{record.id}-{os.path.basename(path)}")
+
+    def soft_delete(
+        self, session, record: File, release_quota: bool = True
+    ) -> tuple[str, str] | None:
+        """
+        標記刪除並歸還配額 (不 commit；批次刪除時由呼叫端一次歸還，release_quota=False)。
+        回傳 (原路徑, 垃圾桶路徑)，呼叫端 commit 失敗時以 revert 移回；沒有移動檔案時回傳 None。
+        """
+        location = record.storage_path
+        moved = None
+        if storage.for_location(location) is storage.local:
+            path = volume_manager.resolve(location)
+            trash_path = self._trash_path(record, path)
+            try:
+                os.replace(path, trash_path)
+            except FileNotFoundError:
+                print(f"Warning: File {path} not found on disk but exists in DB.")
+            else:
+                moved = (path, trash_path)
+                record.storage_path = trash_path
+
+        record.deleted_from = location
+        record.deleted_at = datetime.now()
+        if release_quota:
+            quota.release_file(session, record)
+        with self._lock:
+            self._stats["trashed_files"] += 1
+        return moved
+
+    @staticmethod
+    def revert(moved: tuple[str, str] | None):
+        """soft_delete 之後 commit 失敗時，把檔案移回原位置"""
+        if moved is not None:
+            os.replace(moved[1], moved[0])
+
+    def can_restore(self, record: File) -> bool:
+        return record.deleted_at is not None and record.deleted_at >= datetime.now() - timedelta(
+            seconds=self.config.UNDO_SECONDS
+        )
+
+    def restore(self, session, record: File) -> tuple[str, str] | None:
+        """
+        復原 (不 commit)，配額不足時回傳 403。
+        回傳 (垃圾桶路徑, 原路徑)，呼叫端 commit 失敗時以 revert 移回垃圾桶。
+        """
+        # 條件式 UPDATE: 同時送出的復原請求只有一個會成功
+        claimed = session.execute(
+            update(File)
+            .where(File.id == record.id, File.deleted_at.is_not(None))
+            .values(deleted_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if claimed != 1:
+            abort(409, "File is not in the trash.")
+        quota.restore_file(session, record)
+        moved = None
+        original = record.deleted_from
+        if record.storage_path != original:
+            os.makedirs(os.path.dirname(original), exist_ok=True)
+            os.replace(record.storage_path, original)
+            moved = (record.storage_path, original)
+        record.storage_path = original
+        record.deleted_from = None
+        record.deleted_at = None
+        with self._lock:
+            self._stats["restored_files"] += 1
+        return moved
+
+    def reap(self, session) -> dict:
+        """回收一批超過復原期限的檔案，回傳本批的統計"""
+        config = self.config
+        cutoff = datetime.now() - timedelta(
+            seconds=config.UNDO_SECONDS + REAP_MARGIN_SECONDS
+        )
+        records = session.execute(
+            select(File.id, File.storage_path, File.file_size)
+            .where(File.deleted_at < cutoff, File.id.notin_(self._failed_ids))
+            .order_by(File.deleted_at)
+            .limit(config.REAP_BATCH_SIZE)
+        ).all()
+        if not records:
+            return {"reaped": 0}
+
+        bucket = None
+        if config.UNLINK_BYTES_PER_SECOND > 0:
+            from util.rate_limit import TokenBucket
+
+            bucket = TokenBucket(config.UNLINK_BYTES_PER_SECOND)
+
+        reaped_ids, reaped_bytes = [], 0
+        for record in records:
+            location = record.storage_path
+            try:
+                backend = storage.for_location(location)
+                if backend is storage.local:
+                    file_ops.throttled_unlink(location, bucket, config.TRUNCATE_STEP_BYTES)
+                else:
+                    backend.delete(location)
+            except Exception as e:
+                print(f"    - Warning: failed to reclaim {location}: {e}")
+                self._failed_ids.add(record.id)
+                continue
+            reaped_ids.append(record.id)
+            reaped_bytes += record.file_size
+
+        if reaped_ids:
+            session.execute(
+                delete(File)
+                .where(File.id.in_(reaped_ids), File.deleted_at.is_not(None))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+        with self._lock:
+            self._stats["reaped_files"] += len(reaped_ids)
+            self._stats["reaped_bytes"] += reaped_bytes
+        return {"reaped": len(reaped_ids)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+trash = Trash()
@@ -0,0 +1,201 @@
+"""
+清除放棄的分塊上傳。
+
+- 過期會話: status 為 active 且 expires_at 已過的上傳會話，
+  分批以條件式 UPDATE 標記為 expired (與同時進行的 complete 互斥)，
+  同一批的預留配額依使用者彙總後一次歸還，交易提交後再刪除暫存檔。
+  暫存資料透過儲存後端清除 (本機刪除暫存檔，S3 則 abort multipart upload)。
+- 孤兒暫存檔: 本機暫存目錄中沒有對應 active 會話、且超過 TTL 未修改的 .tmp 檔
+  (例如舊版本留下的，或 init 後資料庫寫入失敗的)。
+"""
+
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from share.define.model_enum import UploadStatus
+from share.model.model import UploadSession
+from util import quota
+from util.global_variable import global_variable
+from util.storage_backend import UploadTarget, storage
+
+TEMP_SUFFIX = ".tmp"
+
+
+class UploadSweeper:
+    """過期上傳會話與暫存檔的清除邏輯，並累計回收的位元組數"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "expired_sessions": 0,
+            "orphan_files": 0,
+            "reclaimed_files": 0,
+            "reclaimed_bytes": 0,
+            "released_reserved_bytes": 0,
+            "last_run": None,
+            "last_run_seconds": 0.0,
+            "last_reclaimed_bytes": 0,
+        }
+
+    def sweep(self, session) -> dict:
+        """執行一次完整清除，回傳本次的統計"""
+        app_config = global_variable.config.APP
+        started = time.monotonic()
+        result = {
+            "expired_sessions": 0,
+            "orphan_files": 0,
+            "reclaimed_files": 0,
+            "reclaimed_bytes": 0,
+            "released_reserved_bytes": 0,
+        }
+
+        batch_size = app_config.UPLOAD_SWEEP_BATCH_SIZE
+        while self._sweep_batch(session, batch_size, result) >= batch_size:
+            pass
+
+        self._sweep_orphans(
+            session,
+            app_config.UPLOAD_TEMP_DIR,
+            timedelta(minutes=app_config.UPLOAD_SESSION_TTL_MINUTES),
+            batch_size,
+            result,
+        )
+
+        with self._lock:
+            for key, value in result.items():
+                self._stats[key] += value
+            self._stats["runs"] += 1
+            self._stats["last_run"] = datetime.now().isoformat(timespec="seconds")
+            self._stats["last_run_seconds"] = round(time.monotonic() - started, 3)
+            self._stats["last_reclaimed_bytes"] = result["reclaimed_bytes"]
+        return result
+
+    def _sweep_batch(self, session, batch_size: int, result: dict) -> int:
+        """處理一批過期會話 (一個交易)，回傳這批查到的會話數量"""
+        stale = session.execute(
+            select(
+                UploadSession.id,
+                UploadSession.owner_id,
+                UploadSession.file_size,
+                UploadSession.temp_path,
+                UploadSession.backend_upload_id,
+            )
+            .where(
+                UploadSession.status == UploadStatus.active.value,
+                UploadSession.expires_at < datetime.now(),
+            )
+            .order_by(UploadSession.expires_at)
+            .limit(batch_size)
+        ).all()
+        if not stale:
+            return 0
+
+        released = defaultdict(lambda: [0, 0])  # owner_id -> [檔案數, 位元組數]
+        targets = []
+        for row in stale:
+            # 條件式 UPDATE: 只有仍為 active 的會話會被轉為 expired，預留只會歸還一次
+            expired = session.execute(
+                update(UploadSession)
+                .where(
+                    UploadSession.id == row.id,
+                    UploadSession.status == UploadStatus.active.value,
+                )
+                .values(status=UploadStatus.expired.value)
+                .execution_options(synchronize_session=False)
+            )
+            if expired.rowcount != 1:
+                continue
+            released[row.owner_id][0] += 1
+            released[row.owner_id][1] += row.file_size
+            targets.append(UploadTarget(row.temp_path, row.backend_upload_id))
+
+        for owner_id, (count, size) in released.items():
+            quota.release_reservation(session, owner_id, size, count=count)
+        session.commit()
+
+        result["expired_sessions"] += len(targets)
+        result["released_reserved_bytes"] += sum(size for _, size in released.values())
+        for target in targets:
+            self._abort(target, result)
+        return len(stale)
+
+    def _sweep_orphans(
+        self, session, temp_root: str, ttl: timedelta, batch_size: int, result: dict
+    ):
+        """清除沒有對應 active 會話且超過 TTL 未修改的暫存檔"""
+        if not os.path.isdir(temp_root):
+            return
+        threshold = time.time() - ttl.total_seconds()
+
+        candidates = {}  # upload_id -> path
+        for user_dir in os.scandir(temp_root):
+            if not user_dir.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(user_dir.path):
+                if not entry.name.endswith(TEMP_SUFFIX) or not entry.is_file(
+                    follow_symlinks=False
+                ):
+                    continue
+                try:
+                    if entry.stat().st_mtime >= threshold:
+                        continue
+                except OSError:
+                    continue
+                candidates[entry.name[: -len(TEMP_SUFFIX)]] = entry.path
+                if len(candidates) >= batch_size:
+                    self._remove_orphans(session, candidates, result)
+                    candidates = {}
+        if candidates:
+            self._remove_orphans(session, candidates, result)
+
+    def _remove_orphans(self, session, candidates: dict, result: dict):
+        active = set(
+            session.execute(
+                select(UploadSession.upload_id).where(
+                    UploadSession.upload_id.in_(list(candidates)),
+                    UploadSession.status == UploadStatus.active.value,
+                )
+            ).scalars()
+        )
+        for upload_id, path in candidates.items():
+            if upload_id not in active and self._remove(path, result):
+                result["orphan_files"] += 1
+
+    @staticmethod
+    def _abort(target: UploadTarget, result: dict):
+        """放棄後端的上傳 (本機: 刪除暫存檔；S3: abort multipart upload)"""
+        try:
+            size = storage.for_location(target.temp_location).abort_upload(target)
+        except Exception as e:
+            print(f"    - Warning: failed to abort upload {target.temp_location}: {e}")
+            return
+        if size is not None:
+            result["reclaimed_files"] += 1
+            result["reclaimed_bytes"] += size
+
+    @staticmethod
+    def _remove(path: str, result: dict) -> bool:
+        try:
+            size = os.stat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            print(f"    - Warning: failed to remove upload temp file {path}: {e}")
+            return False
+        result["reclaimed_files"] += 1
+        result["reclaimed_bytes"] += size
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+
+upload_sweeper = UploadSweeper()
@@ -0,0 +1,524 @@
+"""
+本機儲存的多磁碟區管理。
+
+- 放置: 新檔案依 FILE.placement 選擇磁碟區
+  - headroom: 剩餘空間 × 權重最大的磁碟區
+  - hash: 以檔案 ID 做加權 rendezvous hashing (一致性雜湊，增減磁碟區只影響少數檔案)
+  兩者都會跳過 draining 或剩餘空間不足 (min_free_bytes) 的磁碟區。
+- 空間資訊以 shutil.disk_usage (POSIX 上即 statvfs) 取得並快取，
+  放置檔案後會先扣除快取中的剩餘空間，避免快取期間全部擠到同一個磁碟區。
+- 目錄結構 (FILE.layout): sharded 時檔案放在 <使用者>/ab/cd/<檔名>
+  (ab、cd 為檔名的前四個字元)，避免單一目錄有數十萬個項目。
+  既有的 flat 檔案以 migrate_layout 分批搬移 (見 app.py migratelayout)。
+- 重新平衡: 將檔案由使用率高的磁碟區搬到使用率低的磁碟區。
+  先以條件式 UPDATE 取得該檔案的搬移租約 (moving_until)，每個行程都執行排程時只有一個會搬移；
+  限速複製到目標的隱藏暫存檔、換名為本次搬移專用的檔名，再以條件式 UPDATE 更新 storage_path，
+  舊檔保留一段時間後才刪除，讓搬移期間的讀取不受影響。
+- 延後刪除: 待刪除的舊檔記錄在所屬磁碟區的 .pending_deletes 目錄 (每個檔案一個標記檔)，
+  行程重新啟動後仍會刪除，不會留下沒有資料庫紀錄的孤兒檔案。
+"""
+
+import hashlib
+import json
+import math
+import os
+import secrets
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from share.model.model import File
+from util import file_ops
+
+SHARDED = "sharded"
+PENDING_DELETES_DIR = ".pending_deletes"
+
+
+def shard_dir(directory: str, name: str) -> str:
+    """sharded 結構下檔案所在的目錄: <directory>/ab/cd"""
+    return os.path.join(directory, name[:2].lower(), name[2:4].lower())
+
+
+def invalidate_file_caches(session, file_id: int, old_location: str):
+    """檔案的位置改變後，清除本行程中以舊位置快取的資料"""
+    from util.file_cache import hot_file_cache
+    from util.share_cache import share_cache
+    from util.signed_url import file_meta_cache
+
+    file_meta_cache.pop(file_id)
+    hot_file_cache.invalidate(old_location)
+    share_token = session.execute(
+        select(File.share_token).where(File.id == file_id)
+    ).scalar()
+    share_cache.invalidate(share_token)
+
+
+@dataclass
+class VolumeUsage:
+    path: str
+    weight: float
+    draining: bool
+    total: int
+    free: int
+    checked_at: float
+
+    @property
+    def used_ratio(self) -> float:
+        return 1 - self.free / self.total if self.total else 1.0
+
+    def contains(self, location: str) -> bool:
+        return os.path.abspath(location).startswith(self.path + os.sep)
+
+
+class VolumeManager:
+    """磁碟區設定、空間快取、放置策略與重新平衡"""
+
+    def __init__(self):
+        self._volumes: list[VolumeUsage] = []
+        self._lock = threading.Lock()
+        self.placement = "headroom"
+        self.layout = SHARDED
+        self.min_free_bytes = 0
+        self.cache_seconds = 10.0
+        self._stats = {"moved_files": 0, "moved_bytes": 0, "skipped": 0, "runs": 0}
+
+    def configure(self, file_config):
+        volumes = file_config.volumes or [{"path": file_config.path}]
+        with self._lock:
+            self._volumes = []
+            for volume in volumes:
+                volume = volume if isinstance(volume, dict) else volume.model_dump()
+                self._volumes.append(
+                    VolumeUsage(
+                        path=os.path.abspath(volume["path"]),
+                        weight=volume.get("weight", 1.0),
+                        draining=volume.get("draining", False),
+                        total=0,
+                        free=0,
+                        checked_at=0.0,
+                    )
+                )
+        self.placement = file_config.placement
+        self.layout = file_config.layout
+        self.min_free_bytes = file_config.min_free_bytes
+        self.cache_seconds = file_config.statvfs_cache_seconds
+
+    # --- 空間資訊 ---
+    def _refresh(self, volume: VolumeUsage, force: bool = False):
+        now = time.monotonic()
+        if not force and now - volume.checked_at < self.cache_seconds:
+            return
+        try:
+            os.makedirs(volume.path, exist_ok=True)
+            usage = shutil.disk_usage(volume.path)
+        except OSError:
+            volume.total, volume.free = 0, 0
+        else:
+            volume.total, volume.free = usage.total, usage.free
+        volume.checked_at = now
+
+    def usage(self, force: bool = False) -> list[VolumeUsage]:
+        with self._lock:
+            for volume in self._volumes:
+                self._refresh(volume, force)
+            return list(self._volumes)
+
+    def volume_of(self, location: str) -> VolumeUsage | None:
+        for volume in self._volumes:
+            if volume.contains(location):
+                return volume
+        return None
+
+    # --- 放置 ---
+    def choose(self, blob_id: str, size: int) -> VolumeUsage:
+        """選擇新檔案的磁碟區"""
+        with self._lock:
+            for volume in self._volumes:
+                self._refresh(volume)
+            candidates = [
+                v
+                for v in self._volumes
+                if not v.draining and v.free - size >= self.min_free_bytes
+            ]
+            if not candidates:
+                # 全部空間不足時仍需放置 (由寫入時的 OSError 反映真正的錯誤)
+                candidates = [v for v in self._volumes if not v.draining] or self._volumes
+
+            if self.placement == "hash":
+                volume = max(candidates, key=lambda v: self._rendezvous_score(blob_id, v))
+            else:
+                volume = max(candidates, key=lambda v: v.free * v.weight)
+            volume.free -= size
+            return volume
+
+    @staticmethod
+    def _rendezvous_score(blob_id: str, volume: VolumeUsage) -> float:
+        digest = hashlib.blake2b(
+            f"{volume.path}\0{blob_id}".encode(), digest_size=8
+        ).digest()
+        # 轉為 (0, 1) 的均勻分布後做加權 (weighted rendezvous hashing)
+        unit = (int.from_bytes(digest, "big") + 1) / (2**64 + 2)
+        return -volume.weight / math.log(unit)
+
+    def user_dir(self, volume: VolumeUsage, account: str) -> str:
+        directory = os.path.join(volume.path, account)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def file_path(self, volume: VolumeUsage, account: str, name: str) -> str:
+        """新檔案在磁碟區上的路徑 (依 FILE.layout)"""
+        directory = os.path.join(volume.path, account)
+        if self.layout == SHARDED:
+            directory = shard_dir(directory, name)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    # --- 目錄結構遷移 ---
+    def flat_to_sharded(self, location: str) -> str | None:
+        """位於某個磁碟區 <使用者>/<檔名> 的檔案回傳其 sharded 路徑，否則回傳 None"""
+        volume = self.volume_of(location)
+        if volume is None:
+            return None
+        location = os.path.abspath(location)
+        parts = os.path.relpath(location, volume.path).split(os.sep)
+        if len(parts) != 2:
+            return None
+        directory, name = os.path.split(location)
+        return os.path.join(shard_dir(directory, name), name)
+
+    def resolve(self, location: str) -> str:
+        """
+        本機位置的實際路徑。
+        flat 路徑已被遷移 (檔案不存在) 時改用 sharded 路徑，
+        讓遷移前取得的位置 (例如其他行程的快取) 仍可讀取。
+        """
+        if os.path.exists(location):
+            return location
+        sharded = self.flat_to_sharded(location)
+        if sharded is not None and os.path.exists(sharded):
+            return sharded
+        return location
+
+    def migrate_layout(self, session, batch_size: int = 500, limit: int = 0) -> dict:
+        """
+        將 flat 結構的檔案分批遷移到 sharded 結構，回傳統計。
+        每個檔案先以 hard link 建立新路徑 (同一檔案系統，不複製資料)，
+        每批一個交易以條件式 UPDATE 改寫 storage_path，提交後才刪除舊路徑；
+        中途中斷後重新執行即可繼續 (已存在的 link 會沿用)。
+        limit 為 0 時處理全部檔案。
+        """
+        result = {"migrated": 0, "skipped": 0, "scanned": 0}
+        last_id = 0
+        while not limit or result["migrated"] < limit:
+            records = session.execute(
+                select(File.id, File.storage_path)
+                .where(File.id > last_id, File.deleted_at.is_(None))
+                .order_by(File.id)
+                .limit(batch_size)
+            ).all()
+            if not records:
+                break
+            last_id = records[-1].id
+            result["scanned"] += len(records)
+
+            linked = []
+            for record in records:
+                if limit and result["migrated"] + len(linked) >= limit:
+                    break
+                new_path = self.flat_to_sharded(record.storage_path)
+                if new_path is None:
+                    continue
+                if self._link(record.storage_path, new_path):
+                    linked.append((record, new_path))
+                else:
+                    result["skipped"] += 1
+            if not linked:
+                continue
+
+            updated = []
+            for record, new_path in linked:
+                rowcount = session.execute(
+                    update(File)
+                    .where(File.id == record.id, File.storage_path == record.storage_path)
+                    .values(storage_path=new_path)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                updated.append(rowcount == 1)
+            session.commit()
+
+            for (record, new_path), ok in zip(linked, updated):
+                # 提交後才刪除舊路徑；未更新 (檔案已被刪除或搬走) 時改為刪除新路徑
+                stale = record.storage_path if ok else new_path
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+                result["migrated" if ok else "skipped"] += 1
+        return result
+
+    @staticmethod
+    def _link(old_path: str, new_path: str) -> bool:
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        try:
+            os.link(old_path, new_path)
+        except FileExistsError:
+            # 上次執行在提交前中斷: 同一個 inode 時沿用
+            return os.path.samefile(old_path, new_path)
+        except FileNotFoundError:
+            # 上次執行以換名搬移後在提交前中斷
+            return os.path.exists(new_path)
+        except OSError as e:
+            # 不支援 hard link 的檔案系統: 直接換名 (期間的讀取由 resolve 處理)
+            print(f"    - Warning: hard link failed for {old_path} ({e}), renaming instead.")
+            os.replace(old_path, new_path)
+        return True
+
+    # --- 重新平衡 ---
+    def _weighted_ratio(self, volume: VolumeUsage) -> float:
+        # draining 的磁碟區視為已滿，會被優先搬空
+        if volume.draining:
+            return math.inf
+        return volume.used_ratio / volume.weight
+
+    def rebalance(self, session, config) -> dict:
+        """
+        執行一次重新平衡，回傳本次搬移的統計。
+        config 為 FILE.rebalance 設定。
+        """
+        self.delete_due()
+        volumes = [v for v in self.usage(force=True) if v.total]
+        result = {"moved_files": 0, "moved_bytes": 0, "skipped": 0}
+        if len(volumes) < 2:
+            return result
+
+        bucket = None
+        if config.MAX_BYTES_PER_SECOND > 0:
+            from util.rate_limit import TokenBucket
+
+            bucket = TokenBucket(config.MAX_BYTES_PER_SECOND)
+
+        budget = config.MAX_BYTES_PER_RUN
+        failed_ids = set()
+        while budget > 0:
+            source = max(volumes, key=self._weighted_ratio)
+            targets = [v for v in volumes if v is not source and not v.draining]
+            if not targets:
+                break
+            target = min(targets, key=self._weighted_ratio)
+            if (
+                not source.draining
+                and self._weighted_ratio(source) - self._weighted_ratio(target)
+                <= config.THRESHOLD
+            ):
+                break
+
+            # 壓縮過的檔案以實際佔用的大小計算
+            disk_size = func.coalesce(File.stored_size, File.file_size)
+            record = session.execute(
+                select(File.id, File.storage_path, disk_size.label("file_size"))
+                .where(
+                    File.storage_path.startswith(source.path + os.sep, autoescape=True),
+                    File.deleted_at.is_(None),
+                    # 略過其他行程正在搬移的檔案
+                    or_(File.moving_until.is_(None), File.moving_until < datetime.now()),
+                    disk_size <= min(budget, target.free - self.min_free_bytes),
+                    File.id.notin_(failed_ids),
+                )
+                .order_by(disk_size.desc())
+                .limit(1)
+            ).first()
+            if record is None:
+                break
+
+            new_path = os.path.join(
+                target.path, os.path.relpath(record.storage_path, source.path)
+            )
+            budget -= record.file_size
+            if self._move(session, record, new_path, bucket, config):
+                source.free += record.file_size
+                target.free -= record.file_size
+                result["moved_files"] += 1
+                result["moved_bytes"] += record.file_size
+            else:
+                result["skipped"] += 1
+                failed_ids.add(record.id)
+
+        with self._lock:
+            self._stats["runs"] += 1
+            for key, value in result.items():
+                self._stats[key] += value
+        return result
+
+    @staticmethod
+    def _moved_name(name: str, tag: str) -> str:
+        """
+        搬移後的檔名: 在第一個 . 之前加上 ~<tag> (取代上次搬移加上的 tag)，
+        保留副檔名 (例如 .seekable.zst) 與 sharded 目錄使用的前四個字元。
+        """
+        stem, dot, rest = name.partition(".")
+        return f"{stem.split('~')[0]}~{tag}{dot}{rest}"
+
+    def _move(self, session, record, new_path: str, bucket, config) -> bool:
+        old_path = record.storage_path
+        # 取得搬移租約: 其他行程已在搬移 (租約未過期) 或檔案已被搬走時 rowcount 為 0
+        lease = datetime.now() + timedelta(seconds=config.LEASE_SECONDS)
+        claimed = session.execute(
+            update(File)
+            .where(
+                File.id == record.id,
+                File.storage_path == old_path,
+                or_(File.moving_until.is_(None), File.moving_until < datetime.now()),
+            )
+            .values(moving_until=lease)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+        if claimed != 1:
+            return False
+
+        # 每次搬移使用自己的檔名，租約過期後仍在複製的行程不會覆寫或刪除其他行程的檔案
+        directory, name = os.path.split(new_path)
+        new_path = os.path.join(directory, self._moved_name(name, secrets.token_hex(4)))
+        os.makedirs(directory, exist_ok=True)
+        partial = file_ops.hidden_temp_path(directory, os.path.basename(new_path))
+        try:
+            file_ops.throttled_copy(old_path, partial, bucket)
+            os.replace(partial, new_path)
+            file_ops.fsync_directory(directory)
+        except OSError as e:
+            print(f"    - Warning: failed to move {old_path} to {new_path}: {e}")
+            if os.path.exists(partial):
+                os.remove(partial)
+            self._release_move(session, record.id, lease)
+            return False
+
+        # 條件式 UPDATE: 搬移期間檔案被刪除、已被搬走或租約已被其他行程取得時不覆寫
+        result = session.execute(
+            update(File)
+            .where(
+                File.id == record.id,
+                File.storage_path == old_path,
+                File.moving_until == lease,
+            )
+            .values(storage_path=new_path, moving_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        if result.rowcount != 1:
+            current = session.execute(
+                select(File.storage_path).where(File.id == record.id)
+            ).scalar()
+            if current != new_path:
+                try:
+                    os.remove(new_path)
+                except FileNotFoundError:
+                    pass
+            self._release_move(session, record.id, lease)
+            return False
+
+        invalidate_file_caches(session, record.id, old_path)
+        # 舊檔保留一段時間，讓已取得舊路徑的讀取與其他行程的快取自然結束
+        self.schedule_delete(old_path, config.DELETE_GRACE_SECONDS)
+        return True
+
+    @staticmethod
+    def _release_move(session, file_id: int, lease: datetime):
+        """放棄搬移時釋放仍由本次搬移持有的租約"""
+        session.execute(
+            update(File)
+            .where(File.id == file_id, File.moving_until == lease)
+            .values(moving_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+    def _pending_marker(self, path: str) -> str:
+        """path 的延後刪除標記檔 (不在任何磁碟區時記錄在第一個磁碟區)"""
+        volume = self.volume_of(path) or self._volumes[0]
+        name = hashlib.blake2b(os.path.abspath(path).encode(), digest_size=16).hexdigest()
+        return os.path.join(volume.path, PENDING_DELETES_DIR, name)
+
+    def schedule_delete(self, path: str, grace_seconds: float):
+        """
+        grace_seconds 秒後 (由 delete_due 執行) 刪除不再使用的舊檔。
+        呼叫端在資料庫提交後才呼叫；標記檔落盤後才回傳，行程中斷後仍會刪除。
+        """
+        marker = self._pending_marker(path)
+        directory, name = os.path.split(marker)
+        partial = file_ops.hidden_temp_path(directory, name)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump({"path": path, "delete_at": time.time() + grace_seconds}, f)
+                f.flush()
+                file_ops.datasync(f.fileno())
+            os.replace(partial, marker)
+            file_ops.fsync_directory(directory)
+        except OSError as e:
+            print(f"    - Warning: failed to schedule deletion of {path}: {e}")
+
+    def _pending_markers(self):
+        """所有磁碟區上的延後刪除標記檔 (略過寫入中的暫存檔)"""
+        with self._lock:
+            volumes = list(self._volumes)
+        for volume in volumes:
+            try:
+                entries = list(os.scandir(os.path.join(volume.path, PENDING_DELETES_DIR)))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.name.startswith("."):
+                    yield entry.path
+
+    def delete_due(self, force: bool = False):
+        """刪除保留期已過的舊檔 (可由多個行程同時執行)"""
+        now = time.time()
+        for marker in self._pending_markers():
+            try:
+                with open(marker, encoding="utf-8") as f:
+                    pending = json.load(f)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                print(f"    - Warning: failed to read pending delete {marker}: {e}")
+                continue
+            if not force and pending["delete_at"] > now:
+                continue
+            try:
+                os.remove(pending["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"    - Warning: failed to remove moved file {pending['path']}: {e}")
+                continue
+            try:
+                os.remove(marker)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        volumes = self.usage()
+        pending_deletes = sum(1 for _ in self._pending_markers())
+        with self._lock:
+            return {
+                **self._stats,
+                "pending_deletes": pending_deletes,
+                "volumes": [
+                    {
+                        "path": v.path,
+                        "weight": v.weight,
+                        "draining": v.draining,
+                        "total": v.total,
+                        "free": v.free,
+                        "used_ratio": round(v.used_ratio, 4),
+                    }
+                    for v in volumes
+                ],
+            }
+
+
+volume_manager = VolumeManager()
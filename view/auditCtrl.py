@@ -0,0 +1,29 @@
+from flask_openapi3 import APIBlueprint, Tag
+
+from util.db import get_db_session
+from util.auth import permission_required
+from util.audit import audit_writer
+from schema.request_auditCtrl import AuditLogQuery, AuditLogListResponse
+from controller.Cont_auditCtrl import ListAuditLogs
+
+tag = Tag(name="Audit", description="操作日誌")
+auditctrl = APIBlueprint("auditctrl", __name__, url_prefix="/audit", abp_tags=[tag])
+
+
+@auditctrl.get(
+    "/logs",
+    summary="查詢操作日誌",
+    responses={200: AuditLogListResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("audit:read")
+def list_audit_logs(query: AuditLogQuery):
+    """
+    分頁查詢操作日誌，可依帳號、操作類型與時間區間篩選。
+    - 需要 `audit:read` 權限。
+    """
+    # 先把緩衝中的紀錄寫入，讓查詢結果包含最新的操作
+    audit_writer.flush()
+    with get_db_session(audit_writer.db_name) as db:
+        logic = ListAuditLogs(session=db, query=query)
+        return AuditLogListResponse(**logic.run()).model_dump()
@@ -1,8 +1,8 @@
 from flask_openapi3 import APIBlueprint, Tag
-from flask import send_file, abort, request
+from flask import Response, send_file, abort, request
 from flask_openapi3.models.file import FileStorage
-from pydantic import BaseModel, Field
-from flask_jwt_extended import get_jwt_identity, create_access_token, decode_token
+from pydantic import BaseModel, Field, ValidationError
+from flask_jwt_extended import get_jwt_identity, decode_token
 from jwt.exceptions import PyJWTError
 from datetime import datetime, timedelta
 
@@ -15,13 +15,37 @@ from schema.request_userCtrl import (
 )
 
 from util.db import get_db_session
-from util.auth import permission_required
+from util.download_token import is_download_token, issue_download_token
+from util.auth import permission_required, get_user_level
 from util.global_variable import global_variable  # 新增匯入
+from util.audit import audit
+from util.fast_json import json_response
+from util.file_response import send_stored_file
+from util import delta_sync, signed_url
+from util.previews import previews
+from util.share_cache import share_cache
+from util.rate_limit import (
+    bandwidth_limiter,
+    read_throttled,
+    ThrottledReader,
+    UPLOAD,
+    DOWNLOAD,
+)
+from util import admission
+from util.admission import admission_control
+from share.define.model_enum import AuditAction
 from controller.Cont_fileCtrl import (
+    BulkCreateShareLinks,
+    BulkDeleteFiles,
+    BulkUpdateFileStatus,
     ChunkedUploadController,
     DownloadFile,
     DeleteFile,
+    DeltaUploadFile,
+    GetFileSignature,
+    GetTaskStatus,
     ListFiles,
+    RestoreFile,
     UpdateFileStatus,
     CreateShareLink,
     RemoveShareLink,
@@ -48,6 +72,9 @@ class FileListLimits(BaseModel):
 class FileListResponse(BaseModel):
     """檔案列表的回應模型"""
 
+    download_url_prefix: str | None = Field(
+        None, description="下載網址前綴，接上檔案的 safe_filename 即為下載網址"
+    )
     files: list[FileInfo]
     stats: FileListStats
     limits: FileListLimits
@@ -59,12 +86,71 @@ class UpdateFileStatusForm(BaseModel):
     is_permanent: bool = Field(..., description="是否設定為永久檔案")
 
 
+class BulkFilesForm(BaseModel):
+    """批次操作的請求模型"""
+
+    safe_filenames: list[str] = Field(
+        ..., min_length=1, max_length=500, description="檔案安全名稱列表"
+    )
+
+
+class BulkFileStatusForm(BulkFilesForm):
+    """批次更新檔案狀態的請求模型"""
+
+    is_permanent: bool = Field(..., description="是否設定為永久檔案")
+
+
+class BulkResult(BaseModel):
+    safe_filename: str
+    status: str = Field(
+        ..., description="ok / unchanged / not_found / forbidden / quota_exceeded"
+    )
+    is_permanent: bool | None = None
+    share_token: str | None = None
+
+
+class BulkResponse(BaseModel):
+    """批次操作的回應模型，每個檔案各自回報結果"""
+
+    succeeded: int
+    failed: int
+    results: list[BulkResult]
+    undo_seconds: int | None = None
+
+
+class TaskIdPath(BaseModel):
+    """背景任務 ID 的路徑參數模型"""
+
+    task_id: int = Field(..., description="背景任務 ID")
+
+
+class TaskStatusResponse(BaseModel):
+    """背景任務狀態的回應模型"""
+
+    id: int
+    kind: str
+    status: str = Field(..., description="pending / running / succeeded / failed")
+    attempts: int
+    file_id: int | None = None
+    result: dict | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
 class FileIdPath(BaseModel):
     """檔案路徑參數模型"""
 
     safe_filename: str = Field(..., description="檔案安全名稱")
 
 
+class UploadIdPath(BaseModel):
+    """上傳會話 ID 的路徑參數模型"""
+
+    upload_id: str = Field(..., description="唯一上傳會話 ID")
+
+
 class ShareTokenPath(BaseModel):
     """分享 Token 的路徑參數模型"""
 
@@ -77,6 +163,90 @@ class ShareLinkResponse(BaseModel):
     share_token: str
 
 
+class SignedUrlForm(BaseModel):
+    """建立簽章下載網址的請求模型"""
+
+    expires_in: int | None = Field(None, gt=0, description="有效時間 (秒)，未提供時使用預設值")
+    range_start: int = Field(0, ge=0, description="允許下載的起始位元組 (含)")
+    range_end: int = Field(0, ge=0, description="允許下載的結束位元組 (不含)，0 表示到檔案結尾")
+
+
+class SignedUrlResponse(BaseModel):
+    """簽章下載網址的回應模型"""
+
+    url: str
+    expires_in: int
+
+
+class SignedTokenPath(BaseModel):
+    """簽章 token 的路徑參數模型"""
+
+    token: str = Field(..., description="簽章 token")
+
+
+class SignatureQuery(BaseModel):
+    """取得區塊簽章的查詢參數模型"""
+
+    block_size: int | None = Field(None, gt=0, description="區塊大小，未提供時依檔案大小決定")
+
+
+class SignatureResponse(BaseModel):
+    """區塊簽章的回應模型"""
+
+    safe_filename: str
+    file_size: int
+    block_size: int
+    blocks: list[tuple[int, str]] = Field(
+        ..., description="每個區塊的 [Adler-32, BLAKE2b-128 (hex)]"
+    )
+
+
+class SignaturePendingResponse(BaseModel):
+    """簽章尚在背景計算中的回應模型"""
+
+    safe_filename: str
+    file_size: int
+    block_size: int
+    task_id: int = Field(..., description="計算簽章的背景任務 ID")
+
+
+class DeltaUploadQuery(BaseModel):
+    """差異上傳的查詢參數模型"""
+
+    file_size: int = Field(..., ge=0, description="新檔案的大小 (bytes)")
+    block_size: int = Field(..., gt=0, description="計算差異時使用的區塊大小 (與取得簽章時相同)")
+    filename: str | None = Field(None, description="新檔案的檔名，未提供時沿用基礎檔案的檔名")
+    replace: bool = Field(
+        False, description="是否取代基礎檔案 (基礎檔案移到垃圾桶，可在復原期限內復原)"
+    )
+
+
+class DeltaUploadResponse(BaseModel):
+    """差異上傳的回應模型"""
+
+    id: int
+    filename: str
+    safe_filename: str
+    size_bytes: int
+    task_id: int
+    replaced: str | None = None
+    copied_bytes: int = Field(..., description="由基礎檔案複製的位元組數")
+    literal_bytes: int = Field(..., description="實際上傳的新資料位元組數")
+
+
+class PreviewPath(BaseModel):
+    """預覽的路徑參數模型"""
+
+    key: str = Field(
+        ..., pattern=r"^[0-9a-f]{64}-[a-z0-9.-]{1,40}$", description="<content_sha256>-<預覽種類>"
+    )
+
+
+class PreviewQuery(BaseModel):
+    file_id: int = Field(..., description="預覽所屬的檔案 ID")
+    sig: str = Field(..., description="預覽網址的簽章")
+
+
 class FileListQuery(BaseModel):
     """檔案列表的查詢參數模型"""
 
@@ -94,6 +264,7 @@ class FileListQuery(BaseModel):
     security=[{"BearerAuth": []}],
 )
 @permission_required("file:upload")
+@admission_control(admission.UPLOAD_INIT)
 def upload_single_file():
     current_user_account = get_jwt_identity()
     with get_db_session() as db:
@@ -101,28 +272,32 @@ def upload_single_file():
             session=db, user_account=current_user_account
         )
 
-        # 嘗試解析為 UploadInitRequest
-        try:
-            init_request = UploadInitRequest(**request.json)
-            response_data = controller.init_upload(
-                filename=init_request.filename,
-                file_size=init_request.file_size,
-                file_type=init_request.file_type,
-            )
-            return UploadInitResponse(**response_data).model_dump(), 200
-        except Exception as e:
-            # 如果不是 init 請求，則嘗試解析為 complete 請求
-            pass
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(400, "Invalid upload request. Must be init or complete phase.")
 
-        # 嘗試解析為 UploadCompleteRequest
-        try:
-            complete_request = UploadCompleteRequest(**request.json)
+        # 帶有 upload_id 的為 complete 請求，其餘為 init 請求
+        # (只攔截格式錯誤，配額不足等 abort 會原樣回傳)
+        if "upload_id" in body:
+            try:
+                complete_request = UploadCompleteRequest(**body)
+            except ValidationError:
+                abort(400, "Invalid upload request. Must be init or complete phase.")
             response_data = controller.complete_upload(
                 upload_id=complete_request.upload_id
             )
             return UploadCompleteResponse(**response_data).model_dump(), 201
-        except Exception as e:
+
+        try:
+            init_request = UploadInitRequest(**body)
+        except ValidationError:
             abort(400, "Invalid upload request. Must be init or complete phase.")
+        response_data = controller.init_upload(
+            filename=init_request.filename,
+            file_size=init_request.file_size,
+            file_type=init_request.file_type,
+        )
+        return UploadInitResponse(**response_data).model_dump(), 200
 
 
 @filectrl.patch(
@@ -132,7 +307,8 @@ def upload_single_file():
     security=[{"BearerAuth": []}],
 )
 @permission_required("file:upload")
-def upload_chunk(upload_id: str):
+@admission_control(admission.UPLOAD_CHUNK)
+def upload_chunk(path: UploadIdPath):
     current_user_account = get_jwt_identity()
     with get_db_session() as db:
         controller = ChunkedUploadController(
@@ -144,17 +320,49 @@ def upload_chunk(upload_id: str):
         if not content_range:
             abort(400, "Missing Content-Range header.")
 
-        # 獲取檔案塊數據
-        chunk_data = request.get_data()
+        # 獲取檔案塊數據 (有頻寬限制時邊讀邊限速)
+        buckets = bandwidth_limiter.buckets_for(
+            UPLOAD,
+            account=current_user_account,
+            level=get_user_level(current_user_account),
+        )
+        if buckets:
+            chunk_data = read_throttled(request.stream, buckets)
+        else:
+            chunk_data = request.get_data()
         if not chunk_data:
             abort(400, "Missing chunk data.")
 
         response_data = controller.upload_chunk(
-            upload_id=upload_id, chunk_data=chunk_data, content_range=content_range
+            upload_id=path.upload_id,
+            chunk_data=chunk_data,
+            content_range=content_range,
         )
         return response_data, 200
 
 
+@filectrl.get(
+    "/tasks/<int:task_id>",
+    summary="查詢背景任務狀態",
+    responses={200: TaskStatusResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:read:own")
+def get_task_status(path: TaskIdPath):
+    """
+    查詢背景任務 (例如完成上傳回應中的 task_id) 的狀態。
+    - 只能查詢自己的任務。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = GetTaskStatus(
+            session=db,
+            user_account=current_user_account,
+            task_id=path.task_id,
+        )
+        return TaskStatusResponse(**logic.run()).model_dump()
+
+
 @filectrl.get(
     "/list",
     summary="獲取檔案列表",
@@ -179,27 +387,16 @@ def list_files(query: FileListQuery):
         )
         result = logic.run()
 
-        # 將 File ORM 物件轉換為 FileInfo Pydantic 模型
-        file_list_pydantic = [
-            FileInfo(
-                id=f.id,
-                filename=f.filename,
-                size_bytes=f.file_size,
-                upload_time=f.createTime,
-                del_time=f.expiry_time,
-                is_permanent=f.is_permanent,
-                safe_filename=f.safe_filename,
-                share_token=f.share_token,
-                download_url=f.download_url,
-            )
-            for f in result["files"]
-        ]
-
-        return FileListResponse(
-            files=file_list_pydantic,
-            stats=result["stats"],
-            limits=result["limits"],
-        ).model_dump()
+        # 查詢結果的欄位已對應 FileInfo，信任資料庫資料，略過 Pydantic 驗證直接序列化
+        # (OpenAPI 文件仍由 responses={200: FileListResponse} 產生)
+        return json_response(
+            {
+                "download_url_prefix": result["download_url_prefix"],
+                "files": result["files"],
+                "stats": result["stats"],
+                "limits": result["limits"],
+            }
+        )
 
 
 @filectrl.patch(
@@ -233,10 +430,94 @@ def update_file_status(path: FileIdPath, body: UpdateFileStatusForm):
             is_permanent=updated_file.is_permanent,
             safe_filename=updated_file.safe_filename,
             share_token=updated_file.share_token,
+            stored_size=updated_file.stored_size,
+            compression=updated_file.compression,
+            compression_cpu_ms=updated_file.compression_cpu_ms,
             download_url=None,
+            preview_url=previews.url(
+                updated_file.id,
+                updated_file.safe_filename,
+                updated_file.content_sha256,
+                updated_file.preview,
+            ),
         ).model_dump()
 
 
+@filectrl.get(
+    "/<string:safe_filename>/signature",
+    summary="取得檔案的區塊簽章 (差異上傳用)",
+    responses={200: SignatureResponse, 202: SignaturePendingResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:read:own")
+@admission_control(admission.DOWNLOAD)
+def get_file_signature(path: FileIdPath, query: SignatureQuery):
+    """
+    回傳檔案每個區塊的弱檢查碼 (Adler-32，可滾動計算) 與強雜湊，
+    用戶端據此找出新版本中與此檔案相同的區塊，再以差異上傳只送出不同的部分。
+    - 大檔案的簽章由背景任務計算: 尚未完成時回傳 202 與 task_id，
+      以 GET /files/tasks/<task_id> 查詢，完成後再次呼叫此 API。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = GetFileSignature(
+            session=db,
+            user_account=current_user_account,
+            safe_filename=path.safe_filename,
+        )
+        result = logic.run(block_size=query.block_size)
+    if "task_id" in result:
+        return json_response(result, status=202)
+    if "path" in result:
+        # 已存檔的簽章可能有數 MB，串流輸出
+        signature_path = result.pop("path")
+        return Response(
+            delta_sync.signature_store.stream_json(signature_path, result),
+            mimetype="application/json",
+        )
+    # 簽章可能有數萬個區塊，略過 Pydantic 驗證直接序列化
+    return json_response(result)
+
+
+@filectrl.post(
+    "/<string:safe_filename>/delta",
+    summary="以差異上傳建立檔案的新版本",
+    responses={201: DeltaUploadResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:upload")
+@admission_control(admission.UPLOAD_CHUNK)
+def delta_upload(path: FileIdPath, query: DeltaUploadQuery):
+    """
+    請求本文為差異指令 (格式見 util/delta_sync.py):
+    - `C` + 起始區塊 (u64) + 區塊數 (u32): 複製基礎檔案的區塊，在伺服器上以 copy_file_range 完成
+    - `L` + 長度 (u32) + 資料: 新的資料
+    - 建立新的檔案紀錄 (based_on_id 指向基礎檔案)；replace=true 時取代基礎檔案。
+    - 需要 `file:upload` 權限，並與一般上傳一樣檢查配額。
+    """
+    current_user_account = get_jwt_identity()
+    buckets = bandwidth_limiter.buckets_for(
+        UPLOAD,
+        account=current_user_account,
+        level=get_user_level(current_user_account),
+    )
+    stream = ThrottledReader(request.stream, buckets) if buckets else request.stream
+    with get_db_session() as db:
+        logic = DeltaUploadFile(
+            session=db,
+            user_account=current_user_account,
+            safe_filename=path.safe_filename,
+        )
+        result = logic.run(
+            stream,
+            file_size=query.file_size,
+            block_size=query.block_size,
+            filename=query.filename,
+            replace=query.replace,
+        )
+        return DeltaUploadResponse(**result).model_dump(), 201
+
+
 @filectrl.post(
     "/<string:safe_filename>/download-token",
     summary="為下載檔案建立一個一次性的 token",
@@ -262,12 +543,9 @@ def create_download_token(path: FileIdPath):
         # 執行 run() 來觸發權限檢查，若無權限會拋出例外
         logic.run()
 
-    # 建立一個包含特定下載聲明 (claim) 且短時間有效的 JWT
-    additional_claims = {"download_file": path.safe_filename}
-    download_token = create_access_token(
-        identity=current_user_account,
-        expires_delta=timedelta(minutes=5),
-        additional_claims=additional_claims,
+    # 建立一個只能下載此檔案 (download_file) 且短時間有效的下載專用 JWT
+    download_token = issue_download_token(
+        current_user_account, timedelta(minutes=5), safe_filename=path.safe_filename
     )
     return {"download_token": download_token}
 
@@ -278,6 +556,7 @@ def create_download_token(path: FileIdPath):
     security=[{"BearerAuth": []}],
 )
 @permission_required("file:upload")
+@admission_control(admission.DOWNLOAD)
 def download_file(path: FileIdPath):
     """
     下載指定的檔案。
@@ -292,10 +571,20 @@ def download_file(path: FileIdPath):
             safe_filename=path.safe_filename,
         )
         file_info = logic.run()
-        return send_file(
+        audit(
+            AuditAction.file_download,
+            account=current_user_account,
+            target=path.safe_filename,
+        )
+        return send_stored_file(
             file_info["storage_path"],
-            as_attachment=True,
-            download_name=file_info["filename"],
+            file_info["filename"],
+            file_id=file_info["file_id"],
+            buckets=bandwidth_limiter.buckets_for(
+                DOWNLOAD,
+                account=current_user_account,
+                level=get_user_level(current_user_account),
+            ),
         )
 
 
@@ -321,6 +610,97 @@ def delete_file(path: FileIdPath):
         return logic.run()
 
 
+@filectrl.post(
+    "/<string:safe_filename>/restore",
+    summary="復原刪除的檔案",
+    responses={200: {"description": "File restored successfully"}},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:delete:own")
+def restore_file(path: FileIdPath):
+    """
+    在復原期限 (TRASH.UNDO_SECONDS) 內復原剛刪除的檔案。
+    - 需要 `file:delete:own` 權限。
+    - 復原時會重新計入配額，超過配額時回傳 403。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = RestoreFile(
+            session=db,
+            user_account=current_user_account,
+            safe_filename=path.safe_filename,
+        )
+        return logic.run()
+
+
+@filectrl.post(
+    "/bulk/delete",
+    summary="批次刪除檔案",
+    responses={200: BulkResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:delete:own")
+def bulk_delete_files(body: BulkFilesForm):
+    """
+    在一個請求、一個交易中刪除多個檔案，回傳每個檔案的結果。
+    - 需要 `file:delete:own` 權限。
+    - 不存在或不屬於自己的檔案會個別回報，不影響其他檔案。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = BulkDeleteFiles(
+            session=db,
+            user_account=current_user_account,
+            safe_filenames=body.safe_filenames,
+        )
+        return logic.run()
+
+
+@filectrl.post(
+    "/bulk/status",
+    summary="批次更新檔案的永久狀態",
+    responses={200: BulkResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:upload")
+def bulk_update_file_status(body: BulkFileStatusForm):
+    """
+    在一個請求、一個交易中切換多個檔案的永久狀態。
+    - 切換為永久時依請求順序取得永久檔案配額，配額不足的檔案回報 quota_exceeded。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = BulkUpdateFileStatus(
+            session=db,
+            user_account=current_user_account,
+            safe_filenames=body.safe_filenames,
+            is_permanent=body.is_permanent,
+        )
+        return logic.run()
+
+
+@filectrl.post(
+    "/bulk/share",
+    summary="批次建立分享連結",
+    responses={200: BulkResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:share")
+def bulk_create_share_links(body: BulkFilesForm):
+    """
+    在一個請求中為多個檔案建立分享連結，已存在的連結直接回傳。
+    - 需要 `file:share` 權限。
+    """
+    current_user_account = get_jwt_identity()
+    with get_db_session() as db:
+        logic = BulkCreateShareLinks(
+            session=db,
+            user_account=current_user_account,
+            safe_filenames=body.safe_filenames,
+        )
+        return logic.run()
+
+
 @filectrl.post(
     "/<string:safe_filename>/share",
     summary="建立檔案的分享連結",
@@ -372,27 +752,75 @@ def remove_share_link(path: FileIdPath):
     summary="透過分享連結下載檔案",
     # 此處故意不放 security 參數，使其成為公開 API
 )
+@admission_control(admission.DOWNLOAD)
 def public_download_file(path: ShareTokenPath):
     """
     處理公開分享連結的下載請求。
     - 此 API 無須 JWT 認證。
+    - 透過 share_cache 解析 token，熱門連結與無效 token 都不會查詢資料庫。
     """
-    with get_db_session() as db:
-        from share.model.model import File
-        import os
-
-        file_record = (
-            db.query(File).filter(File.share_token == path.share_token).one_or_none()
+    shared = share_cache.lookup(path.share_token)
+    if shared is None:
+        abort(404, "File not found or link has expired.")
+
+    audit(
+        AuditAction.share_download,
+        target=shared.safe_filename,
+        detail=path.share_token,
+    )
+    try:
+        return send_stored_file(
+            shared.storage_path,
+            shared.filename,
+            file_id=shared.file_id,
+            size=shared.size,
+            mtime=shared.mtime,
+            buckets=bandwidth_limiter.buckets_for(
+                DOWNLOAD, share_key=path.share_token
+            ),
         )
+    except FileNotFoundError:
+        # 檔案已被其他行程刪除，但本行程的快取尚未過期
+        share_cache.invalidate(path.share_token)
+        abort(404, "File not found or link has expired.")
 
-        if not file_record or not os.path.exists(file_record.storage_path):
-            abort(404, "File not found or link has expired.")
 
-        return send_file(
-            file_record.storage_path,
-            as_attachment=True,
-            download_name=file_record.filename,
-        )
+@filectrl.get(
+    "/previews/<string:key>",
+    summary="取得檔案的預覽",
+    # 公開 API，由網址中的簽章驗證 (網址來自檔案列表的 preview_url)
+)
+def get_preview(path: PreviewPath, query: PreviewQuery):
+    """
+    回傳縮圖或文字檔開頭。
+    - 預覽以內容雜湊命名，內容不會改變，回應帶有長期快取的標頭。
+    - 簽章綁定檔案的 safe_filename，檔案已刪除 (或 ID 被新檔案重複使用) 時回傳 404
+      (檔案資訊有記憶體快取，刪除時失效)。
+    - 預覽已從快取中回收時重新排入產生的任務並回傳 404，稍後再試即可。
+    """
+    meta = signed_url.resolve_file(query.file_id)
+    if meta is None:
+        abort(404, "File not found.")
+    if not signed_url.verify_path(previews.signed_path(meta.safe_filename, path.key), query.sig):
+        abort(403, "Invalid preview signature.")
+    preview_path = previews.lookup(path.key)
+    if preview_path is None:
+        with get_db_session() as db:
+            previews.regenerate(db, path.key)
+        abort(404, "Preview not available yet.")
+
+    response = send_file(
+        preview_path,
+        mimetype=previews.media_type(path.key),
+        etag=path.key,
+        max_age=global_variable.config.PREVIEW.CACHE_MAX_AGE_SECONDS,
+        conditional=True,
+    )
+    # 網址本身即為授權，只允許瀏覽器快取，不讓共用的代理伺服器保存
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
 
 
 @filectrl.get(
@@ -400,6 +828,7 @@ def public_download_file(path: ShareTokenPath):
     summary="使用一次性 token 下載檔案",
     # 此端點為公開，由 token 內容進行驗證
 )
+@admission_control(admission.DOWNLOAD)
 def download_with_token():
     token = request.args.get("token")
     safe_filename = request.args.get("filename")
@@ -410,6 +839,11 @@ def download_with_token():
     try:
         # 解碼 JWT，這會自動檢查過期時間
         decoded_token = decode_token(token)
+        # 只接受下載專用的 token (一般登入 token 不應出現在網址中)
+        if not is_download_token(decoded_token):
+            abort(401, "Not a download token.")
+        if decoded_token.get("download_file", safe_filename) != safe_filename:
+            abort(403, "This download token is for another file.")
         user_account = decoded_token["sub"]
         with get_db_session() as db:
             logic = DownloadFile(
@@ -418,12 +852,98 @@ def download_with_token():
                 safe_filename=safe_filename,
             )
             file_info = logic.run()
-            return send_file(
+            audit(
+                AuditAction.file_download,
+                account=user_account,
+                target=safe_filename,
+            )
+            return send_stored_file(
                 file_info["storage_path"],
-                as_attachment=True,
-                download_name=file_info["filename"],
+                file_info["filename"],
+                file_id=file_info["file_id"],
+                buckets=bandwidth_limiter.buckets_for(
+                    DOWNLOAD,
+                    account=user_account,
+                    level=get_user_level(user_account),
+                ),
             )
 
     except PyJWTError as e:
         # 捕獲所有 JWT 相關的錯誤 (例如過期、簽名無效)
         abort(401, f"Invalid or expired token: {e}")
+
+
+@filectrl.post(
+    "/<string:safe_filename>/signed-url",
+    summary="建立免登入的簽章下載網址",
+    responses={200: SignedUrlResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("file:read:own")
+def create_signed_url(path: FileIdPath, body: SignedUrlForm):
+    """
+    為自己的檔案建立一個有時效、可限制位元組範圍的簽章下載網址。
+    - 需要 `file:read:own` 權限。
+    - 下載時只驗證 HMAC 簽章，不需 JWT 也不需查詢資料庫。
+    """
+    current_user_account = get_jwt_identity()
+    signed_config = global_variable.config.SIGNED_URL
+    expires_in = min(
+        body.expires_in or signed_config.EXPIRES_SECONDS,
+        signed_config.MAX_EXPIRES_SECONDS,
+    )
+    if body.range_end and body.range_end <= body.range_start:
+        abort(400, "range_end must be greater than range_start.")
+
+    with get_db_session() as db:
+        logic = DownloadFile(
+            session=db,
+            user_account=current_user_account,
+            safe_filename=path.safe_filename,
+        )
+        file_info = logic.run()
+
+    token = signed_url.sign(
+        file_id=file_info["file_id"],
+        owner_id=file_info["owner_id"],
+        safe_filename=file_info["safe_filename"],
+        expires_in=expires_in,
+        range_start=body.range_start,
+        range_end=body.range_end,
+    )
+    return {"url": signed_url.signed_download_url(token), "expires_in": expires_in}
+
+
+@filectrl.get(
+    "/signed/<string:token>",
+    summary="透過簽章網址下載檔案",
+    # 此端點為公開，由 HMAC 簽章進行驗證
+)
+@admission_control(admission.DOWNLOAD)
+def download_signed(path: SignedTokenPath):
+    try:
+        grant = signed_url.verify(path.token)
+    except signed_url.InvalidSignedURL as e:
+        abort(403, str(e))
+
+    meta = signed_url.resolve_file(grant.file_id)
+    if (
+        meta is None
+        or meta.owner_id != grant.owner_id
+        or signed_url.file_tag(meta.safe_filename) != grant.file_tag
+    ):
+        abort(404, "File not found or link has expired.")
+
+    audit(AuditAction.file_download, target=meta.safe_filename, detail="signed-url")
+    byte_range = None
+    if grant.range_end or grant.range_start:
+        byte_range = (grant.range_start, grant.range_end or 2**63)
+    return send_stored_file(
+        meta.storage_path,
+        meta.filename,
+        file_id=meta.file_id,
+        byte_range=byte_range,
+        buckets=bandwidth_limiter.buckets_for(
+            DOWNLOAD, share_key=f"signed:{meta.file_id}"
+        ),
+    )
@@ -0,0 +1,119 @@
+"""系統管理相關 (效能分析檔案下載、快取與系統指標)"""
+
+import os
+
+from flask import abort, send_file
+from flask_openapi3 import APIBlueprint, Tag
+from pydantic import BaseModel, Field
+
+from util.auth import permission_required
+from util.admission import admission_controller
+from util.file_cache import hot_file_cache
+from util.share_cache import share_cache
+from util.signed_url import file_meta_cache
+from util.upload_sweeper import upload_sweeper
+from util.volumes import volume_manager
+from util.at_rest_compression import at_rest_compressor
+from util.tiering import tiering
+from util.trash import trash
+from util.task_queue import task_queue
+from util.previews import previews
+from util.delta_sync import signature_store
+from util.global_variable import global_variable
+from util.profiler import route_dirname
+
+tag = Tag(name="System", description="系統管理")
+systemctrl = APIBlueprint(
+    "systemctrl", __name__, url_prefix="/system", abp_tags=[tag]
+)
+
+
+class ProfileDumpPath(BaseModel):
+    """效能分析檔路徑參數模型"""
+
+    route: str = Field(..., description="endpoint 名稱 (例如 filectrl.list_files)")
+    dump_name: str = Field(..., description="分析檔名稱")
+
+
+class ProfileListResponse(BaseModel):
+    """效能分析檔列表 (依路由分組)"""
+
+    enabled: bool
+    profiles: dict[str, list[str]]
+
+
+@systemctrl.get(
+    "/profiles",
+    summary="列出各路由的效能分析檔",
+    responses={200: ProfileListResponse},
+    security=[{"BearerAuth": []}],
+)
+@permission_required("system:profile")
+def list_profiles():
+    """
+    列出已保存的 pstats 分析檔，依路由分組，新的在前。
+    - 需要 `system:profile` 權限。
+    """
+    profiler_config = global_variable.config.PROFILER
+    profiles = {}
+    if os.path.isdir(profiler_config.OUTPUT_DIR):
+        for route in sorted(os.listdir(profiler_config.OUTPUT_DIR)):
+            route_dir = os.path.join(profiler_config.OUTPUT_DIR, route)
+            if os.path.isdir(route_dir):
+                profiles[route] = sorted(os.listdir(route_dir), reverse=True)
+    return {"enabled": profiler_config.ENABLED, "profiles": profiles}
+
+
+@systemctrl.get(
+    "/profiles/<string:route>/<string:dump_name>",
+    summary="下載效能分析檔 (pstats)",
+    security=[{"BearerAuth": []}],
+)
+@permission_required("system:profile")
+def download_profile(path: ProfileDumpPath):
+    """
+    下載單一 pstats 分析檔，可用 `python -m pstats` 或 snakeviz 開啟。
+    - 需要 `system:profile` 權限。
+    """
+    dump_name = os.path.basename(path.dump_name)
+    dump_path = os.path.join(
+        global_variable.config.PROFILER.OUTPUT_DIR,
+        route_dirname(path.route),
+        dump_name,
+    )
+    if not dump_name.endswith(".prof") or not os.path.isfile(dump_path):
+        abort(404, "Profile not found.")
+    return send_file(
+        os.path.abspath(dump_path), as_attachment=True, download_name=dump_name
+    )
+
+
+@systemctrl.get(
+    "/metrics",
+    summary="取得快取與系統指標",
+    security=[{"BearerAuth": []}],
+)
+@permission_required("system:metrics")
+def get_metrics():
+    """
+    回傳本行程的快取命中率等指標。
+    - 需要 `system:metrics` 權限。
+    """
+    return {
+        "admission": admission_controller.stats(),
+        "hot_file_cache": hot_file_cache.stats(),
+        "share_cache": share_cache.stats(),
+        "upload_sweeper": upload_sweeper.stats(),
+        "volumes": volume_manager.stats(),
+        "at_rest_compression": at_rest_compressor.stats(),
+        "tiering": tiering.stats(),
+        "trash": trash.stats(),
+        "task_queue": task_queue.stats(),
+        "previews": previews.stats(),
+        "delta_signatures": signature_store.stats(),
+        "signed_url_file_cache": {
+            "hits": file_meta_cache.hits,
+            "misses": file_meta_cache.misses,
+            "entries": len(file_meta_cache),
+        },
+    }
@@ -5,6 +5,7 @@ from flask import request
 from typing import Optional
 from util.db import get_db_session
 from util.auth import permission_required
+from util.fast_json import json_response
 from schema.request_userCtrl import (
     request_CreateUser,
     response_CreateUser,
@@ -144,9 +145,8 @@ def list_all_users():
     with get_db_session("default") as db:
         logic = ListAllUsers(session=db)
         users_rows = logic.run()
-        # 將 SQLAlchemy Row 物件列表轉換為 Pydantic 模型列表
-        user_list = [UserInfoForAdmin(**row._asdict()) for row in users_rows]
-        return UserListResponse(users=user_list).model_dump()
+        # 查詢結果已在 SQL 中整理成 UserInfoForAdmin 的格式，直接序列化
+        return json_response({"users": [row._asdict() for row in users_rows]})
 
 
 @userctrl.patch(